@@ -1,8 +1,22 @@
 import pandas as pd
 import numpy as np
-import boto3
-from io import StringIO
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from botocore.exceptions import ClientError
+from io import RawIOBase, StringIO
 import re
+import os
+import csv
+import json
+import time
+import random
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from CacheSupport import KeyedLocks, SharedFrameCache
+from CallEvaluationSupport import ParseTimeColumn
+from InstrumentationSupport import InContext, Trace
 
 BUCKET_NAME = "call-report-user-activity"
 
@@ -12,78 +26,828 @@ AWS_SECRET='MtSMLbAqC/0bO1+zoad7+AzmcKJh2rxBEiQzJosn'
 
 # Support file
 NURSE_LIST_FILE_NAME = 'NursesList.csv'
+NURSE_LIST_COLUMNS = ['Name', 'Link']
+
+# The nurse list is read again once it is older than this, with a conditional GET that only downloads a changed list
+NURSE_ROSTER_TTL_SECONDS = int(os.environ.get('NURSE_ROSTER_TTL_SECONDS', 60))
+
+# Attempts of a nurse list change that keeps losing the race with other writers
+NURSE_ROSTER_WRITE_ATTEMPTS = int(os.environ.get('NURSE_ROSTER_WRITE_ATTEMPTS', 5))
+
+# Local files kept next to the bucket: the Arrow copies, the evaluation and rollup stores and the exports
+S3_CACHE_DIR = os.environ.get('S3_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.s3_cache'))
+
+# Columnar copies of the call logs, one Arrow IPC file per object ETag
+ARROW_CACHE_DIR = os.path.join(S3_CACHE_DIR, 'arrow')
+
+# Objects of the bucket whose Arrow copy is up to date, kept by SyncCsvDataFromS3
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# Call logs are streamed this many rows at a time when only part of them is kept
+CALL_LOG_CHUNK_ROWS = int(os.environ.get('CALL_LOG_CHUNK_ROWS', 50000))
+CALL_LOG_TIME_COLUMN = 'Start Time (local)'
+
+# Parser of the csv objects: 'pyarrow' (multithreaded, streams the body) or 'pandas' (pd.read_csv)
+CSV_ENGINE = os.environ.get('CSV_ENGINE', 'pyarrow')
+
+# Bytes of csv parsed into each record batch when pyarrow streams an object
+CSV_BLOCK_BYTES = int(os.environ.get('CSV_BLOCK_BYTES', 8 * 1024 * 1024))
 
-# Clean data
+# Values read as missing, the defaults of pd.read_csv
+CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
 
-def GetAllCsvDataFromS3():
-    s3_client = boto3.client('s3', aws_access_key_id=AWS_KEY, aws_secret_access_key=AWS_SECRET)
+# A listing of the call logs is reused for this long by every session, their ETags are read from it instead of a HEAD
+CALL_LOG_LIST_TTL_SECONDS = int(os.environ.get('CALL_LOG_LIST_TTL_SECONDS', 60))
+
+# Size of the shared client's connection pool, also the default number of download threads
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 16))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+# Frames shared by every session of this server process
+FRAME_CACHE_MAX_BYTES = int(os.environ.get('FRAME_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+FRAME_CACHE_TTL_SECONDS = int(os.environ.get('FRAME_CACHE_TTL_SECONDS', 300))
+FRAME_CACHE = SharedFrameCache(max_bytes=FRAME_CACHE_MAX_BYTES, ttl_seconds=FRAME_CACHE_TTL_SECONDS)
+_frame_loads = KeyedLocks()
+
+# First and last time of each log, keyed by file name and time column, with the ETag of the version they were read from
+_time_ranges = {}
+_time_ranges_lock = threading.Lock()
+
+# Get the shared S3 client, boto3 clients are thread safe so every function and thread reuses one connection pool
+# boto3 is imported with the first client, pages that never reach S3 do not load it
+def GetS3Client():
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+
+                _s3_client = boto3.client(
+                    's3',
+                    aws_access_key_id=AWS_KEY,
+                    aws_secret_access_key=AWS_SECRET,
+                    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
+                )
+                _AddConditionalPut(_s3_client)
+    return _s3_client
+
+# Conditions of a PutObject the installed botocore does not know, sent as headers
+_PUT_CONDITION_HEADERS = {'IfMatch': 'If-Match', 'IfNoneMatch': 'If-None-Match'}
+
+# Let put_object take IfMatch/IfNoneMatch (S3 conditional writes) with a botocore older than them
+def _AddConditionalPut(s3_client):
+    members = s3_client.meta.service_model.operation_model('PutObject').input_shape.members
+    conditions = {name: header for name, header in _PUT_CONDITION_HEADERS.items() if name not in members}
+    if not conditions:
+        return
+    
+    # taken out of the parameters before they are validated, and added to the request as headers
+    def PopConditions(params, context, **kwargs):
+        for name in conditions:
+            if name in params:
+                context.setdefault('put_conditions', {})[conditions[name]] = params.pop(name)
     
-    # List all objects within the S3 bucket
-    objects = s3_client.list_objects_v2(Bucket=BUCKET_NAME)
+    def AddHeaders(params, context, **kwargs):
+        params['headers'].update(context.get('put_conditions', {}))
+    
+    s3_client.meta.events.register('before-parameter-build.s3.PutObject', PopConditions)
+    s3_client.meta.events.register('before-call.s3.PutObject', AddHeaders)
 
-    # Initialize an empty dictionary to hold data
-    data_dict = {}
+# Change the connection pool size, also the most download threads, the client is rebuilt on next use
+def SetS3MaxPoolConnections(max_pool_connections):
+    global S3_MAX_POOL_CONNECTIONS, _s3_client
+    with _s3_client_lock:
+        S3_MAX_POOL_CONNECTIONS = max(1, int(max_pool_connections))
+        _s3_client = None
 
-    # Loop through each object, if the file is a CSV, read it into a DataFrame
-    for obj in objects.get('Contents', []):
-        file_name = obj['Key']
-        try:
-            if file_name.endswith('.csv') and 'NursesList' not in file_name:  # Only process CSV files and exclude NursesName
-                response = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_name)
-                df = pd.read_csv(response['Body'])   
-                
-                # print the df
-                print(df)
-                # PRINT THE columns name
-                print(df.columns)
-                
-                # Add the DataFrame to the dictionary        
-                data_dict[file_name] = df
-                print('Added', file_name, 'to data_dict')
-        except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            print('Failed to add', file_name, 'to data_dict')
-            
-            
-    # this is to signify when they run the get data multiple times
-    def CheckDataDict(data_dict):
-        # Check if the data_dict is a valid dictionary
-        if isinstance(data_dict, dict):
-            for key, value in data_dict.items():
-                # Check if the key is a string and the value is a DataFrame
-                if isinstance(key, str) and isinstance(value, pd.DataFrame):
-                    print(f"Valid data: {key}")
-                else:
-                    print(f"Invalid data: {key}")
+# List every call log csv in the bucket, following the pages past the first 1000 keys
+# Returns the Key, ETag, LastModified and Size of each object
+def ListCsvObjects():
+    paginator = GetS3Client().get_paginator('list_objects_v2')
+    
+    csv_objects = []
+    with Trace('s3.list') as span:
+        for page in paginator.paginate(Bucket=BUCKET_NAME):
+            for obj in page.get('Contents', []):
+                # Only process CSV files and exclude NursesName
+                if obj['Key'].endswith('.csv') and 'NursesList' not in obj['Key']:
+                    csv_objects.append({
+                        'Key': obj['Key'],
+                        'ETag': obj['ETag'],
+                        'LastModified': obj['LastModified'].isoformat(),
+                        'Size': obj['Size'],
+                    })
+        span.Set(objects=len(csv_objects), bytes=sum(obj['Size'] for obj in csv_objects))
+    
+    return csv_objects
+
+_csv_listing = None
+_csv_listing_lock = threading.Lock()
+
+# List the call logs like ListCsvObjects, reusing the last listing while it is younger than max_age seconds
+# One LIST per CALL_LOG_LIST_TTL_SECONDS is shared by every session
+def GetCsvObjects(max_age=None):
+    global _csv_listing
+    if max_age is None:
+        max_age = CALL_LOG_LIST_TTL_SECONDS
+    
+    with _csv_listing_lock:
+        if _csv_listing is not None and time.monotonic() - _csv_listing['listed_at'] <= max_age:
+            return _csv_listing['objects']
+        
+        csv_objects = ListCsvObjects()
+        _csv_listing = {
+            'listed_at': time.monotonic(),
+            'objects': csv_objects,
+            'etags': {obj['Key']: obj['ETag'] for obj in csv_objects},
+        }
+        return csv_objects
+
+# ETag of an object in the last listing, None when the listing is older than CALL_LOG_LIST_TTL_SECONDS or does not have it
+def _ListedETag(file_name):
+    with _csv_listing_lock:
+        if _csv_listing is None or time.monotonic() - _csv_listing['listed_at'] > CALL_LOG_LIST_TTL_SECONDS:
+            return None
+        return _csv_listing['etags'].get(file_name)
+
+# GET an object, the body is read later by the caller
+def _GetObject(file_name, **kwargs):
+    with Trace('s3.get', key=file_name) as span:
+        response = GetS3Client().get_object(Bucket=BUCKET_NAME, Key=file_name, **kwargs)
+        span.Set(bytes=response.get('ContentLength'))
+    return response
+
+# A csv body whose header has been read ahead, read() still returns the whole csv
+# The parser can then be told only about the columns the object has
+class _CsvBody(RawIOBase):
+    def __init__(self, body, peek_bytes=64 * 1024):
+        self.body = body
+        self.pending = b''
+        while b'\n' not in self.pending:
+            block = body.read(peek_bytes)
+            if not block:
+                break
+            self.pending += block
+        header = self.pending.split(b'\n', 1)[0].decode('utf-8-sig').rstrip('\r')
+        self.columns = next(csv.reader([header]), [])
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            self.pending = self.body.read(len(buffer))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+# Arrow type of a pd.read_csv style dtype, e.g. str, 'float64' or 'int64'
+def _ArrowType(dtype):
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if dtype.kind in 'OSU':
+        return pa.string()
+    return pa.from_numpy_dtype(dtype)
+
+def _ArrowTypes(dtype):
+    return {column: _ArrowType(column_dtype) for column, column_dtype in (dtype or {}).items()}
+
+# Parse options for a csv with the given header, requested columns it does not have are left out like pd.read_csv does with a callable usecols
+def _CsvConvertOptions(header, columns=None, column_types=None):
+    options = pacsv.ConvertOptions(
+        column_types={column: column_type for column, column_type in (column_types or {}).items() if column in header},
+        null_values=CSV_NULL_VALUES,
+        strings_can_be_null=True,
+    )
+    if columns is not None:
+        options.include_columns = [column for column in columns if column in header]
+    return options
+
+def _UseColumns(columns):
+    if columns is None:
+        return None
+    return lambda column: column in columns
+
+# Parse a csv body into an Arrow table on every core, only the given columns are converted
+def _ParseCsvTable(body, key, columns=None, dtype=None):
+    with Trace('csv.parse', key=key, engine='pyarrow') as span:
+        body = _CsvBody(body)
+        table = pacsv.read_csv(
+            body,
+            read_options=pacsv.ReadOptions(use_threads=True),
+            convert_options=_CsvConvertOptions(body.columns, columns=columns, column_types=_ArrowTypes(dtype)),
+        )
+        span.Set(rows=table.num_rows, bytes=table.nbytes)
+    return table
+
+# Parse a csv body, timed as its own span
+# columns limits the columns read, dtype gives the type of some of them (e.g. str for text that looks like numbers)
+def _ParseCsv(body, key, columns=None, dtype=None):
+    if CSV_ENGINE == 'pyarrow':
+        return _ArrowToPandas(_ParseCsvTable(body, key, columns=columns, dtype=dtype))
+    
+    with Trace('csv.parse', key=key, engine='pandas') as span:
+        df = pd.read_csv(body, usecols=_UseColumns(columns), dtype=dtype)
+        span.SetFrame(df)
+    return df
+
+# Run function(file_name) for many objects at the same time
+# Returns the results and the error message of every object that failed, both keyed by file name
+def _RunForObjects(function, file_names, max_workers=None):
+    if max_workers is None:
+        max_workers = S3_MAX_POOL_CONNECTIONS
+    
+    results = {}
+    error_dict = {}
+    
+    # more threads than pooled connections would only wait on the pool
+    max_workers = max(1, min(max_workers, S3_MAX_POOL_CONNECTIONS, len(file_names) or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # the spans of the downloads belong to the caller's page run
+        futures = {executor.submit(InContext(function), file_name): file_name for file_name in file_names}
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                results[file_name] = future.result()
+            except Exception as e:
+                error_dict[file_name] = str(e)
+    
+    # keep the order of file_names
+    results = {file_name: results[file_name] for file_name in file_names if file_name in results}
+    
+    return results, error_dict
+
+# Path of the Arrow copy of one version of an object
+def _ArrowCachePath(file_name, etag):
+    etag = etag.strip('"')
+    return os.path.join(ARROW_CACHE_DIR, f"{file_name}.{etag}.arrow")
+
+# Drop the Arrow copies of the other versions of an object
+def _RemoveOldArrowCaches(file_name, path):
+    prefix = os.path.basename(file_name) + '.'
+    for old_file in os.listdir(os.path.dirname(path)):
+        old_path = os.path.join(os.path.dirname(path), old_file)
+        if old_file.startswith(prefix) and old_file.endswith('.arrow') and old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+# Convert an Arrow table to the same DataFrame pd.read_csv gives, missing text is NaN rather than None
+# The table's buffers are released column by column as they are converted, it must not be used afterwards
+def _ArrowToPandas(table):
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+# Cast the columns of a table that dtype gives a type for, copies written before that type was asked for are read the same way
+def _CastColumns(table, dtype):
+    for column, column_type in _ArrowTypes(dtype).items():
+        index = table.schema.get_field_index(column)
+        if index >= 0 and table.schema.field(index).type != column_type:
+            table = table.set_column(index, column, table.column(index).cast(column_type))
+    return table
+
+# Current ETag of an object, from a recent listing when there is one
+def _CurrentETag(file_name):
+    etag = _ListedETag(file_name)
+    if etag is not None:
+        return etag
+    
+    with Trace('s3.head', key=file_name):
+        return GetS3Client().head_object(Bucket=BUCKET_NAME, Key=file_name)['ETag']
+
+# Get a frame from FRAME_CACHE, or load it with load() -> (df, etag) and cache it
+# prepare (e.g. cleaning) is applied once before caching
+# cache=False still takes a cached frame but does not keep the one it loads, for one-off reads such as exports
+def _GetCachedFrame(cache_key, file_name, load, prepare=None, cache=True):
+    with Trace('frame_cache.get', key=file_name) as span:
+        df = FRAME_CACHE.Get(cache_key, current_etag=lambda: _CurrentETag(file_name), known_etag=_ListedETag(file_name))
+        span.Set(hit=df is not None)
+    if df is not None:
+        return df
+    
+    if not cache:
+        with Trace('frame.load', key=file_name, cached=False) as span:
+            df, _ = load()
+            if prepare is not None:
+                df = prepare(df)
+            span.SetFrame(df)
+        return df
+    
+    # one load per key, a thread missing the same key meanwhile gets the frame this one loads
+    with _frame_loads.Hold(cache_key):
+        df = FRAME_CACHE.Get(cache_key, current_etag=lambda: _CurrentETag(file_name), known_etag=_ListedETag(file_name))
+        if df is not None:
+            return df
+        
+        with Trace('frame.load', key=file_name) as span:
+            df, etag = load()
+            if prepare is not None:
+                df = prepare(df)
+            span.SetFrame(df)
+        FRAME_CACHE.Put(cache_key, df, etag=etag)
+    
+    return df.copy(deep=False)
+
+def _PrepareName(prepare):
+    return f"{prepare.__module__}.{prepare.__qualname__}" if prepare is not None else None
+
+def _DtypeKey(dtype):
+    if dtype is None:
+        return None
+    return tuple(sorted((column, str(_ArrowType(column_dtype))) for column, column_dtype in dtype.items()))
+
+# Stream a csv body with pyarrow, yields the full record batch of each block (for the Arrow copy) and its requested columns
+# If a later block does not fit the column types of the first one, the rest of the rows are read again with pandas
+# and yielded without a batch
+def _IterArrowCsvChunks(file_name, response, columns=None, dtype=None, chunksize=None):
+    rows = 0
+    try:
+        body = _CsvBody(response['Body'])
+        
+        # the types are fixed on the first block, columns nobody asked for stay text so a later block cannot break them
+        column_types = {column: pa.string() for column in body.columns if columns is not None and column not in columns}
+        column_types.update(_ArrowTypes(dtype))
+        reader = pacsv.open_csv(
+            body,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_BYTES),
+            convert_options=_CsvConvertOptions(body.columns, column_types=column_types),
+        )
+        for batch in reader:
+            table = pa.Table.from_batches([batch])
+            chunk = table.select([column for column in columns if column in table.column_names]) if columns is not None else table
+            rows += batch.num_rows
+            yield table, _ArrowToPandas(chunk)
+    except pa.ArrowInvalid as e:
+        print(f"An error occurred: {str(e)}")
+        print('Reading the rest of', file_name, 'with pandas')
+        # parse again from the start and drop the records already yielded, a quoted value can hold a newline
+        # so the records cannot be skipped as lines
+        response = _GetObject(file_name, IfMatch=response['ETag'])
+        for chunk in pd.read_csv(response['Body'], chunksize=chunksize, usecols=_UseColumns(columns), dtype=dtype):
+            if rows >= len(chunk):
+                rows -= len(chunk)
+                continue
+            yield None, chunk.iloc[rows:]
+            rows = 0
+
+# Stream a csv body with pd.read_csv, yields each chunk with every column (for the Arrow copy) and with the requested ones
+def _IterPandasCsvChunks(file_name, response, columns=None, dtype=None, chunksize=None):
+    for chunk in pd.read_csv(response['Body'], chunksize=chunksize, dtype=dtype):
+        if columns is not None:
+            yield chunk, chunk[[column for column in columns if column in chunk.columns]]
         else:
-            print("Invalid data_dict")
+            yield chunk, chunk
 
-    # Call the function to check the data_dict
-    CheckDataDict(data_dict)
+# Stream a csv object as DataFrame chunks with only the given columns
+# Reads the record batches of the Arrow copy when this version is cached, otherwise streams the csv body from S3
+def _IterCsvObjectChunks(file_name, columns=None, chunksize=None, dtype=None):
+    if chunksize is None:
+        chunksize = CALL_LOG_CHUNK_ROWS
+    
+    etag = _CurrentETag(file_name)
+    path = _ArrowCachePath(file_name, etag)
+    if os.path.exists(path):
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        if columns is not None:
+            columns = [column for column in columns if column in reader.schema.names]
+        for i in range(reader.num_record_batches):
+            batch = pa.Table.from_batches([reader.get_batch(i)])
+            if columns is not None:
+                batch = batch.select(columns)
+            yield _ArrowToPandas(_CastColumns(batch, dtype)), etag
+        return
     
+    # Stream every column so the chunks can also be written to the Arrow copy as they go by
+    response = _GetObject(file_name)
+    etag = response['ETag']
+    path = _ArrowCachePath(file_name, etag)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    writer = None
+    schema = None
+    caching = True
     
-    return data_dict
+    iter_chunks = _IterArrowCsvChunks if CSV_ENGINE == 'pyarrow' else _IterPandasCsvChunks
+    try:
+        for data, chunk in iter_chunks(file_name, response, columns=columns, dtype=dtype, chunksize=chunksize):
+            if caching and data is None:
+                # the rest of the object was read without the other columns
+                caching = False
+            if caching:
+                try:
+                    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+                    if writer is None:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        schema = table.schema
+                        writer = pa.ipc.new_file(temp_path, schema)
+                    else:
+                        table = table.cast(schema)
+                    writer.write_table(table)
+                except Exception as e:
+                    # the chunks disagree on a column type, skip the cache for this version
+                    print(f"An error occurred: {str(e)}")
+                    print('Failed to cache', file_name)
+                    caching = False
+            
+            yield chunk, etag
+        
+        if caching and writer is not None:
+            writer.close()
+            writer = None
+            os.replace(temp_path, path)
+            _RemoveOldArrowCaches(file_name, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
-# updated the list of nurses to the server
-def UpdateNurseListToServer(nurse_list_df):
+# Keep the rows of a csv object whose time_column is between start and end (inclusive), None leaves that side open
+# and with neither every row is kept. Only one chunk of the object is in memory at a time, prepare_chunk (e.g. keeping
+# a few compact columns) is applied to each one as it is read. Returns the DataFrame and the ETag of the version read
+def _ReadCsvObjectBetween(file_name, start, end, columns=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None, prepare_chunk=None):
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    
+    chunks = []
+    etag = None
+    with Trace('csv.read_between', key=file_name) as span:
+        rows = 0
+        unparsable = []
+        for chunk, etag in _IterCsvObjectChunks(file_name, columns=columns, dtype=dtype):
+            rows += len(chunk)
+            times, errors = ParseTimeColumn(chunk[time_column])
+            unparsable.extend(errors)
+            keep = pd.Series(True, index=chunk.index)
+            if start is not None:
+                keep &= times >= start
+            if end is not None:
+                keep &= times <= end
+            chunk = chunk[keep].assign(**{time_column: times[keep]})
+            chunks.append(prepare_chunk(chunk) if prepare_chunk is not None else chunk)
+        
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+        span.SetFrame(df)
+        span.Set(rows_read=rows, chunks=len(chunks), unparsable=len(unparsable))
+    
+    # these calls cannot be placed in any window
+    if unparsable:
+        print('Failed to parse', len(unparsable), 'values of', time_column, 'in', file_name + ':', unparsable[0])
+    return df, etag
+
+# Get the calls of one nurse between two times, without loading the rest of the log
+# The frame is kept in FRAME_CACHE for every session, prepare (e.g. cleaning) is applied once before caching
+# and prepare_chunk to each chunk of the log as it is read (see _ReadCsvObjectBetween)
+# cache=False reads without adding the frame to FRAME_CACHE, so a one-off read does not evict the dashboards' frames
+# The returned frame is shared, add or replace columns but do not edit values in place
+# time_column is returned as datetimes
+def GetNurseCallLogBetween(nurse_name, start, end, columns=None, prepare=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None, prepare_chunk=None, cache=True):
+    try:
+        return _GetNurseCallLogBetween(
+            nurse_name, start, end, columns=columns, prepare=prepare, time_column=time_column, dtype=dtype, prepare_chunk=prepare_chunk,
+            cache=cache,
+        )
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
+
+def _GetNurseCallLogBetween(nurse_name, start, end, columns=None, prepare=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None, prepare_chunk=None, cache=True):
+    file_name = f"{nurse_name}.csv"
+    cache_key = (
+        file_name,
+        tuple(columns) if columns is not None else None,
+        _PrepareName(prepare),
+        _DtypeKey(dtype),
+        time_column,
+        pd.Timestamp(start) if start is not None else None,
+        pd.Timestamp(end) if end is not None else None,
+        _PrepareName(prepare_chunk),
+    )
+    
+    return _GetCachedFrame(
+        cache_key,
+        file_name,
+        lambda: _ReadCsvObjectBetween(file_name, start, end, columns=columns, time_column=time_column, dtype=dtype, prepare_chunk=prepare_chunk),
+        prepare=prepare,
+        cache=cache,
+    )
+
+# Get the whole call log of one nurse, one GET instead of the whole bucket
+# Cached and shared like GetNurseCallLogBetween, calls whose time could not be parsed are kept
+def GetNurseCallLog(nurse_name, columns=None, prepare=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None):
+    return GetNurseCallLogBetween(nurse_name, None, None, columns=columns, prepare=prepare, time_column=time_column, dtype=dtype)
+
+# Get the calls of many nurses between two times at the same time, each one cached like GetNurseCallLogBetween
+# The logs are downloaded and parsed by up to max_workers threads sharing the pooled client (see SetS3MaxPoolConnections)
+# Returns the DataFrames and the error message of every nurse that failed, both keyed by nurse name
+def GetNurseCallLogsBetween(nurse_names, start, end, columns=None, prepare=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None, prepare_chunk=None, max_workers=None):
+    def Load(nurse_name):
+        return _GetNurseCallLogBetween(
+            nurse_name, start, end, columns=columns, prepare=prepare, time_column=time_column, dtype=dtype, prepare_chunk=prepare_chunk,
+        )
+    
+    return _RunForObjects(Load, nurse_names, max_workers=max_workers)
+
+# Current ETag of one nurse's call log, from the shared listing when it is recent. Returns None when it cannot be read
+def GetNurseCallLogETag(nurse_name):
     try:
-        # Initialize S3 resource
-        s3_resource = boto3.resource('s3', aws_access_key_id=AWS_KEY, aws_secret_access_key=AWS_SECRET)
-        s3_client = boto3.client('s3', aws_access_key_id=AWS_KEY, aws_secret_access_key=AWS_SECRET)
+        return _CurrentETag(f"{nurse_name}.csv")
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
+
+# Run function(nurse_name) for many nurses at the same time, e.g. to read their logs
+# Returns the results and the error message of every nurse that failed, both keyed by nurse name
+def RunForNurses(function, nurse_names, max_workers=None):
+    return _RunForObjects(function, nurse_names, max_workers=max_workers)
+
+# Get the first and last time of one nurse's log, streaming only the time column
+# The range is kept until the object changes, after that its ETag is checked. Returns (first, last) or None
+def GetNurseCallLogTimeRange(nurse_name, time_column=CALL_LOG_TIME_COLUMN):
+    file_name = f"{nurse_name}.csv"
+    try:
+        cache_key = (file_name, time_column)
+        etag = _CurrentETag(file_name)
+        with _time_ranges_lock:
+            cached = _time_ranges.get(cache_key)
+        if cached is not None and cached[0] == etag:
+            return cached[1]
         
-        # Get the existing data from the server
-        obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=NURSE_LIST_FILE_NAME)
-        existing_data = pd.read_csv(obj['Body'])
+        first = None
+        last = None
+        with Trace('csv.time_range', key=file_name) as span:
+            rows = 0
+            for chunk, etag in _IterCsvObjectChunks(file_name, columns=[time_column]):
+                rows += len(chunk)
+                times = ParseTimeColumn(chunk[time_column])[0].dropna()
+                if times.empty:
+                    continue
+                first = times.min() if first is None else min(first, times.min())
+                last = times.max() if last is None else max(last, times.max())
+            span.Set(rows=rows)
         
-        # Append new data
-        updated_data = pd.concat([existing_data, nurse_list_df], ignore_index=True)
+        time_range = (first, last) if first is not None else None
+        with _time_ranges_lock:
+            _time_ranges[cache_key] = (etag, time_range)
+        return time_range
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
+
+# Read-only dictionary of the call logs on the server, keyed by nurse name
+# Only the shared listing of the bucket is read up front, each log is loaded like GetNurseCallLog the first time it is
+# looked up. The frames are kept in FRAME_CACHE, not in the dictionary
+class NurseCallLogs(Mapping):
+    def __init__(self, columns=None, prepare=None, time_column=CALL_LOG_TIME_COLUMN, dtype=None):
+        self.columns = columns
+        self.prepare = prepare
+        self.time_column = time_column
+        self.dtype = dtype
+
+    def _NurseNames(self):
+        return [obj['Key'][:-len('.csv')] for obj in GetCsvObjects()]
+
+    def __getitem__(self, nurse_name):
+        if nurse_name not in self._NurseNames():
+            raise KeyError(nurse_name)
+        try:
+            return _GetNurseCallLogBetween(
+                nurse_name, None, None, columns=self.columns, prepare=self.prepare, time_column=self.time_column, dtype=self.dtype,
+            )
+        except ClientError as e:
+            if _ErrorCode(e) in ('NoSuchKey', '404'):
+                raise KeyError(nurse_name)
+            raise
+
+    def __iter__(self):
+        return iter(self._NurseNames())
+
+    def __len__(self):
+        return len(self._NurseNames())
+
+    def __contains__(self, nurse_name):
+        return nurse_name in self._NurseNames()
+
+_sync_lock = threading.Lock()
+
+# Read the manifest of the local copy, key -> ETag/LastModified/Size
+def _LoadManifest():
+    try:
+        with open(os.path.join(S3_CACHE_DIR, MANIFEST_FILE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Write the manifest in one step, so readers never see half of it
+def _SaveManifest(manifest):
+    os.makedirs(S3_CACHE_DIR, exist_ok=True)
+    path = os.path.join(S3_CACHE_DIR, MANIFEST_FILE_NAME)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, path)
+
+# Write the Arrow copy of the listed version of an object, returns its manifest entry
+# or None when another version was read or it could not be cached (see _IterCsvObjectChunks)
+def _SyncCsvObject(listed):
+    etag = None
+    # only the time column is converted, the Arrow copy gets every column
+    for _, etag in _IterCsvObjectChunks(listed['Key'], columns=[CALL_LOG_TIME_COLUMN]):
+        pass
+    if etag != listed['ETag'] or not os.path.exists(_ArrowCachePath(listed['Key'], etag)):
+        return None
+    return {field: listed[field] for field in ('ETag', 'LastModified', 'Size')}
+
+# Bring the local copy of the bucket (the Arrow copies every reader uses) up to date, e.g. before reading every log
+# The bucket is listed once, and only the objects whose ETag, LastModified or Size changed since the last sync
+# are downloaded, so a refresh costs O(changed) rather than O(bucket). The copies of removed objects are deleted
+# Returns the changed, removed and unchanged file names and the error of every object that failed
+def SyncCsvDataFromS3(max_workers=None):
+    with _sync_lock, Trace('s3.sync') as span:
+        manifest = _LoadManifest()
+        # also the listing every reader takes its ETags from
+        listed = {obj['Key']: obj for obj in GetCsvObjects(max_age=0)}
+        
+        changed = []
+        unchanged = []
+        for file_name, obj in listed.items():
+            entry = manifest.get(file_name)
+            if (entry is None
+                    or any(entry.get(field) != obj[field] for field in ('ETag', 'LastModified', 'Size'))
+                    or not os.path.exists(_ArrowCachePath(file_name, obj['ETag']))):
+                changed.append(file_name)
+            else:
+                unchanged.append(file_name)
+        
+        # objects deleted from the bucket are dropped from the local copy
+        removed = [file_name for file_name in manifest if file_name not in listed]
+        for file_name in removed:
+            del manifest[file_name]
+            if os.path.isdir(ARROW_CACHE_DIR):
+                _RemoveOldArrowCaches(file_name, os.path.join(ARROW_CACHE_DIR, file_name))
+        
+        synced, error_dict = _RunForObjects(lambda file_name: _SyncCsvObject(listed[file_name]), changed, max_workers=max_workers)
+        for file_name, entry in synced.items():
+            if entry is None:
+                # tried again by the next sync
+                manifest.pop(file_name, None)
+                error_dict[file_name] = 'The object changed or could not be cached'
+            else:
+                manifest[file_name] = entry
+        
+        _SaveManifest(manifest)
+        span.Set(changed=len(changed), removed=len(removed), unchanged=len(unchanged), errors=len(error_dict))
+        
+        return {
+            'changed': [file_name for file_name in changed if file_name not in error_dict],
+            'removed': removed,
+            'unchanged': unchanged,
+            'errors': error_dict,
+        }
+
+# Error code of the S3 error in e, None for other exceptions
+def _ErrorCode(e):
+    if isinstance(e, ClientError):
+        return e.response.get('Error', {}).get('Code')
+    return None
+
+# Rows of df that are not a row of other_df
+def _RowsNotIn(df, other_df):
+    present = df.merge(other_df.drop_duplicates(), how='left', indicator=True)['_merge'] == 'both'
+    return df[~present.to_numpy()]
+
+# Nurse list with the changes applied: rows of removed_names dropped, rows of added_df added or replacing the row of their name
+# Returns the same frame when nothing changes
+def _ApplyNurseListChanges(nurse_list_df, added_df=None, removed_names=()):
+    updated_df = nurse_list_df
+    
+    listed = set(updated_df['Name'])
+    removed_names = [name for name in removed_names if name in listed]
+    if removed_names:
+        updated_df = updated_df[~updated_df['Name'].isin(removed_names)]
+    
+    if added_df is not None and not added_df.empty:
+        added_df = added_df.dropna(how='all').drop_duplicates('Name', keep='last')
+        # rows already in the list as they are would only move to the end
+        added_df = _RowsNotIn(added_df, updated_df)
+        if not added_df.empty:
+            updated_df = pd.concat([updated_df[~updated_df['Name'].isin(added_df['Name'])], added_df], ignore_index=True)
+    
+    if updated_df is nurse_list_df:
+        return nurse_list_df
+    return updated_df.reset_index(drop=True)
+
+# The nurse list shared by every session of this process
+# Reads are served from memory and revalidated with a conditional GET once older than the ttl
+# Changes are applied as deltas to the latest list and written only if the list has not changed since it was read
+# (If-Match on its ETag), a write that loses the race reads the list again and retries, so concurrent changes are never lost
+class NurseRoster:
+    def __init__(self, file_name=NURSE_LIST_FILE_NAME, ttl_seconds=NURSE_ROSTER_TTL_SECONDS, write_attempts=NURSE_ROSTER_WRITE_ATTEMPTS):
+        self.file_name = file_name
+        self.ttl_seconds = ttl_seconds
+        self.write_attempts = write_attempts
+        self.df = None
+        self.etag = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+    
+    # GET the list unless it still has the ETag read last time
+    def _Refresh(self):
+        kwargs = {'IfNoneMatch': self.etag} if self.df is not None and self.etag is not None else {}
+        with Trace('s3.get', key=self.file_name) as span:
+            try:
+                response = GetS3Client().get_object(Bucket=BUCKET_NAME, Key=self.file_name, **kwargs)
+                code = None
+                span.Set(bytes=response.get('ContentLength'))
+            except ClientError as e:
+                code = _ErrorCode(e)
+                if code not in ('304', 'NotModified', 'NoSuchKey', '404'):
+                    raise
+                span.Set(status=code)
         
-        # Convert the updated DataFrame to csv
-        csv_buffer = StringIO()
-        updated_data.to_csv(csv_buffer, index=False)
+        if code in ('304', 'NotModified'):
+            self.checked_at = time.monotonic()
+            return
+        if code is not None:
+            # no list yet, the first change creates it
+            self.df = pd.DataFrame(columns=NURSE_LIST_COLUMNS)
+            self.etag = None
+            self.checked_at = time.monotonic()
+            return
         
-        # Upload the updated csv to the server
-        s3_resource.Object(BUCKET_NAME, NURSE_LIST_FILE_NAME).put(Body=csv_buffer.getvalue())
+        self.df = _ParseCsv(response['Body'], self.file_name)
+        self.etag = response['ETag']
+        self.checked_at = time.monotonic()
+    
+    # The current nurse list and its ETag (None when there is no list), refresh=True checks the server first
+    def _Current(self, refresh=False):
+        with self.lock:
+            if refresh or self.df is None or time.monotonic() - self.checked_at > self.ttl_seconds:
+                with Trace('roster.read', key=self.file_name):
+                    self._Refresh()
+            return self.df, self.etag
+    
+    # The nurse list, shallow copies so adding or replacing columns does not change the shared frame
+    def Read(self, refresh=False):
+        df, _ = self._Current(refresh=refresh)
+        return df.copy(deep=False)
+    
+    # Add or replace the rows of added_df (by name) and drop the rows of removed_names
+    # Returns the nurse list after the change
+    def Change(self, added_df=None, removed_names=()):
+        # writers of this process take turns, only other processes can make a write fail
+        with self.write_lock, Trace('roster.write', key=self.file_name) as span:
+            df, etag = self._Current()
+            for attempt in range(self.write_attempts):
+                updated_df = _ApplyNurseListChanges(df, added_df, removed_names)
+                span.Set(attempts=attempt + 1)
+                if updated_df is df:
+                    return df.copy(deep=False)
+                
+                csv_buffer = StringIO()
+                updated_df.to_csv(csv_buffer, index=False)
+                # only written if the list is still the version the change was applied to
+                condition = {'IfMatch': etag} if etag is not None else {'IfNoneMatch': '*'}
+                try:
+                    response = GetS3Client().put_object(Bucket=BUCKET_NAME, Key=self.file_name, Body=csv_buffer.getvalue(), **condition)
+                except ClientError as e:
+                    if _ErrorCode(e) not in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                        raise
+                    # another writer changed the list, apply the change to the new list
+                    time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+                    df, etag = self._Current(refresh=True)
+                    continue
+                
+                with self.lock:
+                    self.df = updated_df
+                    self.etag = response['ETag']
+                    self.checked_at = time.monotonic()
+                return updated_df.copy(deep=False)
+        
+        raise RuntimeError(f"The nurse list kept changing, gave up after {self.write_attempts} attempts")
+    
+    # Read the list from the server on next use
+    def Invalidate(self):
+        with self.lock:
+            self.df = None
+            self.etag = None
+
+
+NURSE_ROSTER = NurseRoster()
+
+# Add nurses to the list on the server, a nurse already in the list gets the new row
+def UpdateNurseListToServer(nurse_list_df):
+    try:
+        NURSE_ROSTER.Change(added_df=nurse_list_df)
         
         return 'Success'
     except Exception as e:
@@ -94,28 +858,24 @@ def UpdateNurseListToServer(nurse_list_df):
 # Get the list of nurses from the server
 def GetNurseListFromServer():
     try:
-        # get the file from the server
-        s3_client = boto3.client('s3', aws_access_key_id=AWS_KEY, aws_secret_access_key=AWS_SECRET)
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=NURSE_LIST_FILE_NAME)
-        
-        # read the csv file
-        df = pd.read_csv(response['Body'])
-        
-        return df
+        return NURSE_ROSTER.Read()
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return None
 
 # Remove the nurse from the server
-def RemoveNurseFromServer(nurse_list_df):
+# nurse_list_df is an edited copy of previous_nurse_list_df (by default the current list): nurses missing from it are removed,
+# new or edited rows are saved, and changes made by others since previous_nurse_list_df was read are kept
+def RemoveNurseFromServer(nurse_list_df, previous_nurse_list_df=None):
     try:
-        # convert the dataframe to csv
-        csv_buffer = StringIO()
-        nurse_list_df.to_csv(csv_buffer, index=False)
+        if previous_nurse_list_df is None:
+            previous_nurse_list_df = NURSE_ROSTER.Read()
         
-        # upload the csv to the server
-        s3_resource = boto3.resource('s3', aws_access_key_id=AWS_KEY, aws_secret_access_key=AWS_SECRET)
-        s3_resource.Object(BUCKET_NAME, NURSE_LIST_FILE_NAME).put(Body=csv_buffer.getvalue())
+        kept = set(nurse_list_df['Name'])
+        removed_names = [name for name in previous_nurse_list_df['Name'].unique() if name not in kept]
+        # only the rows edited here, the others may since have been edited by someone else
+        edited_df = _RowsNotIn(nurse_list_df, previous_nurse_list_df)
+        NURSE_ROSTER.Change(added_df=edited_df, removed_names=removed_names)
         
         return 'Success'
     except Exception as e:
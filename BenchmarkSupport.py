@@ -0,0 +1,311 @@
+import os
+import io
+import gc
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from CallEvaluationSupport import (
+    CALL_LOG_COLUMNS,
+    CALL_LOG_DTYPES,
+    CleanDataInput,
+    CountOutcomes,
+    EvaluateCalls,
+    NormalizePhoneNumbers,
+    OUTCOME_COLUMN,
+    PrepareCallLog,
+    RenderPerformanceText,
+    SelectDates,
+    START_TIME_COLUMN,
+    SummarizeCalls,
+)
+from EvaluationStoreSupport import EvaluationStore
+from InstrumentationSupport import perf_logger
+from PatientIndexSupport import BuildGlobalPatientIndex
+from ResultsSupport import GetResultsPage, SelectResults
+from SyntheticDataSupport import GenerateCallLog
+
+# Sizes benchmarked by default, in rows
+BENCHMARK_SIZES = [1000, 100000, 1000000]
+
+# Stages of the pipeline, in order, each one gets the output of the one before
+BENCHMARK_STAGES = ['ingest', 'clean', 'normalize', 'classify', 'aggregate', 'render']
+
+# A stage is reported as a regression when it is this much slower than the baseline
+BENCHMARK_TOLERANCE = 0.2
+
+# Sizes of the memory benchmark, in rows, and the sessions rerunning the dashboard on the same shared log
+MEMORY_BENCHMARK_SIZES = [100000, 1000000]
+MEMORY_BENCHMARK_SESSIONS = 8
+
+# Days shown by the dashboard in the memory benchmark: every day of the log, or one week in its middle
+MEMORY_BENCHMARK_RANGES = ['all', 'week']
+
+
+def _Ingest(csv_bytes):
+    return pd.read_csv(io.BytesIO(csv_bytes), usecols=CALL_LOG_COLUMNS)
+
+
+def _Aggregate(cleaned_df, evaluation):
+    return SummarizeCalls(cleaned_df, evaluation), CountOutcomes(evaluation[OUTCOME_COLUMN])
+
+
+# Run one stage, returns its output, the best time of repeat runs and the peak memory it allocated
+# The peak comes from one extra run under tracemalloc, which would slow the timed runs down
+def _RunStage(stage, repeat):
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        output = stage()
+        seconds.append(time.perf_counter() - started)
+        del output
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        output = stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return output, min(seconds), peak
+
+
+# Time every stage of the pipeline on a synthetic log of rows calls
+# Returns one result per stage: seconds, rows per second and peak memory in MB
+def BenchmarkSize(rows, repeat=3, seed=0):
+    csv_bytes = GenerateCallLog(rows, seed=seed).to_csv(index=False).encode()
+
+    results = []
+    outputs = {}
+    stages = {
+        'ingest': lambda: _Ingest(csv_bytes),
+        'clean': lambda: CleanDataInput(outputs['ingest']),
+        'normalize': lambda: NormalizePhoneNumbers(outputs['clean']),
+        'classify': lambda: EvaluateCalls(outputs['normalize']),
+        'aggregate': lambda: _Aggregate(outputs['normalize'], outputs['classify']),
+        'render': lambda: RenderPerformanceText(outputs['normalize'], outputs['classify']),
+    }
+    for stage in BENCHMARK_STAGES:
+        outputs[stage], seconds, peak = _RunStage(stages[stage], repeat)
+        results.append({
+            'rows': rows,
+            'stage': stage,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds > 0 else None,
+            'peak_mb': peak / 1e6,
+        })
+
+    return results
+
+
+def RunBenchmarks(sizes=None, repeat=3, seed=0):
+    results = []
+    for rows in sizes or BENCHMARK_SIZES:
+        print(f"Benchmarking {rows} rows...")
+        results.extend(BenchmarkSize(rows, repeat=repeat, seed=seed))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+# Compare results with a baseline run, returns the stages that got slower than the tolerance allows
+def CompareBenchmarks(report, baseline, tolerance=BENCHMARK_TOLERANCE):
+    baseline_seconds = {(result['rows'], result['stage']): result['seconds'] for result in baseline['results']}
+
+    regressions = []
+    for result in report['results']:
+        before = baseline_seconds.get((result['rows'], result['stage']))
+        if before is None or before <= 0:
+            continue
+        change = result['seconds'] / before - 1
+        result['change'] = change
+        if change > tolerance:
+            regressions.append(result)
+
+    return regressions
+
+
+# Bytes of a frame, with the text it holds
+def _FrameBytes(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+# Hash of every value of a frame, to check that a shared frame was not changed
+def _FrameHash(df):
+    return int(pd.util.hash_pandas_object(df, index=True).sum())
+
+
+# The data flow of one dashboard rerun on the shared log: the selected days, their outcomes, the order of the results
+# and the rows of the first page
+def _DashboardRerun(store, df, patient_index, from_date, to_date, page_size=50):
+    calls_df = SelectDates(df, from_date, to_date)
+    evaluation = store.Evaluate('Benchmark_Nurse', calls_df, df, patient_index)
+    positions = SelectResults(calls_df, evaluation, 'All')
+    page_df = GetResultsPage(calls_df, evaluation, positions, 1, page_size)
+    return calls_df, evaluation, positions, page_df
+
+
+# Memory of dashboard reruns on one shared log of rows calls, with the outcomes of its settled calls already stored
+# Returns one result per range of days: the size of the log and of the days selected, the peak allocated by one rerun,
+# what each of many sessions keeps after its rerun, and whether the shared log was left unchanged
+def BenchmarkMemory(rows, sessions=MEMORY_BENCHMARK_SESSIONS, seed=0):
+    csv_bytes = GenerateCallLog(rows, seed=seed).to_csv(index=False).encode()
+    df = PrepareCallLog(pd.read_csv(io.BytesIO(csv_bytes), usecols=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES))
+    del csv_bytes
+    patient_index = BuildGlobalPatientIndex({'Benchmark_Nurse': df})
+    log_hash = _FrameHash(df)
+
+    first_date = df[START_TIME_COLUMN].min().date()
+    last_date = df[START_TIME_COLUMN].max().date()
+    middle_date = first_date + (last_date - first_date) / 2
+    ranges = {
+        'all': (first_date, last_date),
+        'week': (middle_date, min(middle_date + pd.Timedelta(days=6), last_date)),
+    }
+
+    store_dir = tempfile.mkdtemp(prefix='medkick-memory-')
+    results = []
+    try:
+        store = EvaluationStore(store_dir)
+        for range_name in MEMORY_BENCHMARK_RANGES:
+            from_date, to_date = ranges[range_name]
+            # the first run classifies the calls and stores the settled ones, as a session opened earlier would have
+            _DashboardRerun(store, df, patient_index, from_date, to_date)
+            # at the log's bytes per row, the categories of a subset are the log's own
+            selected_bytes = _FrameBytes(df) * len(SelectDates(df, from_date, to_date)) / max(len(df), 1)
+
+            gc.collect()
+            tracemalloc.start()
+            try:
+                _DashboardRerun(store, df, patient_index, from_date, to_date)
+                _, rerun_peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            gc.collect()
+            tracemalloc.start()
+            try:
+                # every session keeps what its last rerun made
+                kept = [_DashboardRerun(store, df, patient_index, from_date, to_date) for _ in range(sessions)]
+                kept_bytes, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            del kept
+
+            results.append({
+                'rows': rows,
+                'days': range_name,
+                'log_mb': _FrameBytes(df) / 1e6,
+                'selected_mb': selected_bytes / 1e6,
+                'rerun_peak_mb': rerun_peak / 1e6,
+                'session_mb': kept_bytes / sessions / 1e6,
+                'log_unchanged': _FrameHash(df) == log_hash,
+            })
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    return results
+
+
+def RunMemoryBenchmarks(sizes=None, sessions=MEMORY_BENCHMARK_SESSIONS, seed=0):
+    results = []
+    for rows in sizes or MEMORY_BENCHMARK_SIZES:
+        print(f"Measuring the dashboard memory at {rows} rows...")
+        results.extend(BenchmarkMemory(rows, sessions=sessions, seed=seed))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'sessions': sessions,
+        'seed': seed,
+        'copy_on_write': bool(pd.get_option('mode.copy_on_write')),
+        'results': results,
+    }
+
+
+def PrintMemoryBenchmarks(report):
+    print(pd.DataFrame(report['results']).to_string(index=False, float_format=lambda value: f"{value:,.3f}"))
+
+
+def PrintBenchmarks(report):
+    table = pd.DataFrame(report['results'])
+    columns = ['rows', 'stage', 'seconds', 'rows_per_second', 'peak_mb'] + (['change'] if 'change' in table.columns else [])
+    print(table[columns].to_string(index=False, float_format=lambda value: f"{value:,.3f}"))
+
+
+def ParseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the call log pipeline on synthetic call logs.')
+    parser.add_argument('--sizes', type=int, nargs='+', help=f"rows per log (default: {BENCHMARK_SIZES}, {MEMORY_BENCHMARK_SIZES} with --memory)")
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best one is kept (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic logs (default: %(default)s)')
+    parser.add_argument('--memory', action='store_true', help='measure the memory of dashboard reruns on a shared log instead')
+    parser.add_argument('--sessions', type=int, default=MEMORY_BENCHMARK_SESSIONS, help='sessions of the memory benchmark (default: %(default)s)')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--baseline', help='json results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE, help='slowdown reported as a regression (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+# Command line entry point, e.g.
+# python BenchmarkSupport.py --sizes 1000 100000 --output after.json --baseline before.json
+# python BenchmarkSupport.py --memory --sizes 100000 --output memory.json
+def main(argv=None):
+    args = ParseArguments(argv)
+
+    # a log line per span would be timed along with the stages
+    perf_logger.setLevel('WARNING')
+    if args.memory:
+        report = RunMemoryBenchmarks(args.sizes, sessions=args.sessions, seed=args.seed)
+        PrintMemoryBenchmarks(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=1)
+            print('Wrote', args.output)
+        return 0 if all(result['log_unchanged'] for result in report['results']) else 1
+
+    report = RunBenchmarks(args.sizes, repeat=args.repeat, seed=args.seed)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = CompareBenchmarks(report, json.load(f), tolerance=args.tolerance)
+
+    PrintBenchmarks(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print('Wrote', args.output)
+
+    for result in regressions:
+        print(f"Regression: {result['stage']} at {result['rows']} rows is {result['change']:.0%} slower than the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
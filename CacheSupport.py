@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Copy-on-write: a frame taken from a shared one (its columns, a slice of its rows, a shallow copy) shares the data
+# until one of them is written, and writing it never changes the shared frame. Set PANDAS_COPY_ON_WRITE=0 to turn it off
+PANDAS_COPY_ON_WRITE = os.environ.get('PANDAS_COPY_ON_WRITE', '1') != '0'
+if PANDAS_COPY_ON_WRITE:
+    pd.set_option('mode.copy_on_write', True)
+
+
+# Size of a cached value in bytes
+def FrameSize(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    return 0
+
+
+# Process-wide cache of read-only DataFrames shared by every Streamlit session
+# Entries are evicted least recently used first once the byte budget is exceeded
+# Once an entry is older than the ttl it is revalidated against the object's ETag before it is served again
+class SharedFrameCache:
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    # Get a cached frame, or None
+    # current_etag is a function returning the object's current ETag, it is only called once the entry is older than the ttl
+    # known_etag is the object's ETag when the caller already has it (e.g. from a recent listing), an entry of another
+    # version is then dropped whatever its age
+    # Frames are returned as shallow copies so adding or replacing columns does not change the shared frame,
+    # with copy-on-write writing their values does not either
+    def Get(self, key, current_etag=None, known_etag=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if known_etag is not None and known_etag != entry['etag']:
+                self._Remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            expired = time.monotonic() - entry['loaded_at'] > self.ttl_seconds
+
+        if expired:
+            etag = None
+            if current_etag is not None:
+                try:
+                    etag = current_etag()
+                except Exception as e:
+                    print(f"An error occurred: {str(e)}")
+
+            with self.lock:
+                if etag is None or etag != entry['etag']:
+                    # the object changed (or could not be checked), drop the old version
+                    if self.entries.get(key) is entry:
+                        self._Remove(key)
+                        self.invalidations += 1
+                    self.misses += 1
+                    return None
+
+                entry['loaded_at'] = time.monotonic()
+                self.revalidations += 1
+
+        with self.lock:
+            self.hits += 1
+        return entry['value'].copy(deep=False)
+
+    # Add a frame to the cache, frames larger than the whole budget are not cached
+    def Put(self, key, value, etag=None):
+        size = FrameSize(value)
+
+        with self.lock:
+            if key in self.entries:
+                self._Remove(key)
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = {
+                'value': value,
+                'etag': etag,
+                'size': size,
+                'loaded_at': time.monotonic(),
+            }
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self.entries))
+                self._Remove(oldest_key)
+                self.evictions += 1
+
+    # Drop one entry, every entry whose key starts with key (for tuple keys), or everything
+    def Invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                keys = list(self.entries)
+            else:
+                keys = [
+                    cached_key for cached_key in self.entries
+                    if cached_key == key or (isinstance(cached_key, tuple) and cached_key[:1] == (key,))
+                ]
+            for cached_key in keys:
+                self._Remove(cached_key)
+                self.invalidations += 1
+
+    def Stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+    def _Remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['size']
+
+
+# One lock per key, held while the value of the key is loaded
+# Threads missing the same key at the same time (e.g. the warm-up and a page run) wait for one load instead of repeating it
+# A key's lock is dropped once no thread holds or waits on it
+class KeyedLocks:
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def Hold(self, key):
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
@@ -0,0 +1,614 @@
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from InstrumentationSupport import Trace, Traced
+
+# Column names used by the call logs
+FROM_COLUMN = 'From'
+TO_COLUMN = 'To'
+DIRECTION_COLUMN = 'Direction'
+START_TIME_COLUMN = 'Start Time (local)'
+ANSWER_TIME_COLUMN = 'Answer Time (local)'
+END_TIME_COLUMN = 'End Time (local)'
+DURATION_COLUMN = 'Duration'
+
+# Columns of the call logs the classifier needs
+CALL_LOG_COLUMNS = [
+    FROM_COLUMN,
+    TO_COLUMN,
+    DIRECTION_COLUMN,
+    START_TIME_COLUMN,
+    ANSWER_TIME_COLUMN,
+    END_TIME_COLUMN,
+    DURATION_COLUMN,
+]
+
+# Types the call log columns are read as, phone numbers and times stay text until they are cleaned
+CALL_LOG_DTYPES = {
+    FROM_COLUMN: str,
+    TO_COLUMN: str,
+    DIRECTION_COLUMN: str,
+    START_TIME_COLUMN: str,
+    ANSWER_TIME_COLUMN: str,
+    END_TIME_COLUMN: str,
+}
+
+# Phone number key columns added at ingest by NormalizePhoneNumbers
+FROM_DIGITS_COLUMN = 'From Digits'
+TO_DIGITS_COLUMN = 'To Digits'
+FROM_LAST10_COLUMN = 'From Last 10'
+TO_LAST10_COLUMN = 'To Last 10'
+PATIENT_NUMBER_COLUMN = 'Patient Number'
+NURSE_LINE_COLUMN = 'Nurse Line'
+PHONE_NUMBER_COLUMNS = [
+    FROM_DIGITS_COLUMN,
+    TO_DIGITS_COLUMN,
+    FROM_LAST10_COLUMN,
+    TO_LAST10_COLUMN,
+    PATIENT_NUMBER_COLUMN,
+    NURSE_LINE_COLUMN,
+]
+
+# Answer time written by the phone system when nobody picked up
+NO_ANSWER_TIME = '--:--:--'
+
+# Added by CleanDataInput, True where the answer time was NO_ANSWER_TIME
+NOT_ANSWERED_COLUMN = 'Not Answered'
+
+# strftime format of the time columns, the one the phone system exports
+# Values in any other format are parsed one distinct value at a time, the ones that still fail are counted and reported
+CALL_LOG_TIME_FORMAT = os.environ.get('CALL_LOG_TIME_FORMAT', '%m/%d/%Y %I:%M:%S %p')
+
+# Added by CleanDataInput when an answer or end time could not be parsed, the error text of each such row
+TIME_ERROR_COLUMN = 'Time Error'
+
+# Callback windows
+CALLBACK_GRACE = pd.Timedelta(seconds=10)
+CALLBACK_WINDOW_1HR = pd.Timedelta(hours=1)
+CALLBACK_WINDOW_10HR = pd.Timedelta(hours=10)
+
+# Performance text shown on the dashboard
+NURSE_CALLED_BACK_1HR = 'Met criteria. Did not answer. Nurse called back in 1hr. '
+PATIENT_CALLED_BACK_1HR = 'Met criteria. Did not answer. Patient called back in 1hr.'
+NURSE_CALLED_BACK_10HR = 'Did not Met criteria. Did not answer. Nurse called back in 10hr>&>1hr. '
+PATIENT_CALLED_BACK_10HR = 'Did not Met criteria. Did not answer. Patient called back in 10hr>&>1hr.'
+NO_CALL_BACK = 'Did not answer. Nurse did not call back in 10hr.'
+OUTBOUND_CALL = 'Outbound call'
+OTHER_CALL = 'Not an inbound or outbound call'
+
+# Outcome codes returned by EvaluateCalls
+ANSWERED = 'ANSWERED'                               # answered for at least 30 seconds
+ANSWERED_SHORT = 'ANSWERED_SHORT'                   # answered for less than 30 seconds
+MISSED_TALKED_30S = 'MISSED_TALKED_30S'             # no answer time but the call lasted at least 30 seconds
+NURSE_CALL_BACK_1HR = 'NURSE_CALL_BACK_1HR'
+PATIENT_CALL_BACK_1HR = 'PATIENT_CALL_BACK_1HR'
+NURSE_CALL_BACK_10HR = 'NURSE_CALL_BACK_10HR'
+PATIENT_CALL_BACK_10HR = 'PATIENT_CALL_BACK_10HR'
+NO_CALL_BACK_10HR = 'NO_CALL_BACK_10HR'
+OUTBOUND = 'OUTBOUND'
+OTHER = 'OTHER'
+ERROR = 'ERROR'
+OUTCOMES = [
+    ANSWERED,
+    ANSWERED_SHORT,
+    MISSED_TALKED_30S,
+    NURSE_CALL_BACK_1HR,
+    PATIENT_CALL_BACK_1HR,
+    NURSE_CALL_BACK_10HR,
+    PATIENT_CALL_BACK_10HR,
+    NO_CALL_BACK_10HR,
+    OUTBOUND,
+    OTHER,
+    ERROR,
+]
+OUTCOME_DTYPE = pd.CategoricalDtype(OUTCOMES)
+
+# Columns returned by EvaluateCalls
+OUTCOME_COLUMN = 'Outcome'
+CALL_BACK_TIME_COLUMN = 'Call Back Time'
+CALL_BACK_BY_COLUMN = 'Call Back By'
+CALL_BACK_DELAY_COLUMN = 'Call Back Delay'
+CALL_BACK_NURSE_COLUMN = 'Call Back Nurse'
+ERROR_COLUMN = 'Error'
+
+# Outcome text that does not depend on the call
+OUTCOME_TEXT = {
+    NURSE_CALL_BACK_1HR: NURSE_CALLED_BACK_1HR,
+    PATIENT_CALL_BACK_1HR: PATIENT_CALLED_BACK_1HR,
+    NURSE_CALL_BACK_10HR: NURSE_CALLED_BACK_10HR,
+    PATIENT_CALL_BACK_10HR: PATIENT_CALLED_BACK_10HR,
+    NO_CALL_BACK_10HR: NO_CALL_BACK,
+    OUTBOUND: OUTBOUND_CALL,
+    OTHER: OTHER_CALL,
+}
+
+# Outcomes behind each dashboard counter
+# These are the outcomes whose text starts with the prefixes the dashboard used to match, overlaps included
+# (e.g. 'Did not' also matched short answered calls, 'Nurse called back' also matched MISSED_TALKED_30S)
+OUTCOME_COUNTERS = {
+    'met_criteria': [ANSWERED, MISSED_TALKED_30S, NURSE_CALL_BACK_1HR, PATIENT_CALL_BACK_1HR],
+    'answered': [ANSWERED],
+    'missed': [MISSED_TALKED_30S, NURSE_CALL_BACK_1HR, PATIENT_CALL_BACK_1HR, ANSWERED_SHORT, NURSE_CALL_BACK_10HR, PATIENT_CALL_BACK_10HR, NO_CALL_BACK_10HR],
+    'nurse_call_back_1hr': [MISSED_TALKED_30S, NURSE_CALL_BACK_1HR],
+    'patient_call_back_1hr': [PATIENT_CALL_BACK_1HR],
+    'did_not_meet_criteria': [ANSWERED_SHORT, NURSE_CALL_BACK_10HR, PATIENT_CALL_BACK_10HR, NO_CALL_BACK_10HR],
+    'nurse_call_back_10hr': [NURSE_CALL_BACK_10HR],
+    'patient_call_back_10hr': [PATIENT_CALL_BACK_10HR],
+}
+
+# Outcomes shown for each performance criteria of the dashboard, None shows every call
+PERFORMANCE_CRITERIA = {
+    'All': None,
+    'Answered': [ANSWERED],
+    'Missed': OUTCOME_COUNTERS['missed'],
+    'No Follow-up': OUTCOME_COUNTERS['did_not_meet_criteria'],
+    'Follow-up >1hr and <10hr': [NURSE_CALL_BACK_10HR, PATIENT_CALL_BACK_10HR],
+    'Follow-up <1hr': OUTCOME_COUNTERS['met_criteria'],
+}
+
+
+# Parse a time column in one vectorized pass with CALL_LOG_TIME_FORMAT, NO_ANSWER_TIME becomes NaT
+# Values in another format go the slow way, returns the times and the error text of the values that could not be parsed
+def ParseTimeColumn(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, values.iloc[0:0].astype(object)
+
+    values = values.where(values != NO_ANSWER_TIME)
+    times = pd.to_datetime(values, format=CALL_LOG_TIME_FORMAT, errors='coerce')
+    other_format = times.isna() & values.notna()
+    if not other_format.any():
+        return times, values.iloc[0:0].astype(object)
+
+    other_times, errors = _ParseTimes(values[other_format])
+    times.loc[other_format] = pd.to_datetime(other_times)
+    return times, errors[errors.notna()]
+
+
+# Schema stage run once per call log: typed time columns, categorical text and a small integer Duration
+# The 'clean' span records the memory of the frame before and after, deep when the performance panel or
+# PERF_DEEP_MEMORY asks for it since text columns are most of what it saves, and the times of each column that
+# could not be parsed
+def CleanDataInput(df):
+    with Trace('clean') as span:
+        span.SetFrame(df, prefix='input_', deep=True)
+        cleaned_df, time_errors = _CleanDataInput(df)
+        span.SetFrame(cleaned_df, deep=True)
+        for column, errors in time_errors.items():
+            if not errors.empty:
+                span.Set(**{f'unparsable {column}': len(errors)})
+                print('Failed to parse', len(errors), 'values of', column + ':', errors.iloc[0])
+    return cleaned_df
+
+
+def _CleanDataInput(df):
+
+    columns = {}
+    time_errors = {}
+    if ANSWER_TIME_COLUMN in df.columns:
+        answer_times = df[ANSWER_TIME_COLUMN]
+        if not pd.api.types.is_datetime64_any_dtype(answer_times):
+            columns[NOT_ANSWERED_COLUMN] = (answer_times == NO_ANSWER_TIME).to_numpy()
+            answer_times, time_errors[ANSWER_TIME_COLUMN] = ParseTimeColumn(answer_times)
+            if isinstance(answer_times.dtype, pd.DatetimeTZDtype):
+                answer_times = answer_times.dt.tz_localize(None)
+        columns[ANSWER_TIME_COLUMN] = answer_times
+
+    for column in (START_TIME_COLUMN, END_TIME_COLUMN):
+        if column in df.columns:
+            columns[column], time_errors[column] = ParseTimeColumn(df[column])
+
+    # the classifier reports these rows instead of a result, as it did when it parsed the text itself
+    row_errors = [time_errors[column] for column in (ANSWER_TIME_COLUMN, END_TIME_COLUMN) if column in time_errors]
+    row_errors = pd.concat(row_errors) if row_errors else None
+    if row_errors is not None and not row_errors.empty:
+        row_errors = row_errors[~row_errors.index.duplicated()]
+        columns[TIME_ERROR_COLUMN] = row_errors.reindex(df.index).astype('category')
+
+    # a handful of distinct values each, stored as small integer codes
+    for column in (DIRECTION_COLUMN, FROM_COLUMN, TO_COLUMN):
+        if column in df.columns:
+            columns[column] = df[column].astype('category')
+
+    if DURATION_COLUMN in df.columns:
+        duration = pd.to_numeric(df[DURATION_COLUMN], errors='coerce')
+        if duration.notna().all():
+            duration = pd.to_numeric(duration, downcast='integer')
+        columns[DURATION_COLUMN] = duration
+
+    return df.assign(**columns), time_errors
+
+
+# Keep only the digits of a phone number, non-string values (NaN, numbers) become NaN
+# Returns the digits and the last 10 digits
+def DigitsOnly(series):
+    # the same few numbers repeat across the log, so only clean each distinct value once
+    codes, uniques = pd.factorize(series)
+    digits = pd.Series([re.sub(r'\D', '', value) if isinstance(value, str) else np.nan for value in uniques], dtype=object)
+    last10 = pd.Series([value[-10:] if isinstance(value, str) else np.nan for value in digits], dtype=object)
+
+    def Take(values):
+        values = values.to_numpy()
+        return pd.Series(np.where(codes >= 0, values[codes], np.nan), index=series.index, dtype=object)
+
+    return Take(digits), Take(last10)
+
+
+# Ingest stage: clean the From/To numbers once into key columns
+# Patient Number and Nurse Line are the last 10 digits of the patient's and the nurse's side of the call
+@Traced('normalize')
+def NormalizePhoneNumbers(df):
+    numbers = pd.concat([df[FROM_COLUMN], df[TO_COLUMN]], ignore_index=True).astype(object)
+    digits, last10 = DigitsOnly(numbers)
+
+    rows = len(df)
+    from_digits = pd.Series(digits.to_numpy()[:rows], index=df.index, dtype=object)
+    to_digits = pd.Series(digits.to_numpy()[rows:], index=df.index, dtype=object)
+    from_last10 = pd.Series(last10.to_numpy()[:rows], index=df.index, dtype=object)
+    to_last10 = pd.Series(last10.to_numpy()[rows:], index=df.index, dtype=object)
+
+    inbound = df[DIRECTION_COLUMN] == 'INBOUND'
+    outbound = df[DIRECTION_COLUMN] == 'OUTBOUND'
+
+    return df.assign(**{
+        FROM_DIGITS_COLUMN: from_digits,
+        TO_DIGITS_COLUMN: to_digits,
+        FROM_LAST10_COLUMN: from_last10,
+        TO_LAST10_COLUMN: to_last10,
+        PATIENT_NUMBER_COLUMN: from_last10.where(inbound, to_last10.where(outbound)),
+        NURSE_LINE_COLUMN: to_last10.where(inbound, from_last10.where(outbound)),
+    }).astype({column: 'category' for column in PHONE_NUMBER_COLUMNS})
+
+
+# Get the phone number key columns, cleaning the numbers if the frame did not go through ingest
+def _CallKeys(df):
+    if FROM_DIGITS_COLUMN not in df.columns:
+        df = NormalizePhoneNumbers(df)
+
+    keys = pd.DataFrame({
+        'from_digits': df[FROM_DIGITS_COLUMN].astype(object),
+        'to_digits': df[TO_DIGITS_COLUMN].astype(object),
+        'from_last10': df[FROM_LAST10_COLUMN].astype(object),
+        'to_last10': df[TO_LAST10_COLUMN].astype(object),
+    }, index=df.index)
+    keys['valid'] = keys['from_digits'].notna() & keys['to_digits'].notna()
+
+    return keys
+
+
+# Find, for every missed call, the first candidate call with the same key inside [start + low, start + high]
+def _FirstCallInWindow(missed, candidates, query_key, low, high):
+    if missed.empty or candidates.empty:
+        return pd.Series(pd.NaT, index=missed.index, dtype=missed['start'].dtype)
+
+    left = pd.DataFrame({
+        'key': query_key,
+        'window_start': missed['start'] + low,
+        'window_end': missed['start'] + high,
+    }, index=missed.index)
+    left['row'] = np.arange(len(left))
+    left = left.sort_values('window_start', kind='mergesort')
+
+    right = candidates[['key', 'start']].rename(columns={'start': 'call_back_time'})
+    right = right.sort_values('call_back_time', kind='mergesort')
+    right['window_start'] = right['call_back_time']
+
+    # first candidate at or after the window start, on the same key
+    matched = pd.merge_asof(left, right, on='window_start', by='key', direction='forward')
+
+    in_window = matched['call_back_time'] <= matched['window_end']
+    call_back_time = matched['call_back_time'].where(in_window)
+    call_back_time.index = matched['row'].to_numpy()
+
+    result = call_back_time.sort_index()
+    result.index = missed.index
+    return result
+
+
+# Parse a time the same way the row-wise evaluation did, returns (time, error text)
+def _ParseTime(value):
+    try:
+        return pd.to_datetime(value).tz_localize(None), None
+    except Exception as e:
+        return None, f"Error: {e}"
+
+
+# Parse a column of time strings, returns the parsed times and the error text per row
+# Only the distinct values are parsed, and only the ones the vectorized parse rejects go the slow way
+def _ParseTimes(values):
+    unique = pd.Series(values.dropna().unique(), dtype=object)
+    try:
+        with warnings.catch_warnings():
+            # values that do not fit the inferred format fall back to _ParseTime below
+            warnings.simplefilter('ignore', UserWarning)
+            parsed = pd.to_datetime(unique, errors='coerce').astype(object)
+    except Exception:
+        parsed = pd.Series(None, index=unique.index, dtype=object)
+
+    times = {}
+    errors = {}
+    for value, time in zip(unique, parsed):
+        if isinstance(time, pd.Timestamp):
+            times[value] = time.tz_localize(None)
+        else:
+            times[value], errors[value] = _ParseTime(value)
+
+    return values.map(times), values.map(errors)
+
+
+# Evaluate every call in calls_df, looking for call backs in search_df (defaults to calls_df)
+# and, when a patient_index (see PatientIndexSupport) is given, in every nurse's calls with the patient
+# Returns a frame aligned with calls_df: the outcome code, and for missed calls that got a call back
+# its time, who made it (Nurse or Patient), how long after the missed call it came
+# and the nurse whose log has it when it was found in the patient index
+@Traced('classify')
+def EvaluateCalls(calls_df, search_df=None, patient_index=None):
+    if search_df is None:
+        search_df = calls_df
+
+    start_times = calls_df[START_TIME_COLUMN]
+    if not pd.api.types.is_datetime64_any_dtype(start_times):
+        start_times = pd.Series(pd.NaT, index=calls_df.index, dtype='datetime64[ns]')
+
+    outcome = pd.Series(OTHER, index=calls_df.index, dtype=object)
+    call_back_time = pd.Series(pd.NaT, index=calls_df.index, dtype=start_times.dtype)
+    call_back_by = pd.Series(None, index=calls_df.index, dtype=object)
+    call_back_nurse = pd.Series(None, index=calls_df.index, dtype=object)
+    error = pd.Series(None, index=calls_df.index, dtype=object)
+
+    if not calls_df.empty:
+        direction = calls_df[DIRECTION_COLUMN]
+        inbound = direction == 'INBOUND'
+        outbound = direction == 'OUTBOUND'
+
+        outcome.loc[outbound] = OUTBOUND
+
+        # Rows whose numbers are not text could not be evaluated
+        keys = _CallKeys(calls_df)
+        invalid = (inbound | outbound) & ~keys['valid']
+        for index, from_value, to_value in zip(calls_df.index[invalid], calls_df.loc[invalid, FROM_COLUMN], calls_df.loc[invalid, TO_COLUMN]):
+            try:
+                re.sub(r'\D', '', from_value)
+                re.sub(r'\D', '', to_value)
+            except Exception as e:
+                outcome.at[index] = ERROR
+                error.at[index] = f"Error: {e}"
+
+        inbound = inbound & keys['valid']
+        duration = calls_df[DURATION_COLUMN]
+        answer_column = calls_df[ANSWER_TIME_COLUMN]
+        if pd.api.types.is_datetime64_any_dtype(answer_column):
+            # CleanDataInput already parsed the times and kept the no-answer sentinel as a flag
+            missed = inbound & calls_df[NOT_ANSWERED_COLUMN].astype(bool)
+        else:
+            missed = inbound & (answer_column == NO_ANSWER_TIME)
+        answered = inbound & ~missed
+
+        # Answered inbound calls
+        outcome.loc[answered & (duration >= 30)] = ANSWERED
+        outcome.loc[answered & ~(duration >= 30)] = ANSWERED_SHORT
+
+        # Unparsable answer or end times are reported instead of the result
+        time_errors = None
+        if not pd.api.types.is_datetime64_any_dtype(answer_column):
+            answered_df = calls_df[answered]
+            _, answer_errors = _ParseTimes(answered_df[ANSWER_TIME_COLUMN])
+            _, end_errors = _ParseTimes(answered_df[END_TIME_COLUMN])
+            time_errors = answer_errors.fillna(end_errors)
+        elif TIME_ERROR_COLUMN in calls_df.columns:
+            # CleanDataInput kept the error of every time it could not parse
+            time_errors = calls_df.loc[answered, TIME_ERROR_COLUMN]
+        if time_errors is not None:
+            time_errors = time_errors[time_errors.notna()]
+            outcome.loc[time_errors.index] = ERROR
+            error.loc[time_errors.index] = time_errors
+
+        # Missed inbound calls that lasted at least 30 seconds anyway
+        missed_long = missed & (duration >= 30)
+        outcome.loc[missed_long] = MISSED_TALKED_30S
+
+        # Missed inbound calls, look for the call backs
+        missed = missed & ~missed_long
+        outcome.loc[missed] = NO_CALL_BACK_10HR
+        if missed.any():
+            missed_frame = pd.DataFrame({'start': calls_df.loc[missed, START_TIME_COLUMN]})
+            missed_frame = missed_frame[missed_frame['start'].notna()]
+            missed_keys = keys.loc[missed_frame.index]
+            from_10 = missed_keys['from_last10']
+            to_number = missed_keys['to_digits']
+
+            # the nurse calls the patient back from the line the patient called
+            nurse_key = from_10 + '|' + to_number
+            # the patient calls the same line again
+            patient_key = to_number + '|' + from_10
+
+            search_keys = keys if search_df is calls_df else _CallKeys(search_df)
+            candidates = pd.DataFrame({
+                'key': search_keys['to_last10'] + '|' + search_keys['from_digits'],
+                'start': search_df[START_TIME_COLUMN],
+                'direction': search_df[DIRECTION_COLUMN],
+                'duration': search_df[DURATION_COLUMN],
+            }, index=search_df.index)
+            candidates = candidates[search_keys['valid'] & candidates['start'].notna()]
+
+            nurse_calls = candidates[candidates['direction'] == 'OUTBOUND']
+            patient_calls = candidates[candidates['direction'] == 'INBOUND']
+
+            # checked in this order, the first call back found decides the outcome
+            # (outcome, party, calls of the own log, key, window, outbound calls and minimum duration in the patient index)
+            windows = [
+                (NURSE_CALL_BACK_1HR, 'Nurse', nurse_calls[nurse_calls['duration'] >= 1], nurse_key, -CALLBACK_GRACE, CALLBACK_WINDOW_1HR, True, 1),
+                (PATIENT_CALL_BACK_1HR, 'Patient', patient_calls[patient_calls['duration'] >= 30], patient_key, -CALLBACK_GRACE, CALLBACK_WINDOW_1HR, False, 30),
+                (NURSE_CALL_BACK_10HR, 'Nurse', nurse_calls, nurse_key, CALLBACK_WINDOW_1HR, CALLBACK_WINDOW_10HR, True, 0),
+                (PATIENT_CALL_BACK_10HR, 'Patient', patient_calls, patient_key, CALLBACK_WINDOW_1HR, CALLBACK_WINDOW_10HR, False, 0),
+            ]
+            undecided = pd.Series(True, index=missed_frame.index)
+            for window_outcome, party, window_calls, query_key, low, high, outbound, min_duration in windows:
+                first_call = _FirstCallInWindow(missed_frame, window_calls, query_key, low, high)
+                first_nurse = pd.Series(None, index=missed_frame.index, dtype=object)
+
+                if patient_index is not None and undecided.any():
+                    # a colleague called the patient back, or the patient reached another nurse
+                    # the earlier of the two calls wins, the own log on a tie
+                    index_call, index_nurse = patient_index.FirstCallInWindow(
+                        from_10.to_numpy(),
+                        (missed_frame['start'] + low).to_numpy(),
+                        (missed_frame['start'] + high).to_numpy(),
+                        outbound,
+                        min_duration,
+                    )
+                    index_call = pd.Series(index_call, index=missed_frame.index)
+                    earlier = index_call.notna() & (first_call.isna() | (index_call < first_call))
+                    first_call = first_call.where(~earlier, index_call)
+                    first_nurse[earlier] = index_nurse[earlier.to_numpy()]
+
+                found = undecided & first_call.notna()
+                outcome.loc[found.index[found]] = window_outcome
+                call_back_time.loc[found.index[found]] = first_call[found]
+                call_back_by.loc[found.index[found]] = party
+                call_back_nurse.loc[found.index[found]] = first_nurse[found]
+                undecided &= ~found
+
+    evaluation = pd.DataFrame({
+        OUTCOME_COLUMN: outcome.astype(OUTCOME_DTYPE),
+        CALL_BACK_TIME_COLUMN: call_back_time,
+        CALL_BACK_BY_COLUMN: call_back_by.astype(pd.CategoricalDtype(['Nurse', 'Patient'])),
+        CALL_BACK_DELAY_COLUMN: call_back_time - start_times,
+        CALL_BACK_NURSE_COLUMN: call_back_nurse,
+        ERROR_COLUMN: error,
+    }, index=calls_df.index)
+
+    return evaluation
+
+
+# Count the outcomes behind each dashboard counter with one value_counts
+@Traced('aggregate.counts')
+def CountOutcomes(outcome):
+    return CountersFromOutcomeCounts(outcome.value_counts())
+
+
+# Dashboard counters from the number of calls of each outcome code
+def CountersFromOutcomeCounts(outcome_counts):
+    return {
+        counter: int(outcome_counts.reindex(outcomes, fill_value=0).sum())
+        for counter, outcomes in OUTCOME_COUNTERS.items()
+    }
+
+
+# Headline numbers of the dashboard for evaluated calls
+@Traced('aggregate')
+def SummarizeCalls(calls_df, evaluation):
+    return SummarizeCounts(evaluation[OUTCOME_COLUMN].value_counts(), calls_df[DIRECTION_COLUMN].value_counts())
+
+
+# Headline numbers of the dashboard from the number of calls of each outcome code and each direction
+def SummarizeCounts(outcome_counts, direction_counts):
+    outcome_counts = CountersFromOutcomeCounts(outcome_counts)
+
+    # Calculate the percentage of Good and Bad criteria, avoiding division by zero
+    total_criteria_count = outcome_counts['met_criteria'] + outcome_counts['did_not_meet_criteria']
+    if total_criteria_count > 0:
+        good_percentage = (outcome_counts['met_criteria'] / total_criteria_count) * 100
+        bad_percentage = (outcome_counts['did_not_meet_criteria'] / total_criteria_count) * 100
+    else:
+        good_percentage = 0
+        bad_percentage = 0
+
+    return {
+        'Good %': good_percentage,
+        'Bad %': bad_percentage,
+        'Inbound Calls': int(direction_counts.get('INBOUND', 0)),
+        'Outbound Calls': int(direction_counts.get('OUTBOUND', 0)),
+        'Answered': outcome_counts['answered'],
+        'Missed': outcome_counts['missed'],
+        'No Follow-up': outcome_counts['did_not_meet_criteria'],
+        'Follow-up >1hr and <10hr': outcome_counts['nurse_call_back_10hr'] + outcome_counts['patient_call_back_10hr'],
+        'Follow-up <1hr': outcome_counts['nurse_call_back_1hr'] + outcome_counts['patient_call_back_1hr'],
+    }
+
+
+# Start and end time of the calls to load for a date range
+# The calls a missed call can be matched with are included: 10 seconds before the first day and 10 hours after the last one
+def CallLogWindow(from_date, to_date):
+    start = pd.Timestamp(from_date) - CALLBACK_GRACE
+    end = pd.Timestamp(to_date) + pd.Timedelta(days=1) + CALLBACK_WINDOW_10HR
+    return start, end
+
+
+# Keep the rows of a mask, when they are one run of rows (e.g. days of a log sorted by time) as a slice that shares
+# the frame's data instead of a copy of them
+def SelectRows(df, selected):
+    positions = np.flatnonzero(selected)
+    if len(positions) == 0 or positions[-1] - positions[0] + 1 == len(positions):
+        first = positions[0] if len(positions) else 0
+        return df.iloc[first:first + len(positions)]
+    return df[selected]
+
+
+# Keep the calls that started between two dates (inclusive)
+def SelectDates(df, from_date, to_date):
+    start_times = df[START_TIME_COLUMN]
+    selected = (start_times >= pd.Timestamp(from_date)) & (start_times < pd.Timestamp(to_date) + pd.Timedelta(days=1))
+    return SelectRows(df, selected.to_numpy())
+
+
+# Keep the calls that started between two times (inclusive)
+def SelectTimes(df, start, end):
+    return SelectRows(df, df[START_TIME_COLUMN].between(start, end).to_numpy())
+
+
+# Ingest stages run once per call log: schema, then phone number keys
+def PrepareCallLog(df):
+    return NormalizePhoneNumbers(CleanDataInput(df))
+
+
+# Mask of the calls shown for one performance criteria of the dashboard
+def SelectOutcomes(outcome, performance_criteria):
+    outcomes = PERFORMANCE_CRITERIA[performance_criteria]
+    if outcomes is None:
+        return pd.Series(True, index=outcome.index)
+
+    # compare the category codes instead of the text
+    codes = [OUTCOME_DTYPE.categories.get_loc(code) for code in outcomes]
+    return pd.Series(np.isin(outcome.cat.codes.to_numpy(), codes), index=outcome.index)
+
+
+# Write the performance text for evaluated calls, only call this for the rows that are shown
+@Traced('render.text')
+def RenderPerformanceText(calls_df, evaluation):
+    outcome = evaluation[OUTCOME_COLUMN]
+    performance = outcome.astype(object).map(OUTCOME_TEXT)
+
+    answered = outcome == ANSWERED
+    performance.loc[answered] = [
+        f'Met criteria. Answered for {value} seconds.'
+        for value in calls_df.loc[answered, DURATION_COLUMN]
+    ]
+
+    short = outcome == ANSWERED_SHORT
+    answer_times = calls_df.loc[short, ANSWER_TIME_COLUMN]
+    if not pd.api.types.is_datetime64_any_dtype(answer_times):
+        answer_times, _ = _ParseTimes(answer_times)
+    performance.loc[short] = [
+        f"Did not meet criteria. Received call at {answer_time} from {from_value}."
+        for answer_time, from_value in zip(answer_times, calls_df.loc[short, FROM_COLUMN])
+    ]
+
+    talked = outcome == MISSED_TALKED_30S
+    talked_df = calls_df[talked]
+    performance.loc[talked] = [
+        f'Met criteria. Did not answer. Nurse called back at {start} to {from_number}. Answered for {value} seconds.'
+        for start, from_number, value in zip(
+            talked_df[START_TIME_COLUMN],
+            _CallKeys(talked_df)['from_digits'],
+            talked_df[DURATION_COLUMN],
+        )
+    ]
+
+    failed = outcome == ERROR
+    performance.loc[failed] = evaluation.loc[failed, ERROR_COLUMN]
+
+    return performance
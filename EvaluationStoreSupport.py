@@ -0,0 +1,286 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import AWSSupport as aws_support
+from CacheSupport import FrameSize
+from InstrumentationSupport import Trace
+from CallEvaluationSupport import (
+    CALL_BACK_BY_COLUMN,
+    CALL_BACK_NURSE_COLUMN,
+    CALL_LOG_COLUMNS,
+    CALLBACK_GRACE,
+    CALLBACK_WINDOW_10HR,
+    DURATION_COLUMN,
+    ERROR_COLUMN,
+    EvaluateCalls,
+    NOT_ANSWERED_COLUMN,
+    OUTCOME_COLUMN,
+    OUTCOME_DTYPE,
+    SelectTimes,
+    START_TIME_COLUMN,
+)
+from PatientIndexSupport import CROSS_NURSE_CALL_BACKS
+
+# Bump when EvaluateCalls changes what it returns, outcomes stored by an older version are then ignored
+EVALUATION_STORE_VERSION = 3
+
+# Outcomes found by searching only the nurse's own log are kept apart from the ones searched in every log
+EVALUATION_STORE_NAME = f"v{EVALUATION_STORE_VERSION}" if CROSS_NURSE_CALL_BACKS else f"v{EVALUATION_STORE_VERSION}-own-log"
+
+# Outcomes of settled calls, one directory per nurse holding Arrow segment files
+EVALUATION_STORE_DIR = os.environ.get(
+    'EVALUATION_STORE_DIR',
+    os.path.join(aws_support.S3_CACHE_DIR, 'evaluations', EVALUATION_STORE_NAME),
+)
+
+# Segments of one nurse are merged into one file once there are more than this
+EVALUATION_STORE_MAX_SEGMENTS = int(os.environ.get('EVALUATION_STORE_MAX_SEGMENTS', 16))
+
+# Memory for the stored outcomes kept loaded, the nurses used least recently are read from their segments again
+EVALUATION_STORE_MAX_MB = int(os.environ.get('EVALUATION_STORE_MAX_MB', 256))
+
+CALL_ID_COLUMN = 'Call Id'
+WATERMARK_KEY = b'watermark'
+
+
+# Identity of each call: a hash of its call log columns, the same call gets the same id in every load of the log
+def CallIds(df):
+    # after CleanDataInput an unanswered call and a call without an answer time differ only by the flag
+    # the columns are taken from the log itself, which shares their data instead of copying them into a new frame
+    identity = df[[column for column in CALL_LOG_COLUMNS + [NOT_ANSWERED_COLUMN] if column in df.columns]]
+    if DURATION_COLUMN in identity.columns:
+        # the dtype of Duration depends on the rows loaded, hash the value instead
+        identity = identity.assign(**{DURATION_COLUMN: pd.to_numeric(identity[DURATION_COLUMN], errors='coerce').astype('float64')})
+    return pd.util.hash_pandas_object(identity, index=False).rename(CALL_ID_COLUMN)
+
+
+# Outcomes of settled calls, persisted per nurse and shared by every session of this process
+# A missed call can only change outcome until the log holds every call up to 10 hours after it,
+# so only calls at least 10 hours older than the last call searched are stored.
+# The watermark of a nurse is the start time up to which every evaluated call has been stored.
+# Each save appends a small segment file, so a refresh writes only the calls that settled since the last one
+# The outcomes loaded are kept in memory up to max_bytes, least recently used nurse first out
+class EvaluationStore:
+    def __init__(self, store_dir, max_segments=EVALUATION_STORE_MAX_SEGMENTS, max_bytes=EVALUATION_STORE_MAX_MB * 1024 * 1024):
+        self.store_dir = store_dir
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self.nurses = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Loaded state of a nurse, created empty when it is not in memory
+    def _State(self, nurse_name):
+        state = self.nurses.get(nurse_name)
+        if state is None:
+            state = self.nurses[nurse_name] = {'frame': None, 'watermark': None, 'segments': set(), 'bytes': 0}
+        self.nurses.move_to_end(nurse_name)
+        return state
+
+    # Record the size of a nurse's outcomes and unload the least recently used nurses while over max_bytes
+    # A nurse larger than the whole budget is not kept, its segments are read again on the next load
+    def _Trim(self, nurse_name):
+        state = self.nurses[nurse_name]
+        state['bytes'] = FrameSize(state['frame']) if state['frame'] is not None else 0
+        total_bytes = sum(loaded['bytes'] for loaded in self.nurses.values())
+        while total_bytes > self.max_bytes and self.nurses:
+            _, unloaded = self.nurses.popitem(last=False)
+            total_bytes -= unloaded['bytes']
+
+    def _NurseDir(self, nurse_name):
+        return os.path.join(self.store_dir, nurse_name)
+
+    def _Segments(self, nurse_name):
+        try:
+            return sorted(name for name in os.listdir(self._NurseDir(nurse_name)) if name.endswith('.arrow'))
+        except OSError:
+            return []
+
+    # Read one segment, returns the outcomes indexed by call id and the segment's watermark
+    def _ReadSegment(self, path):
+        table = feather.read_table(path, memory_map=True)
+        metadata = table.schema.metadata or {}
+        watermark = pd.Timestamp(int(metadata[WATERMARK_KEY])) if WATERMARK_KEY in metadata else None
+
+        frame = table.to_pandas().set_index(CALL_ID_COLUMN)
+        # the Arrow dictionaries only hold the values present
+        frame[OUTCOME_COLUMN] = frame[OUTCOME_COLUMN].astype(OUTCOME_DTYPE)
+        frame[CALL_BACK_BY_COLUMN] = frame[CALL_BACK_BY_COLUMN].astype(pd.CategoricalDtype(['Nurse', 'Patient']))
+        return frame, watermark
+
+    def _WriteSegment(self, nurse_name, frame, watermark):
+        nurse_dir = self._NurseDir(nurse_name)
+        os.makedirs(nurse_dir, exist_ok=True)
+
+        table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            WATERMARK_KEY: str(watermark.value).encode(),
+        })
+
+        name = f"{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}.arrow"
+        path = os.path.join(nurse_dir, name)
+        temp_path = f"{path}.tmp"
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        os.replace(temp_path, path)
+        return name
+
+    # Get the stored outcomes of a nurse, reading only the segments written since the last call
+    # Segments written by other processes (e.g. the team evaluation workers) are picked up too
+    def Load(self, nurse_name):
+        with self.lock:
+            state = self._State(nurse_name)
+
+            new_segments = [name for name in self._Segments(nurse_name) if name not in state['segments']]
+            frames = [state['frame']] if state['frame'] is not None else []
+            for name in new_segments:
+                try:
+                    frame, watermark = self._ReadSegment(os.path.join(self._NurseDir(nurse_name), name))
+                except Exception as e:
+                    print(f"An error occurred: {str(e)}")
+                    print('Failed to read the evaluation store segment', name)
+                    continue
+                frames.append(frame)
+                state['segments'].add(name)
+                if watermark is not None and (state['watermark'] is None or watermark > state['watermark']):
+                    state['watermark'] = watermark
+
+            if new_segments and frames:
+                frame = pd.concat(frames)
+                state['frame'] = frame[~frame.index.duplicated(keep='last')]
+                self._Trim(nurse_name)
+
+            return state['frame'], state['watermark']
+
+    # Store newly settled outcomes of a nurse and move its watermark forward
+    def Save(self, nurse_name, frame, watermark):
+        with self.lock:
+            state = self._State(nurse_name)
+
+            # identical rows of the log share one id
+            frame = frame[~frame.index.duplicated(keep='last')]
+            if state['frame'] is not None:
+                frame = pd.concat([state['frame'], frame[~frame.index.isin(state['frame'].index)]])
+                added = frame.iloc[len(state['frame']):]
+            else:
+                added = frame
+            if state['watermark'] is not None:
+                watermark = max(watermark, state['watermark'])
+
+            state['frame'] = frame
+            state['watermark'] = watermark
+
+            try:
+                if len(state['segments']) >= self.max_segments:
+                    # merge every segment into one, the old files are removed once the merged one is written
+                    old_segments = state['segments']
+                    state['segments'] = {self._WriteSegment(nurse_name, frame, watermark)}
+                    for name in old_segments:
+                        try:
+                            os.remove(os.path.join(self._NurseDir(nurse_name), name))
+                        except OSError:
+                            pass
+                elif not added.empty or not state['segments']:
+                    state['segments'].add(self._WriteSegment(nurse_name, added, watermark))
+            except Exception as e:
+                print(f"An error occurred: {str(e)}")
+                print('Failed to save the evaluation store of', nurse_name)
+
+            self._Trim(nurse_name)
+
+    # Drop the stored outcomes of one nurse, or of every nurse
+    def Invalidate(self, nurse_name=None):
+        with self.lock:
+            nurse_names = [nurse_name] if nurse_name is not None else list(self.nurses)
+            for name in nurse_names:
+                self.nurses.pop(name, None)
+                for segment in self._Segments(name):
+                    try:
+                        os.remove(os.path.join(self._NurseDir(name), segment))
+                    except OSError:
+                        pass
+
+    # Evaluate calls like EvaluateCalls, reusing the stored outcome of every settled call
+    # Only calls after the watermark, or never evaluated before, are classified
+    # search_df and patient_index must hold every call within the callback window of calls_df, as for EvaluateCalls
+    def Evaluate(self, nurse_name, calls_df, search_df=None, patient_index=None):
+        with Trace('classify.incremental', nurse=nurse_name) as span:
+            evaluation, evaluated, reused = self._Evaluate(nurse_name, calls_df, search_df, patient_index)
+            span.Set(rows=len(calls_df), evaluated=evaluated, reused=reused)
+        return evaluation
+
+    def _Evaluate(self, nurse_name, calls_df, search_df, patient_index):
+        if search_df is None:
+            search_df = calls_df
+        if calls_df.empty or not pd.api.types.is_datetime64_any_dtype(calls_df[START_TIME_COLUMN]):
+            return EvaluateCalls(calls_df, search_df, patient_index), len(calls_df), 0
+
+        stored, watermark = self.Load(nurse_name)
+        call_ids = CallIds(calls_df)
+
+        # position of each call's stored outcome, -1 for the calls never stored
+        stored_positions = np.full(len(calls_df), -1)
+        if stored is not None and watermark is not None:
+            # calls after the watermark were never stored, skip the lookup for them
+            # the stored index keeps its hash table between reruns, a lookup does not build one of every stored call
+            candidates = (calls_df[START_TIME_COLUMN] <= watermark).to_numpy()
+            stored_positions[candidates] = stored.index.get_indexer(call_ids[candidates])
+        known = stored_positions >= 0
+
+        new_calls = calls_df[~known]
+        # only the calls within the callback window of the new calls can be their call backs
+        new_starts = new_calls[START_TIME_COLUMN]
+        window_df = search_df
+        if new_starts.notna().any():
+            window_df = SelectTimes(search_df, new_starts.min() - CALLBACK_GRACE, new_starts.max() + CALLBACK_WINDOW_10HR)
+        evaluated = EvaluateCalls(new_calls, window_df, patient_index)
+
+        if known.any():
+            reused = stored.take(stored_positions[known])
+            reused.index = calls_df.index[known]
+            evaluation = pd.concat([reused, evaluated]) if len(evaluated) else reused
+            # back in the order of calls_df, the new calls are usually the last ones already
+            order = np.concatenate([np.flatnonzero(known), np.flatnonzero(~known)])
+            if (np.diff(order) < 0).any():
+                evaluation = evaluation.take(np.argsort(order, kind='stable'))
+        else:
+            evaluation = evaluated.copy(deep=False)
+        evaluation[OUTCOME_COLUMN] = evaluation[OUTCOME_COLUMN].astype(OUTCOME_DTYPE)
+        evaluation[CALL_BACK_BY_COLUMN] = evaluation[CALL_BACK_BY_COLUMN].astype(pd.CategoricalDtype(['Nurse', 'Patient']))
+        # concat turns an all-None column into NaN
+        for column in (CALL_BACK_NURSE_COLUMN, ERROR_COLUMN):
+            evaluation[column] = evaluation[column].astype(object).where(evaluation[column].notna(), None)
+
+        # outcomes searched without the other nurses' calls are not final
+        if CROSS_NURSE_CALL_BACKS and patient_index is None:
+            return evaluation, len(new_calls), int(known.sum())
+
+        # a call is settled once every call up to 10 hours after it has been searched, in every log that is still
+        # written (the nurse's own log is one of them in the patient index)
+        if patient_index is not None:
+            complete_until = patient_index.complete_until
+        else:
+            complete_until = search_df[START_TIME_COLUMN].max()
+        if complete_until is not None and pd.notna(complete_until):
+            settled_until = complete_until - CALLBACK_WINDOW_10HR
+            settled = new_calls[START_TIME_COLUMN] <= settled_until
+            if settled.any():
+                settled_evaluation = evaluated[settled].set_index(call_ids[~known][settled])
+                self.Save(nurse_name, settled_evaluation, settled_until)
+
+        return evaluation, len(new_calls), int(known.sum())
+
+
+EVALUATION_STORE = EvaluationStore(EVALUATION_STORE_DIR)
+
+
+# Evaluate one nurse's calls through the shared evaluation store
+# patient_index (see GetGlobalPatientIndex) also matches call backs found in the other nurses' logs
+def EvaluateNurseCalls(nurse_name, calls_df, search_df=None, patient_index=None):
+    return EVALUATION_STORE.Evaluate(nurse_name, calls_df, search_df, patient_index)
@@ -0,0 +1,377 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import AWSSupport as aws_support
+from CallEvaluationSupport import (
+    CALL_BACK_BY_COLUMN,
+    CALL_BACK_DELAY_COLUMN,
+    CALL_BACK_NURSE_COLUMN,
+    CALL_BACK_TIME_COLUMN,
+    CALL_LOG_COLUMNS,
+    CALL_LOG_DTYPES,
+    CallLogWindow,
+    DIRECTION_COLUMN,
+    DURATION_COLUMN,
+    FROM_COLUMN,
+    OUTCOME_COLUMN,
+    PrepareCallLog,
+    RenderPerformanceText,
+    SelectDates,
+    START_TIME_COLUMN,
+    TO_COLUMN,
+)
+from EvaluationStoreSupport import EvaluateNurseCalls
+from InstrumentationSupport import Trace
+from PatientIndexSupport import GetGlobalPatientIndex
+
+# Columns of the detail report and the export, one row per call
+DETAIL_COLUMNS = [
+    'Nurse',
+    FROM_COLUMN,
+    TO_COLUMN,
+    START_TIME_COLUMN,
+    DURATION_COLUMN,
+    DIRECTION_COLUMN,
+    OUTCOME_COLUMN,
+    CALL_BACK_TIME_COLUMN,
+    CALL_BACK_BY_COLUMN,
+    CALL_BACK_NURSE_COLUMN,
+    CALL_BACK_DELAY_COLUMN,
+    'Performance',
+]
+
+# Arrow types of the detail columns, so every chunk of a parquet export has the same schema
+DETAIL_SCHEMA = pa.schema([
+    ('Nurse', pa.string()),
+    (FROM_COLUMN, pa.string()),
+    (TO_COLUMN, pa.string()),
+    (START_TIME_COLUMN, pa.timestamp('ns')),
+    (DURATION_COLUMN, pa.float64()),
+    (DIRECTION_COLUMN, pa.string()),
+    (OUTCOME_COLUMN, pa.string()),
+    (CALL_BACK_TIME_COLUMN, pa.timestamp('ns')),
+    (CALL_BACK_BY_COLUMN, pa.string()),
+    (CALL_BACK_NURSE_COLUMN, pa.string()),
+    (CALL_BACK_DELAY_COLUMN, pa.duration('ns')),
+    ('Performance', pa.string()),
+])
+
+# Export formats and the mime type of their files
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Days classified and written at a time, each nurse's calls of the whole export are read once
+EXPORT_CHUNK_DAYS = int(os.environ.get('EXPORT_CHUNK_DAYS', 7))
+
+# Rows handed to a writer at a time
+EXPORT_WRITE_ROWS = int(os.environ.get('EXPORT_WRITE_ROWS', 50000))
+
+# Exports running at the same time in this process, the others wait for their turn
+EXPORT_MAX_WORKERS = int(os.environ.get('EXPORT_MAX_WORKERS', 2))
+
+# Finished exports are kept on disk for the download button, and removed after this many seconds
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(aws_support.S3_CACHE_DIR, 'exports'))
+EXPORT_TTL_SECONDS = int(os.environ.get('EXPORT_TTL_SECONDS', 3600))
+
+# Rows of an Excel sheet, including the header, the export continues on a new sheet
+XLSX_MAX_ROWS = 1048576
+
+
+# Detail rows of one nurse's evaluated calls
+def DetailRows(nurse_name, calls_df, evaluation):
+    detail_df = calls_df[[FROM_COLUMN, TO_COLUMN, START_TIME_COLUMN, DURATION_COLUMN, DIRECTION_COLUMN]].join(evaluation)
+    detail_df['Performance'] = RenderPerformanceText(calls_df, evaluation)
+    detail_df.insert(0, 'Nurse', nurse_name)
+    return detail_df[DETAIL_COLUMNS]
+
+
+# Write frames as csv, appending each one to the file
+class CsvExportWriter:
+    def __init__(self, path, schema=None):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.header = True
+
+    def Write(self, df):
+        df.to_csv(self.file, index=False, header=self.header)
+        self.header = False
+
+    def Close(self):
+        self.file.close()
+
+    def Abort(self):
+        self.file.close()
+
+
+# Write frames as row groups of one parquet file, with the schema given or the one of the first frame
+class ParquetExportWriter:
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.schema = schema
+        self.writer = None
+
+    def Write(self, df):
+        # categoricals are written as their values, the next chunk may hold other categories
+        df = df.assign(**{
+            column: df[column].astype(object)
+            for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)
+        })
+        if self.schema is not None and DURATION_COLUMN in df.columns:
+            df = df.assign(**{DURATION_COLUMN: pd.to_numeric(df[DURATION_COLUMN], errors='coerce').astype('float64')})
+
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def Close(self):
+        if self.writer is None:
+            # no rows, still a valid file
+            pq.write_table(pa.Table.from_pylist([], schema=self.schema or pa.schema([])), self.path)
+            return
+        self.writer.close()
+
+    def Abort(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# Write frames to a write-only workbook, rows are streamed to disk instead of kept as cells in memory
+# A sheet that is full continues on a new one with the same header
+class XlsxExportWriter:
+    def __init__(self, path, schema=None, sheet_name='Calls'):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.sheet_name = sheet_name
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self.sheets = 0
+        self.columns = None
+
+    def _NewSheet(self):
+        self.sheets += 1
+        title = self.sheet_name if self.sheets == 1 else f"{self.sheet_name} {self.sheets}"
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def Write(self, df):
+        if self.columns is None:
+            self.columns = [str(column) for column in df.columns]
+            self._NewSheet()
+
+        # Excel has no timedelta type, write the call back delay in seconds
+        df = df.assign(**{
+            column: df[column].dt.total_seconds()
+            for column in df.columns if pd.api.types.is_timedelta64_dtype(df[column])
+        })
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._NewSheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def Close(self):
+        if self.sheet is None:
+            self.workbook.create_sheet(self.sheet_name)
+        self.workbook.save(self.path)
+
+    # the rows of a write-only sheet are kept in temporary files until the workbook is saved, saving removes them
+    def Abort(self):
+        if self.sheet is not None:
+            self.workbook.save(self.path)
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'parquet': ParquetExportWriter,
+    'xlsx': XlsxExportWriter,
+}
+
+
+# Open a writer of an export format, frames written to it are appended to path
+def OpenExportWriter(path, export_format, schema=None):
+    if export_format not in EXPORT_WRITERS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return EXPORT_WRITERS[export_format](path, schema=schema)
+
+
+# Write a frame in chunks of rows, an empty frame still writes the header
+def WriteFrame(writer, df, chunk_rows=EXPORT_WRITE_ROWS):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        writer.Write(df.iloc[start:start + chunk_rows])
+
+
+# First and last day of each chunk of days between two dates (inclusive)
+def DayChunks(from_date, to_date, chunk_days=EXPORT_CHUNK_DAYS):
+    days = pd.date_range(from_date, to_date, freq='D')
+    for start in range(0, len(days), max(1, chunk_days)):
+        chunk = days[start:start + chunk_days]
+        yield chunk[0].date(), chunk[-1].date()
+
+
+# Detail rows of the evaluated calls of nurses between two dates, one nurse and one chunk of days at a time
+# Each nurse's log is read once for the whole export and not kept in FRAME_CACHE, every chunk shares one patient index
+# Yields (nurse_name, detail rows or None, error or None) for each nurse and chunk of days
+def IterDetailRows(nurse_names, from_date, to_date, chunk_days=EXPORT_CHUNK_DAYS):
+    patient_index = GetGlobalPatientIndex()
+    chunks = list(DayChunks(from_date, to_date, chunk_days))
+    start, end = CallLogWindow(from_date, to_date)
+    for nurse_name in nurse_names:
+        df = aws_support.GetNurseCallLogBetween(
+            nurse_name, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog, cache=False,
+        )
+        for first_day, last_day in chunks:
+            if df is None:
+                yield nurse_name, None, 'Failed to load the data'
+                continue
+
+            calls_df = SelectDates(df, first_day, last_day)
+            evaluation = EvaluateNurseCalls(nurse_name, calls_df, df, patient_index)
+            yield nurse_name, DetailRows(nurse_name, calls_df, evaluation), None
+
+
+# Write the evaluated calls of nurses between two dates to path, ordered by nurse, then start time
+# The file is written under a temporary name and renamed once complete, a failed export leaves no file behind
+# progress(rows, parts_done, parts) is called after each chunk of days of each nurse
+# Returns the rows written and the error of every nurse that failed
+def ExportEvaluatedCalls(path, nurse_names, from_date, to_date, export_format, chunk_days=EXPORT_CHUNK_DAYS, progress=None):
+    parts = len(list(DayChunks(from_date, to_date, chunk_days))) * len(nurse_names)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+
+    rows = 0
+    parts_done = 0
+    error_dict = {}
+    with Trace('export.write', nurses=len(nurse_names), format=export_format) as span:
+        writer = None
+        try:
+            writer = OpenExportWriter(temp_path, export_format, schema=DETAIL_SCHEMA)
+            for nurse_name, detail_df, error in IterDetailRows(nurse_names, from_date, to_date, chunk_days):
+                if error is not None:
+                    error_dict.setdefault(nurse_name, error)
+                else:
+                    WriteFrame(writer, detail_df)
+                    rows += len(detail_df)
+                parts_done += 1
+                if progress is not None:
+                    progress(rows, parts_done, parts)
+            writer.Close()
+            writer = None
+            os.replace(temp_path, path)
+        finally:
+            if writer is not None:
+                try:
+                    writer.Abort()
+                except Exception as e:
+                    print(f"An error occurred: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        span.Set(rows=rows, bytes=os.path.getsize(path))
+
+    return rows, error_dict
+
+
+# An export running in the background, its progress is read by the page while it runs
+class ExportJob:
+    def __init__(self, nurse_names, from_date, to_date, export_format):
+        self.nurse_names = list(nurse_names)
+        self.from_date = from_date
+        self.to_date = to_date
+        self.export_format = export_format
+        name = self.nurse_names[0] if len(self.nurse_names) == 1 else 'team'
+        self.file_name = f"{name}_{from_date}_{to_date}.{export_format}"
+        self.path = os.path.join(EXPORT_DIR, f"{time.time_ns()}-{self.file_name}")
+        self.mime = EXPORT_FORMATS[export_format]
+
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.parts_done = 0
+        self.parts = None
+        self.errors = {}
+        self.error = None
+        self.future = None
+
+    def _Progress(self, rows, parts_done, parts):
+        with self.lock:
+            self.rows = rows
+            self.parts_done = parts_done
+            self.parts = parts
+
+    def Run(self):
+        try:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            _, error_dict = ExportEvaluatedCalls(
+                self.path, self.nurse_names, self.from_date, self.to_date, self.export_format, progress=self._Progress,
+            )
+            with self.lock:
+                self.errors = error_dict
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            with self.lock:
+                self.error = str(e)
+
+    def Done(self):
+        return self.future is not None and self.future.done()
+
+    def Status(self):
+        with self.lock:
+            return {
+                'done': self.Done(),
+                'rows': self.rows,
+                'parts_done': self.parts_done,
+                'parts': self.parts,
+                'errors': dict(self.errors),
+                'error': self.error,
+            }
+
+
+_export_executor = None
+_export_executor_lock = threading.Lock()
+
+
+def _ExportExecutor():
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(max_workers=max(1, EXPORT_MAX_WORKERS), thread_name_prefix='export')
+        return _export_executor
+
+
+# Remove the exports older than EXPORT_TTL_SECONDS
+def RemoveOldExports():
+    try:
+        names = os.listdir(EXPORT_DIR)
+    except OSError:
+        return
+    oldest = time.time() - EXPORT_TTL_SECONDS
+    for name in names:
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < oldest:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+# Export the evaluated calls of nurses between two dates in the background, returns the ExportJob
+# At most EXPORT_MAX_WORKERS exports run at a time, so exports do not slow every session down
+def StartExport(nurse_names, from_date, to_date, export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    RemoveOldExports()
+    job = ExportJob(nurse_names, from_date, to_date, export_format)
+    job.future = _ExportExecutor().submit(job.Run)
+    return job
@@ -5,3 +5,7 @@ import streamlit as st
 st.set_page_config(page_title='Multi-page App', layout='wide')
 
 st.title('Medkick Streamlit App')
+
+# load and classify every nurse in the background, so the dashboards are served from memory
+from WarmupSupport import StartWarmUp
+StartWarmUp()
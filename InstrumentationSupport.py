@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, spans are then recorded without the peak memory
+    resource = None
+
+# Structured log lines, one json object per span, set PERF_LOG=0 to turn them off
+PERF_LOG = os.environ.get('PERF_LOG', '1') != '0'
+PERF_LOG_LEVEL = os.environ.get('PERF_LOG_LEVEL', 'INFO')
+# Deep memory of the frames recorded with SetFrame(..., deep=True), set PERF_DEEP_MEMORY=1 to measure it everywhere
+# Otherwise it is only measured for page runs showing the performance panel (see StartRecording)
+PERF_DEEP_MEMORY = os.environ.get('PERF_DEEP_MEMORY', '0') == '1'
+
+# Spans kept for the whole process, newest last
+RECENT_SPANS_MAX = int(os.environ.get('RECENT_SPANS_MAX', 2000))
+RECENT_SPANS = deque(maxlen=RECENT_SPANS_MAX)
+
+perf_logger = logging.getLogger('medkick.perf')
+if not perf_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    perf_logger.addHandler(_handler)
+    perf_logger.propagate = False
+perf_logger.setLevel(PERF_LOG_LEVEL)
+
+# Spans of the current page run (see StartRecording), and the span being run
+_recording = contextvars.ContextVar('perf_recording', default=None)
+_current_span = contextvars.ContextVar('perf_current_span', default=None)
+_deep_memory = contextvars.ContextVar('perf_deep_memory', default=PERF_DEEP_MEMORY)
+
+
+# Peak resident memory of the process in MB
+def PeakMemoryMB():
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# One timed step: its name, duration, depth below the enclosing spans and fields such as rows and bytes
+class Span:
+    def __init__(self, name, fields):
+        parent = _current_span.get()
+        self.name = name
+        self.parent = parent.name if parent is not None else None
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.fields = dict(fields)
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.thread = threading.current_thread().name
+
+    def Set(self, **fields):
+        self.fields.update(fields)
+
+    # Record the rows and the memory of a frame or series
+    # Shallow by default, deep sizes cost a pass over every string but count what text columns really hold,
+    # so deep=True is only honoured when deep memory was asked for (PERF_DEEP_MEMORY or StartRecording)
+    def SetFrame(self, df, prefix='', deep=False):
+        self.fields[f'{prefix}rows'] = len(df)
+        memory = df.memory_usage(index=True, deep=deep and _deep_memory.get())
+        self.fields[f'{prefix}bytes'] = int(memory.sum() if hasattr(memory, 'sum') else memory)
+
+    def AsDict(self):
+        return {
+            'span': self.name,
+            'ms': round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            'depth': self.depth,
+            'parent': self.parent,
+            'thread': self.thread,
+            **self.fields,
+        }
+
+
+# Time a block of code as a named span
+#   with Trace('s3.get', key=file_name) as span:
+#       ...
+#       span.Set(bytes=size)
+def Trace(name, **fields):
+    return _Trace(name, fields)
+
+
+@contextmanager
+def _Trace(name, fields):
+    span = Span(name, fields)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.Set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.seconds = time.perf_counter() - span.started
+        peak_memory = PeakMemoryMB()
+        if peak_memory is not None:
+            span.fields['peak_rss_mb'] = round(peak_memory, 1)
+        _Finish(span)
+
+
+def _Finish(span):
+    recording = _recording.get()
+    if recording is not None:
+        recording.append(span)
+    RECENT_SPANS.append(span)
+
+    if PERF_LOG and perf_logger.isEnabledFor(logging.INFO):
+        perf_logger.info(json.dumps(span.AsDict(), default=str))
+
+
+# Decorator timing every call of a function as a span, a returned DataFrame sets the rows and bytes
+def Traced(name):
+    def Decorate(function):
+        @functools.wraps(function)
+        def Wrapper(*args, **kwargs):
+            with Trace(name) as span:
+                result = function(*args, **kwargs)
+                if hasattr(result, 'memory_usage') and hasattr(result, '__len__'):
+                    span.SetFrame(result)
+                return result
+        return Wrapper
+    return Decorate
+
+
+# Run a function in another thread with the caller's spans, for ThreadPoolExecutor.submit
+def InContext(function):
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
+
+
+# Collect the spans of this page run, returns the list they are added to
+# A Streamlit rerun calls this again and starts a new list
+# deep_memory measures the deep memory of the frames of this run, for when the performance panel is shown
+def StartRecording(deep_memory=False):
+    spans = []
+    _recording.set(spans)
+    _deep_memory.set(PERF_DEEP_MEMORY or deep_memory)
+    return spans
+
+
+# Spans as a table in the order they started, nested spans indented below their parent
+def SpansToFrame(spans):
+    import pandas as pd
+
+    rows = []
+    for span in sorted(spans, key=lambda span: span.started):
+        row = span.AsDict()
+        row['span'] = '  ' * span.depth + span.name
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# Optional sidebar panel with the spans of this page run
+def ShowPerformancePanel(spans, label='Show performance'):
+    import streamlit as st
+
+    if not st.sidebar.checkbox(label, key='show_performance_panel'):
+        return
+
+    with st.sidebar.expander('Performance', expanded=True):
+        if not spans:
+            st.write('No spans recorded')
+            return
+        top_level = [span for span in spans if span.depth == 0]
+        st.write(f"{len(spans)} spans, {sum(span.seconds for span in top_level) * 1000:.0f} ms at the top level")
+        spans_df = SpansToFrame(spans)
+        columns = [column for column in ('span', 'ms', 'rows', 'bytes', 'peak_rss_mb') if column in spans_df.columns]
+        st.dataframe(spans_df[columns], hide_index=True, use_container_width=True)
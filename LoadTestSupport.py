@@ -0,0 +1,617 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import AWSSupport as aws_support
+from SyntheticDataSupport import GenerateCallLogCsvs, SYNTHETIC_CALLS_PER_DAY
+
+# Concurrent sessions of each run, a new server is started for each count
+LOAD_TEST_SESSIONS = [1, 4, 16]
+
+# Nurses in the synthetic bucket and calls in each nurse's log
+LOAD_TEST_NURSES = 8
+LOAD_TEST_ROWS = 20000
+
+# Seconds a page run may take before the session gives up on it
+LOAD_TEST_TIMEOUT = 300
+
+# Steps of one simulated session, in order: the pages of the app, and a nurse picked in the dashboard's sidebar
+LOAD_TEST_STEPS = ['Home', 'User_Data_Dashboard', 'select_nurse', 'Team_Dashboard', 'Adding_Nurse', 'Removing_Nurse']
+
+# Pages of the startup report, each one is the first page of a new server
+STARTUP_PAGES = ['Home', 'User_Data_Dashboard', 'Team_Dashboard', 'Adding_Nurse', 'Removing_Nurse', 'Export_Calls']
+
+# Runs of each page after its first one in the startup report, their median is the per-rerun overhead
+STARTUP_RERUNS = 5
+
+# Modules whose import the startup report times, on top of the streamlit import every server has done before a page runs
+STARTUP_MODULES = [
+    'boto3',
+    'plotly.express',
+    'openpyxl',
+    'pyarrow.parquet',
+    'AWSSupport',
+    'WarmupSupport',
+    'RollupSupport',
+    'TeamEvaluationSupport',
+    'ExportSupport',
+]
+
+# Dependencies reported as loaded or not after each of those imports, streamlit already loads pandas, numpy and pyarrow
+STARTUP_HEAVY_MODULES = ['boto3', 'plotly.express', 'openpyxl', 'pyarrow.parquet']
+
+# Fresh interpreters each import is timed in, the fastest one is kept
+STARTUP_IMPORT_REPEATS = 3
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Name of the S3 operation of a path-style request, e.g. GetObject for GET /bucket/key
+def _S3Operation(environ):
+    method = environ.get('REQUEST_METHOD', 'GET')
+    has_key = len([part for part in environ.get('PATH_INFO', '').split('/') if part]) > 1
+    if method == 'GET':
+        return 'GetObject' if has_key else 'ListObjects'
+    if method == 'HEAD':
+        return 'HeadObject' if has_key else 'HeadBucket'
+    if method == 'PUT':
+        return 'PutObject' if has_key else 'CreateBucket'
+    if method == 'DELETE':
+        return 'DeleteObject' if has_key else 'DeleteBucket'
+    return method
+
+
+# Local S3 stand-in (moto) counting the requests it serves by operation
+# GET /_loadtest/requests returns the counts, DELETE resets them
+class CountingS3App:
+    def __init__(self, app):
+        self.app = app
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/_loadtest/requests':
+            with self.lock:
+                body = json.dumps(self.counts).encode()
+                if environ.get('REQUEST_METHOD') == 'DELETE':
+                    self.counts = Counter()
+            start_response('200 OK', [('Content-Type', 'application/json')])
+            return [body]
+
+        with self.lock:
+            self.counts[_S3Operation(environ)] += 1
+        return self.app(environ, start_response)
+
+
+# Serve the S3 stand-in until the process is stopped, run in its own process so it does not share the app's CPU
+def ServeS3(port):
+    from moto.moto_server.werkzeug_app import DomainDispatcherApplication, create_backend_app
+    from werkzeug.serving import run_simple
+
+    run_simple('127.0.0.1', port, CountingS3App(DomainDispatcherApplication(create_backend_app)), threaded=True)
+
+
+def _FreePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _WaitForUrl(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.read()
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+# S3 request counts of the stand-in since the last reset, reset=True starts counting again
+def _S3RequestCounts(endpoint, reset=False):
+    request = urllib.request.Request(f"{endpoint}/_loadtest/requests", method='DELETE' if reset else 'GET')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+# Create the bucket with a nurse list and a synthetic log for each nurse, the logs end today
+def SeedBucket(endpoint, nurses=LOAD_TEST_NURSES, rows=LOAD_TEST_ROWS, seed=0):
+    import boto3
+
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=endpoint,
+        region_name='us-east-1',
+        aws_access_key_id=aws_support.AWS_KEY,
+        aws_secret_access_key=aws_support.AWS_SECRET,
+    )
+    s3_client.create_bucket(Bucket=aws_support.BUCKET_NAME)
+
+    nurse_names = [f"Load_Nurse_{i}" for i in range(nurses)]
+    days = max(1, int(np.ceil(rows / SYNTHETIC_CALLS_PER_DAY)))
+    start = (pd.Timestamp.now().normalize() - pd.Timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    for file_name, csv_text in GenerateCallLogCsvs(nurse_names, rows, seed=seed, start=start).items():
+        s3_client.put_object(Bucket=aws_support.BUCKET_NAME, Key=file_name, Body=csv_text.encode())
+
+    nurse_list_df = pd.DataFrame({'Name': nurse_names, 'Link': [f"https://example.com/{name}" for name in nurse_names]})
+    s3_client.put_object(Bucket=aws_support.BUCKET_NAME, Key=aws_support.NURSE_LIST_FILE_NAME, Body=nurse_list_df.to_csv(index=False).encode())
+    return nurse_names
+
+
+# Start the app with `streamlit run` against the S3 stand-in, with its own empty local cache
+# The pages write next to the working directory (submissions.csv), so each server gets its own
+def StartAppServer(endpoint, work_dir, warmup=False):
+    port = _FreePort()
+    os.makedirs(work_dir, exist_ok=True)
+    images = os.path.join(work_dir, 'images')
+    if not os.path.exists(images):
+        os.symlink(os.path.join(APP_DIR, 'images'), images)
+
+    env = dict(
+        os.environ,
+        AWS_ENDPOINT_URL=endpoint,
+        AWS_DEFAULT_REGION='us-east-1',
+        S3_CACHE_DIR=os.path.join(work_dir, 's3_cache'),
+        WARMUP='1' if warmup else '0',
+        PERF_LOG='0',
+    )
+    log = open(os.path.join(work_dir, 'streamlit.log'), 'wb')
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'streamlit', 'run', os.path.join(APP_DIR, 'Home.py'),
+            '--server.headless', 'true',
+            '--server.address', '127.0.0.1',
+            '--server.port', str(port),
+            '--server.fileWatcherType', 'none',
+            '--browser.gatherUsageStats', 'false',
+        ],
+        cwd=work_dir,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    log.close()
+    try:
+        _WaitForUrl(f"http://127.0.0.1:{port}/_stcore/health")
+    except Exception:
+        process.kill()
+        raise
+    return process, port
+
+
+def _StopProcess(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# Peak resident memory of a process in MB, read from /proc (Linux only), None elsewhere
+def ProcessPeakMemoryMB(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# One browser tab of the app, talking to the server over its websocket like the frontend does
+class AppSession:
+    def __init__(self, port, timeout=LOAD_TEST_TIMEOUT):
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+        self.pages = {}
+        self.buttons = {}
+
+    async def Connect(self):
+        from tornado.websocket import websocket_connect
+
+        self.connection = await websocket_connect(f"ws://127.0.0.1:{self.port}/_stcore/stream", max_message_size=1 << 30)
+
+    def Close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    # Run a page (by name, None for Home) with the given widget states, returns the seconds until the script finished
+    # and the exceptions it showed
+    async def Run(self, page_name=None, widget_states=()):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.page_script_hash = self.pages.get(page_name, '') if page_name is not None else ''
+        message.rerun_script.page_name = page_name or ''
+        for widget_state in widget_states:
+            message.rerun_script.widget_states.widgets.append(widget_state)
+
+        self.buttons = {}
+        exceptions = []
+        started = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            data = await asyncio.wait_for(self.connection.read_message(), timeout=self.timeout)
+            if data is None:
+                raise ConnectionError('The server closed the session')
+
+            forward = ForwardMsg.FromString(data)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.pages = {page.page_name: page.page_script_hash for page in forward.new_session.app_pages}
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof('type')
+                if element_kind == 'button':
+                    self.buttons[element.button.label] = element.button.id
+                elif element_kind == 'exception':
+                    exceptions.append(element.exception.message)
+            elif kind == 'script_finished':
+                # a page calling st.rerun finishes early, wait for the run it started
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return time.perf_counter() - started, exceptions
+
+    # Click a button of the page shown last
+    async def Click(self, page_name, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if label not in self.buttons:
+            raise KeyError(f"No button {label} on {page_name}")
+        widget_state = WidgetState(id=self.buttons[label], trigger_value=True)
+        return await self.Run(page_name, [widget_state])
+
+
+# One supervisor going through every page, each session picks a different nurse in the dashboard
+async def RunSession(port, session, nurse_names, evaluate_team=False, timeout=LOAD_TEST_TIMEOUT):
+    app_session = AppSession(port, timeout=timeout)
+    results = []
+
+    def Record(step, seconds=None, exceptions=(), error=None):
+        results.append({
+            'session': session,
+            'step': step,
+            'seconds': seconds,
+            'exceptions': len(exceptions),
+            'error': error or (exceptions[0] if exceptions else None),
+        })
+
+    try:
+        await app_session.Connect()
+        for step in LOAD_TEST_STEPS:
+            try:
+                if step == 'Home':
+                    seconds, exceptions = await app_session.Run()
+                elif step == 'select_nurse':
+                    nurse_name = nurse_names[(session + 1) % len(nurse_names)]
+                    seconds, exceptions = await app_session.Click('User_Data_Dashboard', nurse_name)
+                elif step == 'Team_Dashboard' and evaluate_team:
+                    await app_session.Run(step)
+                    seconds, exceptions = await app_session.Click(step, 'Evaluate Team')
+                else:
+                    seconds, exceptions = await app_session.Run(step)
+                Record(step, seconds, exceptions)
+            except Exception as e:
+                Record(step, error=f"{type(e).__name__}: {e}")
+    except Exception as e:
+        Record('connect', error=f"{type(e).__name__}: {e}")
+    finally:
+        app_session.Close()
+
+    return results
+
+
+async def _RunSessions(port, sessions, nurse_names, evaluate_team, timeout):
+    runs = await asyncio.gather(*[
+        RunSession(port, session, nurse_names, evaluate_team=evaluate_team, timeout=timeout)
+        for session in range(sessions)
+    ])
+    return [result for results in runs for result in results]
+
+
+# Run the sessions at the same time against a new server, returns one row per page run and the level's totals
+def LoadTestLevel(endpoint, sessions, nurse_names, work_dir, warm=False, warmup=False, evaluate_team=False, timeout=LOAD_TEST_TIMEOUT):
+    process, port = StartAppServer(endpoint, work_dir, warmup=warmup)
+    try:
+        if warm:
+            # one session fills the caches first, as on a server that has been up for a while
+            asyncio.run(_RunSessions(port, 1, nurse_names, evaluate_team, timeout))
+        _S3RequestCounts(endpoint, reset=True)
+
+        started = time.perf_counter()
+        results = asyncio.run(_RunSessions(port, sessions, nurse_names, evaluate_team, timeout))
+        wall_seconds = time.perf_counter() - started
+
+        s3_requests = _S3RequestCounts(endpoint)
+        peak_memory = ProcessPeakMemoryMB(process.pid)
+    finally:
+        _StopProcess(process)
+
+    for result in results:
+        result['sessions'] = sessions
+    return results, {
+        'sessions': sessions,
+        'wall_seconds': wall_seconds,
+        's3_requests': s3_requests,
+        'peak_rss_mb': peak_memory,
+    }
+
+
+# Latency percentiles of the page runs of each session count, overall and per step
+def SummarizeLoadTest(report):
+    runs = pd.DataFrame(report['results'])
+    levels = {level['sessions']: level for level in report['levels']}
+
+    rows = []
+    for (sessions, step), group in [((sessions, 'all'), group) for sessions, group in runs.groupby('sessions')] + list(runs.groupby(['sessions', 'step'])):
+        seconds = group['seconds'].dropna()
+        row = {
+            'sessions': sessions,
+            'step': step,
+            'runs': len(seconds),
+            'p50_seconds': seconds.quantile(0.5) if len(seconds) else None,
+            'p95_seconds': seconds.quantile(0.95) if len(seconds) else None,
+            'failed': int(group['error'].notna().sum()),
+        }
+        if step == 'all':
+            level = levels[sessions]
+            row['s3_requests'] = sum(level['s3_requests'].values())
+            row['s3_gets'] = level['s3_requests'].get('GetObject', 0)
+            row['peak_rss_mb'] = level['peak_rss_mb']
+            row['wall_seconds'] = level['wall_seconds']
+        rows.append(row)
+
+    steps = ['all'] + LOAD_TEST_STEPS
+    summary = pd.DataFrame(rows)
+    summary['order'] = summary['step'].map({step: i for i, step in enumerate(steps)})
+    return summary.sort_values(['sessions', 'order']).drop(columns=['order']).reset_index(drop=True)
+
+
+# Start the S3 stand-in in its own process and seed its bucket, yields its endpoint, the nurse names and a working directory
+# Both are removed on exit
+@contextmanager
+def S3StandIn(nurses=LOAD_TEST_NURSES, rows=LOAD_TEST_ROWS, seed=0):
+    s3_port = _FreePort()
+    endpoint = f"http://127.0.0.1:{s3_port}"
+    s3_process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-s3', str(s3_port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    work_dir = tempfile.mkdtemp(prefix='medkick-load-')
+    try:
+        _WaitForUrl(f"{endpoint}/_loadtest/requests")
+        print(f"Seeding {nurses} nurses of {rows} calls...")
+        nurse_names = SeedBucket(endpoint, nurses=nurses, rows=rows, seed=seed)
+        yield endpoint, nurse_names, work_dir
+    finally:
+        _StopProcess(s3_process)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def RunLoadTest(sessions=None, nurses=LOAD_TEST_NURSES, rows=LOAD_TEST_ROWS, seed=0, warm=False, warmup=False, evaluate_team=False, timeout=LOAD_TEST_TIMEOUT):
+    with S3StandIn(nurses=nurses, rows=rows, seed=seed) as (endpoint, nurse_names, work_dir):
+        results = []
+        levels = []
+        for level_sessions in sessions or LOAD_TEST_SESSIONS:
+            print(f"Running {level_sessions} sessions...")
+            level_results, level = LoadTestLevel(
+                endpoint,
+                level_sessions,
+                nurse_names,
+                os.path.join(work_dir, f"sessions_{level_sessions}"),
+                warm=warm,
+                warmup=warmup,
+                evaluate_team=evaluate_team,
+                timeout=timeout,
+            )
+            results.extend(level_results)
+            levels.append(level)
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'nurses': nurses,
+        'rows': rows,
+        'seed': seed,
+        'warm': warm,
+        'warmup': warmup,
+        'evaluate_team': evaluate_team,
+        'levels': levels,
+        'results': results,
+    }
+
+
+def PrintLoadTest(report):
+    summary = SummarizeLoadTest(report)
+    print(summary.to_string(index=False, na_rep='', float_format=lambda value: f"{value:,.3f}"))
+
+    errors = [result for result in report['results'] if result['error']]
+    for result in errors[:10]:
+        print(f"{result['sessions']} sessions, session {result['session']}, {result['step']}: {result['error']}")
+    if len(errors) > 10:
+        print(f"... and {len(errors) - 10} more failed page runs")
+
+
+
+# Seconds to import a module in a fresh interpreter that has already imported streamlit, as a server has before any page runs,
+# and which of STARTUP_HEAVY_MODULES the import loaded. The fastest of a few runs is kept
+def ImportCost(module_name, repeats=STARTUP_IMPORT_REPEATS):
+    code = (
+        "import sys, json, time, streamlit\n"
+        "started = time.perf_counter()\n"
+        f"import {module_name}\n"
+        "seconds = time.perf_counter() - started\n"
+        f"print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {STARTUP_HEAVY_MODULES!r} if name in sys.modules]}}))\n"
+    )
+    runs = []
+    for _ in range(max(1, repeats)):
+        completed = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    fastest = min(runs, key=lambda run: run['seconds'])
+    return {'module': module_name, 'import_seconds': fastest['seconds'], 'loads': ' '.join(fastest['loaded'])}
+
+
+async def _TimePage(port, page_name, reruns, timeout):
+    app_session = AppSession(port, timeout=timeout)
+    try:
+        await app_session.Connect()
+        page = None if page_name == 'Home' else page_name
+        first_paint, exceptions = await app_session.Run(page)
+        rerun_seconds = []
+        for _ in range(reruns):
+            seconds, rerun_exceptions = await app_session.Run(page)
+            rerun_seconds.append(seconds)
+            exceptions += rerun_exceptions
+    finally:
+        app_session.Close()
+    return first_paint, rerun_seconds, exceptions
+
+
+# Open one page as the first page of a new server: the seconds until the server answers, until the page's first run
+# finished (first paint, with every import of the page) and of each rerun after it
+def StartupPage(endpoint, page_name, work_dir, reruns=STARTUP_RERUNS, warmup=False, timeout=LOAD_TEST_TIMEOUT):
+    started = time.perf_counter()
+    process, port = StartAppServer(endpoint, work_dir, warmup=warmup)
+    server_seconds = time.perf_counter() - started
+    try:
+        first_paint, rerun_seconds, exceptions = asyncio.run(_TimePage(port, page_name, reruns, timeout))
+        peak_memory = ProcessPeakMemoryMB(process.pid)
+    finally:
+        _StopProcess(process)
+
+    return {
+        'page': page_name,
+        'server_seconds': server_seconds,
+        'first_paint_seconds': first_paint,
+        'rerun_seconds': float(np.median(rerun_seconds)) if rerun_seconds else None,
+        'peak_rss_mb': peak_memory,
+        'error': exceptions[0] if exceptions else None,
+    }
+
+
+# Startup timing report: the import cost of the heavy modules, and the first paint and rerun time of every page on a new server
+def RunStartupReport(pages=None, nurses=LOAD_TEST_NURSES, rows=LOAD_TEST_ROWS, seed=0, reruns=STARTUP_RERUNS, warmup=False, timeout=LOAD_TEST_TIMEOUT):
+    print('Timing imports...')
+    imports = [ImportCost(module_name) for module_name in STARTUP_MODULES]
+
+    with S3StandIn(nurses=nurses, rows=rows, seed=seed) as (endpoint, nurse_names, work_dir):
+        results = []
+        for page_name in pages or STARTUP_PAGES:
+            print(f"Opening {page_name}...")
+            results.append(StartupPage(endpoint, page_name, os.path.join(work_dir, page_name), reruns=reruns, warmup=warmup, timeout=timeout))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'nurses': nurses,
+        'rows': rows,
+        'seed': seed,
+        'reruns': reruns,
+        'warmup': warmup,
+        'imports': imports,
+        'results': results,
+    }
+
+
+def PrintStartupReport(report):
+    float_format = lambda value: f"{value:,.3f}"
+    print(pd.DataFrame(report['imports']).to_string(index=False, float_format=float_format))
+    print()
+    print(pd.DataFrame(report['results']).drop(columns=['error']).to_string(index=False, na_rep='', float_format=float_format))
+
+    for result in report['results']:
+        if result['error']:
+            print(f"{result['page']}: {result['error']}")
+
+def ParseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the app with concurrent sessions against a local S3 stand-in.')
+    parser.add_argument('--sessions', type=int, nargs='+', default=LOAD_TEST_SESSIONS, help='concurrent sessions of each run (default: %(default)s)')
+    parser.add_argument('--nurses', type=int, default=LOAD_TEST_NURSES, help='nurses in the synthetic bucket (default: %(default)s)')
+    parser.add_argument('--rows', type=int, default=LOAD_TEST_ROWS, help='calls in each nurse log (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic logs (default: %(default)s)')
+    parser.add_argument('--warm', action='store_true', help='run one session before measuring, so the caches are filled')
+    parser.add_argument('--warmup', action='store_true', help='let the server warm up every nurse in the background (WARMUP=1)')
+    parser.add_argument('--evaluate-team', action='store_true', help="press 'Evaluate Team' on the team dashboard")
+    parser.add_argument('--timeout', type=float, default=LOAD_TEST_TIMEOUT, help='seconds a page run may take (default: %(default)s)')
+    parser.add_argument('--startup', action='store_true', help='time the imports, and the first paint and reruns of each page on a new server, instead')
+    parser.add_argument('--pages', nargs='+', default=STARTUP_PAGES, help='pages of the startup report (default: %(default)s)')
+    parser.add_argument('--reruns', type=int, default=STARTUP_RERUNS, help='reruns of each page in the startup report (default: %(default)s)')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--serve-s3', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# Command line entry point, e.g.
+# python LoadTestSupport.py --sessions 1 4 16 --rows 20000 --output load.json
+# python LoadTestSupport.py --startup --output startup.json
+def main(argv=None):
+    args = ParseArguments(argv)
+    if args.serve_s3:
+        ServeS3(args.serve_s3)
+        return 0
+
+    try:
+        import moto  # noqa: F401
+        import werkzeug  # noqa: F401
+    except ImportError:
+        print('The S3 stand-in of the load test needs moto and werkzeug: pip install -r requirements-dev.txt')
+        return 1
+
+    if args.startup:
+        report = RunStartupReport(
+            args.pages,
+            nurses=args.nurses,
+            rows=args.rows,
+            seed=args.seed,
+            reruns=args.reruns,
+            warmup=args.warmup,
+            timeout=args.timeout,
+        )
+        PrintStartupReport(report)
+    else:
+        report = RunLoadTest(
+            args.sessions,
+            nurses=args.nurses,
+            rows=args.rows,
+            seed=args.seed,
+            warm=args.warm,
+            warmup=args.warmup,
+            evaluate_team=args.evaluate_team,
+            timeout=args.timeout,
+        )
+        PrintLoadTest(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+        print('Wrote', args.output)
+    return 1 if any(result['error'] for result in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
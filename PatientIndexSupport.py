@@ -0,0 +1,284 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import AWSSupport as aws_support
+from CacheSupport import KeyedLocks
+from CallEvaluationSupport import (
+    CALL_LOG_DTYPES,
+    DIRECTION_COLUMN,
+    DURATION_COLUMN,
+    FROM_COLUMN,
+    NormalizePhoneNumbers,
+    PATIENT_NUMBER_COLUMN,
+    PrepareCallLog,
+    START_TIME_COLUMN,
+    TO_COLUMN,
+)
+from InstrumentationSupport import Trace
+
+# Look for the call backs of a missed call in every nurse's log, set CROSS_NURSE_CALL_BACKS=0 to only search the nurse's own log
+CROSS_NURSE_CALL_BACKS = os.environ.get('CROSS_NURSE_CALL_BACKS', '1') != '0'
+
+# Global indexes kept for the most recent versions of the logs
+PATIENT_INDEX_CACHE_SIZE = int(os.environ.get('PATIENT_INDEX_CACHE_SIZE', 2))
+
+# Logs not written for this many hours before the most recently written one are idle, they do not hold back settling
+CALL_LOG_IDLE_HOURS = float(os.environ.get('CALL_LOG_IDLE_HOURS', 48))
+
+
+# First position in each block values[lo:hi] whose value is at least target, hi when there is none
+# Every block is sorted, all the blocks are searched together in log2(longest block) vectorized steps
+def _SearchBlocks(values, lo, hi, targets):
+    lo = lo.copy()
+    hi = hi.copy()
+    if len(values) == 0:
+        return lo
+
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        go_right = active & (values[np.minimum(mid, len(values) - 1)] < targets)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+
+
+# Calls of one kind (e.g. outbound calls of at least 1 second) sorted by patient then start time
+# Each patient's calls are one block, found from the patient's code without scanning the others
+class _CallBlocks:
+    def __init__(self, codes, starts, nurses, patient_count):
+        self.starts = starts
+        self.nurses = nurses
+        self.block_start = np.searchsorted(codes, np.arange(patient_count), side='left')
+        self.block_end = np.searchsorted(codes, np.arange(patient_count), side='right')
+
+    # Position of the first call of each patient starting in [window_start, window_end], -1 when there is none
+    def FirstCallInWindow(self, patient_codes, window_start, window_end):
+        known = patient_codes >= 0
+        lo = np.where(known, self.block_start[np.maximum(patient_codes, 0)], 0)
+        hi = np.where(known, self.block_end[np.maximum(patient_codes, 0)], 0)
+
+        positions = _SearchBlocks(self.starts, lo, hi, window_start)
+        found = positions < hi
+        found[found] = self.starts[positions[found]] <= window_end[found]
+        return np.where(found, positions, -1)
+
+
+# Time until which every log that is still written holds all of its calls, None when no log tells
+# A log holds every call until its last call, or until it was last written when that is later. The write times (the
+# LastModified of the listing) are on the clock of S3, they are moved onto the clock of the calls by the newest call
+# of any log, which was made before the newest write. Idle logs, not written for CALL_LOG_IDLE_HOURS before the
+# newest write, get no new calls and do not hold back the others
+def _CompleteUntil(last_calls, written):
+    newest_written = max(written.values()) if written else None
+    newest_call = max(last_calls.values()) if last_calls else None
+    complete_until = []
+    for nurse_name in set(last_calls) | set(written):
+        times = [last_calls[nurse_name]] if nurse_name in last_calls else []
+        if nurse_name in written:
+            if written[nurse_name] < newest_written - pd.Timedelta(hours=CALL_LOG_IDLE_HOURS):
+                continue
+            if newest_call is not None:
+                times.append(newest_call - (newest_written - written[nurse_name]))
+        if times:
+            complete_until.append(max(times))
+    return min(complete_until) if complete_until else None
+
+
+# Calls of every nurse keyed by patient number (last 10 digits) and sorted by start time
+# A missed call is matched against every nurse's activity with one binary search in its patient's calls
+# written is when each log was last written (the LastModified of the listing), to tell until when the index is complete
+class GlobalPatientIndex:
+    def __init__(self, call_logs, written=None):
+        frames = []
+        last_calls = {}
+        nurse_names = list(call_logs)
+        for nurse_code, nurse_name in enumerate(nurse_names):
+            df = call_logs[nurse_name]
+            if PATIENT_NUMBER_COLUMN not in df.columns:
+                df = NormalizePhoneNumbers(df)
+            starts = df[START_TIME_COLUMN]
+            if not pd.api.types.is_datetime64_any_dtype(starts):
+                continue
+            if starts.notna().any():
+                last_calls[nurse_name] = starts.max()
+
+            keep = df[PATIENT_NUMBER_COLUMN].notna() & starts.notna()
+            frames.append(pd.DataFrame({
+                'patient': df.loc[keep, PATIENT_NUMBER_COLUMN].astype(object),
+                'start': starts[keep].astype('datetime64[ns]'),
+                'direction': df.loc[keep, DIRECTION_COLUMN].astype(object),
+                'duration': pd.to_numeric(df.loc[keep, DURATION_COLUMN], errors='coerce').astype('float64'),
+                'nurse': nurse_code,
+            }))
+
+        calls = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({
+            'patient': pd.Series(dtype=object),
+            'start': pd.Series(dtype='datetime64[ns]'),
+            'direction': pd.Series(dtype=object),
+            'duration': pd.Series(dtype='float64'),
+            'nurse': pd.Series(dtype='int64'),
+        })
+        codes, patient_numbers = pd.factorize(calls['patient'])
+        starts = calls['start'].to_numpy().view('int64')
+        order = np.lexsort((starts, codes))
+        directions = calls['direction'].astype('category')
+
+        self.patient_numbers = pd.Index(patient_numbers)
+        self.nurse_names = np.array(nurse_names, dtype=object)
+        self.codes = codes[order]
+        self.starts = starts[order]
+        self.direction_names = directions.cat.categories
+        self.directions = directions.cat.codes.to_numpy()[order]
+        self.outbound = (directions == 'OUTBOUND').to_numpy()[order]
+        self.duration = calls['duration'].to_numpy()[order]
+        self.nurses = calls['nurse'].to_numpy()[order]
+        # every call up to this time is in the index, for every log that is still written
+        written = {nurse_name: pd.Timestamp(written[nurse_name]) for nurse_name in nurse_names if nurse_name in (written or {})}
+        self.complete_until = _CompleteUntil(last_calls, written)
+        self.blocks = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Blocks of the outbound (nurse) or inbound (patient) calls lasting at least min_duration seconds, built on first use
+    def _Blocks(self, outbound, min_duration):
+        key = (outbound, min_duration)
+        with self.lock:
+            if key not in self.blocks:
+                keep = self.outbound == outbound
+                if min_duration:
+                    keep &= self.duration >= min_duration
+                self.blocks[key] = _CallBlocks(self.codes[keep], self.starts[keep], self.nurses[keep], len(self.patient_numbers))
+            return self.blocks[key]
+
+    # First call with each patient in [window_start, window_end] in any nurse's log
+    # Returns the start time of the call (NaT when there is none) and the nurse whose log has it
+    def FirstCallInWindow(self, patient_numbers, window_start, window_end, outbound, min_duration=0):
+        blocks = self._Blocks(outbound, min_duration)
+
+        patient_codes = self.patient_numbers.get_indexer(pd.Index(patient_numbers, dtype=object))
+        window_start = pd.to_datetime(window_start).astype('datetime64[ns]').to_numpy().view('int64')
+        window_end = pd.to_datetime(window_end).astype('datetime64[ns]').to_numpy().view('int64')
+        positions = blocks.FirstCallInWindow(patient_codes, window_start, window_end)
+
+        found = positions >= 0
+        call_times = np.full(len(positions), np.datetime64('NaT'), dtype='datetime64[ns]')
+        call_times[found] = blocks.starts[positions[found]].view('datetime64[ns]')
+        nurses = np.full(len(positions), None, dtype=object)
+        nurses[found] = self.nurse_names[blocks.nurses[positions[found]]]
+        return call_times, nurses
+
+
+# Get the calls with one patient from the index, optionally between two start times (inclusive)
+# The patient's calls are one block of the index sorted by start time, found with binary searches instead of a scan
+# Returns the start time, direction and duration of each call and the nurse whose log has it
+def GetPatientCalls(patient_index, patient_number, start=None, end=None):
+    patient_number = re.sub(r'\D', '', str(patient_number))[-10:]
+    code = patient_index.patient_numbers.get_indexer([patient_number])[0]
+
+    lo = hi = 0
+    if code >= 0:
+        lo = np.searchsorted(patient_index.codes, code, side='left')
+        hi = np.searchsorted(patient_index.codes, code, side='right')
+        block_starts = patient_index.starts[lo:hi]
+        first = np.searchsorted(block_starts, pd.Timestamp(start).value, side='left') if start is not None else 0
+        last = np.searchsorted(block_starts, pd.Timestamp(end).value, side='right') if end is not None else len(block_starts)
+        lo, hi = lo + first, lo + max(first, last)
+
+    return pd.DataFrame({
+        START_TIME_COLUMN: patient_index.starts[lo:hi].view('datetime64[ns]'),
+        DIRECTION_COLUMN: pd.Categorical.from_codes(patient_index.directions[lo:hi], patient_index.direction_names),
+        DURATION_COLUMN: patient_index.duration[lo:hi],
+        'Nurse': patient_index.nurse_names[patient_index.nurses[lo:hi]],
+    })
+
+
+# Build the index from prepared call logs, keyed by nurse name
+# written is the LastModified of each log in the listing, without it every log holds back settling until its last call
+def BuildGlobalPatientIndex(call_logs, written=None):
+    with Trace('patient_index.build', nurses=len(call_logs)) as span:
+        patient_index = GlobalPatientIndex(call_logs, written)
+        span.Set(rows=len(patient_index), patients=len(patient_index.patient_numbers))
+    return patient_index
+
+
+_patient_indexes = OrderedDict()
+_patient_indexes_lock = threading.Lock()
+_patient_index_builds = KeyedLocks()
+
+# Columns of a log the index is built from
+INDEX_READ_COLUMNS = [FROM_COLUMN, TO_COLUMN, DIRECTION_COLUMN, START_TIME_COLUMN, DURATION_COLUMN]
+INDEX_COLUMNS = [PATIENT_NUMBER_COLUMN, START_TIME_COLUMN, DIRECTION_COLUMN, DURATION_COLUMN]
+
+
+# Columns of one chunk of a log the index keeps, the categories of each chunk differ so they are merged at the end
+def _IndexChunk(chunk):
+    chunk = PrepareCallLog(chunk)
+    chunk = chunk.loc[chunk[START_TIME_COLUMN].notna(), INDEX_COLUMNS]
+    return chunk.astype({PATIENT_NUMBER_COLUMN: object, DIRECTION_COLUMN: object})
+
+
+# Calls of one nurse's whole log the index needs, kept in FRAME_CACHE until the log changes
+def _IndexCalls(calls):
+    calls = calls.reindex(columns=INDEX_COLUMNS)
+    return calls.astype({PATIENT_NUMBER_COLUMN: 'category', DIRECTION_COLUMN: 'category', START_TIME_COLUMN: 'datetime64[ns]'})
+
+
+# Index of every nurse's whole log, a missed call's call backs are looked up by the time window of the call
+# Built once per version of the logs (their ETags in the shared listing of the bucket), the calls of a log that did not
+# change since the last build are taken from FRAME_CACHE instead of read again. Returns None when cross-nurse call backs are off or the bucket could not be listed
+def GetGlobalPatientIndex():
+    if not CROSS_NURSE_CALL_BACKS:
+        return None
+
+    try:
+        csv_objects = aws_support.GetCsvObjects()
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        print('Failed to list the call logs for the patient index')
+        return None
+
+    versions = tuple(sorted((obj['Key'][:-len('.csv')], obj['ETag']) for obj in csv_objects))
+    written = {obj['Key'][:-len('.csv')]: obj['LastModified'] for obj in csv_objects}
+    # one build per version, a thread asking for it meanwhile gets the index this one builds
+    with _patient_index_builds.Hold(versions):
+        return _GetGlobalPatientIndex(versions, written)
+
+
+def _GetGlobalPatientIndex(versions, written):
+    with _patient_indexes_lock:
+        patient_index = _patient_indexes.get(versions)
+        if patient_index is not None:
+            _patient_indexes.move_to_end(versions)
+            return patient_index
+
+    # every log is read a chunk at a time, only the few columns of the index are kept of each chunk
+    call_logs, error_dict = aws_support.GetNurseCallLogsBetween(
+        [nurse_name for nurse_name, _ in versions],
+        None,
+        None,
+        columns=INDEX_READ_COLUMNS,
+        dtype=CALL_LOG_DTYPES,
+        prepare_chunk=_IndexChunk,
+        prepare=_IndexCalls,
+    )
+    patient_index = BuildGlobalPatientIndex(call_logs, written)
+    if error_dict:
+        # not kept, the next evaluation tries the missing logs again, and nothing settles without their calls
+        print('The patient index is missing the calls of', ', '.join(error_dict))
+        patient_index.complete_until = None
+        return patient_index
+
+    with _patient_indexes_lock:
+        _patient_indexes[versions] = patient_index
+        while len(_patient_indexes) > PATIENT_INDEX_CACHE_SIZE:
+            _patient_indexes.popitem(last=False)
+    return patient_index
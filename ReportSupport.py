@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import AWSSupport as aws_support
+from CallEvaluationSupport import (
+    CALL_LOG_COLUMNS,
+    CALL_LOG_DTYPES,
+    CallLogWindow,
+    PrepareCallLog,
+    SelectDates,
+    START_TIME_COLUMN,
+    SummarizeCalls,
+)
+from EvaluationStoreSupport import EvaluateNurseCalls
+from ExportSupport import DETAIL_COLUMNS, DETAIL_SCHEMA, DetailRows, EXPORT_FORMATS, OpenExportWriter, WriteFrame
+from PatientIndexSupport import GetGlobalPatientIndex
+from TeamEvaluationSupport import RankTeam, TEAM_MAX_WORKERS
+
+# Stages of the report pipeline, in order
+REPORT_STAGES = ['load', 'classify', 'aggregate', 'render', 'write']
+
+# Report formats the CLI can write
+REPORT_FORMATS = list(EXPORT_FORMATS)
+
+
+# Add the time spent in a stage to timings
+@contextmanager
+def StageTimer(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] += time.perf_counter() - started
+
+
+# Load, clean, classify and aggregate the calls of one nurse between two dates, the same steps as the dashboard
+# Returns {'summary': row of the summary report, 'detail': detail report or None, 'timings': seconds per stage}
+def RunNurseReport(nurse_name, from_date, to_date, detail=True):
+    timings = defaultdict(float)
+
+    with StageTimer(timings, 'load'):
+        start, end = CallLogWindow(from_date, to_date)
+        df = aws_support.GetNurseCallLogBetween(nurse_name, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog)
+    if df is None:
+        return {'summary': {'Nurse': nurse_name, 'Error': 'Failed to load the data'}, 'detail': None, 'timings': dict(timings)}
+
+    with StageTimer(timings, 'classify'):
+        filtered_df = SelectDates(df, from_date, to_date)
+        evaluation = EvaluateNurseCalls(nurse_name, filtered_df, df, GetGlobalPatientIndex())
+
+    with StageTimer(timings, 'aggregate'):
+        summary = SummarizeCalls(filtered_df, evaluation)
+        summary['Nurse'] = nurse_name
+
+    detail_df = None
+    if detail:
+        with StageTimer(timings, 'render'):
+            detail_df = DetailRows(nurse_name, filtered_df, evaluation)
+
+    return {'summary': summary, 'detail': detail_df, 'timings': dict(timings)}
+
+
+# Run the report of every nurse, in parallel worker processes when max_workers > 1
+# Returns the summary report ranked like the team dashboard, the detail report and the total seconds per stage
+def RunReports(nurse_names, from_date, to_date, detail=True, max_workers=None):
+    if max_workers is None:
+        max_workers = TEAM_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(nurse_names)))
+
+    results = []
+    if max_workers == 1:
+        for nurse_name in nurse_names:
+            results.append(RunNurseReport(nurse_name, from_date, to_date, detail=detail))
+    else:
+        # spawn rather than fork, the parent's S3 client and threads must not be copied into the workers
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(RunNurseReport, nurse_name, from_date, to_date, detail): nurse_name for nurse_name in nurse_names}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({'summary': {'Nurse': futures[future], 'Error': str(e)}, 'detail': None, 'timings': {}})
+
+    timings = defaultdict(float)
+    for result in results:
+        for stage, seconds in result['timings'].items():
+            timings[stage] += seconds
+
+    summary_df = RankTeam([result['summary'] for result in results])
+
+    detail_df = None
+    if detail:
+        details = [result['detail'] for result in results if result['detail'] is not None]
+        detail_df = pd.concat(details, ignore_index=True) if details else pd.DataFrame(columns=DETAIL_COLUMNS)
+        detail_df = detail_df.sort_values(['Nurse', START_TIME_COLUMN], kind='mergesort', ignore_index=True)
+
+    return summary_df, detail_df, dict(timings)
+
+
+# Write a report as csv, parquet or xlsx, streamed to the file in chunks of rows
+def WriteReport(df, path, report_format):
+    schema = DETAIL_SCHEMA if list(df.columns) == DETAIL_COLUMNS else None
+    writer = OpenExportWriter(path, report_format, schema=schema)
+    WriteFrame(writer, df)
+    writer.Close()
+
+
+def PrintTimings(timings, wall_seconds):
+    print('Stage timings (seconds, summed over nurses):')
+    for stage in REPORT_STAGES:
+        if stage in timings:
+            print(f"  {stage:<10} {timings[stage]:8.2f}")
+    print(f"  {'wall':<10} {wall_seconds:8.2f}")
+
+
+def ParseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Write the nurse phone call performance reports without the dashboard.')
+    parser.add_argument('--from-date', required=True, type=lambda value: pd.Timestamp(value).date(), help='first day, e.g. 2024-01-01')
+    parser.add_argument('--to-date', required=True, type=lambda value: pd.Timestamp(value).date(), help='last day (inclusive)')
+    parser.add_argument('--nurse', action='append', dest='nurses', help='nurse to report on, repeat for several (default: every nurse in the nurse list)')
+    parser.add_argument('--output-dir', default='reports', help='directory the reports are written to')
+    parser.add_argument('--format', action='append', dest='formats', choices=REPORT_FORMATS, help='report format, repeat for several (default: csv)')
+    parser.add_argument('--summary-only', action='store_true', help='do not write the per-call detail report')
+    parser.add_argument('--workers', type=int, default=None, help=f'worker processes (default: {TEAM_MAX_WORKERS})')
+    return parser.parse_args(argv)
+
+
+# Command line entry point, e.g.
+# python ReportSupport.py --from-date 2024-01-01 --to-date 2024-01-31 --format csv --format xlsx
+def main(argv=None):
+    args = ParseArguments(argv)
+    if args.from_date > args.to_date:
+        print('--from-date must not be after --to-date')
+        return 2
+
+    nurse_names = args.nurses
+    if not nurse_names:
+        nurse_list_df = aws_support.GetNurseListFromServer()
+        if nurse_list_df is None:
+            print('Failed to load the nurse list')
+            return 1
+        nurse_names = list(nurse_list_df['Name'].values)
+
+    started = time.perf_counter()
+    # the worker processes share no cache, bring the local copy of the logs up to date once so each one reads from disk
+    try:
+        sync = aws_support.SyncCsvDataFromS3()
+        print('Synced the call logs:', len(sync['changed']), 'changed,', len(sync['removed']), 'removed,', len(sync['unchanged']), 'unchanged')
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        print('Failed to sync the call logs, they are read from the server')
+    summary_df, detail_df, timings = RunReports(nurse_names, args.from_date, args.to_date, detail=not args.summary_only, max_workers=args.workers)
+    timings = defaultdict(float, timings)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    name = f"{args.from_date}_{args.to_date}"
+    with StageTimer(timings, 'write'):
+        for report_format in args.formats or ['csv']:
+            reports = [('summary', summary_df)]
+            if detail_df is not None:
+                reports.append(('detail', detail_df))
+            for report_name, report_df in reports:
+                path = os.path.join(args.output_dir, f"{report_name}_{name}.{report_format}")
+                WriteReport(report_df, path, report_format)
+                print('Wrote', path)
+
+    print(summary_df.to_string(index=False))
+    PrintTimings(timings, time.perf_counter() - started)
+
+    failed = summary_df['Error'].notna().sum()
+    return 1 if failed == len(summary_df) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
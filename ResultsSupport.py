@@ -0,0 +1,151 @@
+import os
+import re
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from CallEvaluationSupport import (
+    ANSWER_TIME_COLUMN,
+    CALL_BACK_BY_COLUMN,
+    CALL_BACK_DELAY_COLUMN,
+    CALL_BACK_NURSE_COLUMN,
+    CALL_BACK_TIME_COLUMN,
+    DIRECTION_COLUMN,
+    DURATION_COLUMN,
+    END_TIME_COLUMN,
+    FROM_COLUMN,
+    FROM_DIGITS_COLUMN,
+    OUTCOME_COLUMN,
+    RenderPerformanceText,
+    SelectOutcomes,
+    START_TIME_COLUMN,
+    TO_COLUMN,
+    TO_DIGITS_COLUMN,
+)
+from InstrumentationSupport import Trace
+
+PERFORMANCE_COLUMN = 'Performance'
+
+# Columns of the results table
+RESULT_COLUMNS = [FROM_COLUMN, TO_COLUMN, START_TIME_COLUMN, DURATION_COLUMN, DIRECTION_COLUMN, PERFORMANCE_COLUMN]
+
+# Wider view for the criteria about missed calls, with the call back found for each one
+MISSED_RESULT_COLUMNS = [
+    FROM_COLUMN,
+    TO_COLUMN,
+    START_TIME_COLUMN,
+    ANSWER_TIME_COLUMN,
+    END_TIME_COLUMN,
+    DURATION_COLUMN,
+    DIRECTION_COLUMN,
+    OUTCOME_COLUMN,
+    CALL_BACK_TIME_COLUMN,
+    CALL_BACK_BY_COLUMN,
+    CALL_BACK_NURSE_COLUMN,
+    CALL_BACK_DELAY_COLUMN,
+    PERFORMANCE_COLUMN,
+]
+
+# Columns the results can be sorted by
+SORT_COLUMNS = [START_TIME_COLUMN, DURATION_COLUMN, FROM_COLUMN, TO_COLUMN, DIRECTION_COLUMN, OUTCOME_COLUMN, CALL_BACK_DELAY_COLUMN]
+
+RESULT_PAGE_SIZES = [25, 50, 100, 250]
+
+# Rows written per chunk of the csv export
+EXPORT_CHUNK_ROWS = 50000
+
+
+# Columns of the results table for a performance criteria of the dashboard
+def ResultColumns(performance_criteria):
+    if performance_criteria in ('Missed', 'Follow-up >1hr and <10hr'):
+        return MISSED_RESULT_COLUMNS
+    return RESULT_COLUMNS
+
+
+# Positions of the calls shown for a criteria, filtered by a phone number search and sorted
+# Only the positions are computed, no rows are copied
+def SelectResults(calls_df, evaluation, performance_criteria, search=None, sort_column=START_TIME_COLUMN, ascending=True):
+    with Trace('results.select') as span:
+        selected = SelectOutcomes(evaluation[OUTCOME_COLUMN], performance_criteria).to_numpy()
+
+        # match the digits typed against the cleaned numbers of either side of the call
+        search_digits = re.sub(r'\D', '', search or '')
+        if search_digits:
+            from_digits = calls_df[FROM_DIGITS_COLUMN].astype(object)
+            to_digits = calls_df[TO_DIGITS_COLUMN].astype(object)
+            matches = (
+                from_digits.str.contains(search_digits, regex=False, na=False)
+                | to_digits.str.contains(search_digits, regex=False, na=False)
+            )
+            selected = selected & matches.to_numpy()
+
+        positions = np.flatnonzero(selected)
+
+        if sort_column is not None:
+            values = evaluation[sort_column] if sort_column in evaluation.columns else calls_df[sort_column]
+            values = values.iloc[positions]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # text sorts by its value, outcomes by their order in OUTCOMES
+                values = values.cat.codes if sort_column == OUTCOME_COLUMN else values.astype(object)
+            order = values.reset_index(drop=True).sort_values(ascending=ascending, kind='mergesort', na_position='last').index
+            positions = positions[order.to_numpy()]
+
+        span.Set(rows=len(positions))
+    return positions
+
+
+# Number of pages of the results
+def PageCount(positions, page_size):
+    return max(1, math.ceil(len(positions) / page_size))
+
+
+# Rows of one page of the results (pages start at 1), the performance text is only written for these rows
+def GetResultsPage(calls_df, evaluation, positions, page, page_size, columns=RESULT_COLUMNS):
+    with Trace('results.page') as span:
+        page_positions = positions[(page - 1) * page_size:page * page_size]
+        page_df = _ResultRows(calls_df, evaluation, page_positions, columns)
+        span.SetFrame(page_df)
+    return page_df
+
+
+def _ResultRows(calls_df, evaluation, positions, columns):
+    rows_df = calls_df.iloc[positions]
+    rows_evaluation = evaluation.iloc[positions]
+
+    result_df = rows_df[[column for column in columns if column in rows_df.columns]]
+    result_df = result_df.assign(**{
+        column: rows_evaluation[column] for column in columns if column in rows_evaluation.columns
+    })
+    if PERFORMANCE_COLUMN in columns:
+        result_df = result_df.assign(**{PERFORMANCE_COLUMN: RenderPerformanceText(rows_df, rows_evaluation)})
+
+    return result_df[columns]
+
+
+# Write every selected result as csv, one chunk of rows at a time, yields the encoded chunks
+# Only one chunk of rendered rows is in memory at a time
+def IterResultsCsv(calls_df, evaluation, positions, columns=RESULT_COLUMNS, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, max(len(positions), 1), chunk_rows):
+        chunk_df = _ResultRows(calls_df, evaluation, positions[start:start + chunk_rows], columns)
+        yield chunk_df.to_csv(index=False, header=start == 0).encode()
+
+
+# Export every selected result as a csv file at path, streamed to disk one chunk at a time
+# The file is written under a temporary name and renamed once complete, returns its size in bytes
+def ExportResultsCsv(path, calls_df, evaluation, positions, columns=RESULT_COLUMNS):
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with Trace('results.export', rows=len(positions)) as span:
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in IterResultsCsv(calls_df, evaluation, positions, columns):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        span.Set(bytes=size)
+    return size
@@ -0,0 +1,201 @@
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import AWSSupport as aws_support
+from CallEvaluationSupport import (
+    CALL_LOG_COLUMNS,
+    CALL_LOG_DTYPES,
+    CALLBACK_WINDOW_10HR,
+    CallLogWindow,
+    CountersFromOutcomeCounts,
+    DIRECTION_COLUMN,
+    OUTCOME_COLUMN,
+    OUTCOMES,
+    PrepareCallLog,
+    SelectDates,
+    START_TIME_COLUMN,
+    SummarizeCounts,
+)
+from EvaluationStoreSupport import EVALUATION_STORE_NAME, EvaluateNurseCalls
+from InstrumentationSupport import Trace
+from PatientIndexSupport import CROSS_NURSE_CALL_BACKS, GetGlobalPatientIndex
+
+# Daily rollups of settled days, one Arrow file per nurse
+ROLLUP_DIR = os.environ.get(
+    'ROLLUP_DIR',
+    os.path.join(aws_support.S3_CACHE_DIR, 'rollups', EVALUATION_STORE_NAME),
+)
+
+# Columns of a rollup: the number of calls of each outcome code and each direction, one row per day
+DIRECTION_COUNT_COLUMNS = {'INBOUND': 'Inbound Calls', 'OUTBOUND': 'Outbound Calls'}
+ROLLUP_COLUMNS = OUTCOMES + list(DIRECTION_COUNT_COLUMNS.values())
+DAY_COLUMN = 'Day'
+ETAG_KEY = b'etag'
+
+
+# Count the evaluated calls of each day by outcome and direction, days between from_date and to_date without calls get zeros
+def DailyRollup(calls_df, evaluation, from_date=None, to_date=None):
+    days = calls_df[START_TIME_COLUMN].dt.normalize()
+
+    outcome_counts = pd.crosstab(days, evaluation[OUTCOME_COLUMN].astype(object))
+    direction_counts = pd.crosstab(days, calls_df[DIRECTION_COLUMN].astype(object))
+    direction_counts = direction_counts.reindex(columns=list(DIRECTION_COUNT_COLUMNS), fill_value=0).rename(columns=DIRECTION_COUNT_COLUMNS)
+
+    rollup = pd.concat([outcome_counts.reindex(columns=OUTCOMES, fill_value=0), direction_counts], axis=1)
+    if from_date is not None and to_date is not None:
+        rollup = rollup.reindex(pd.date_range(from_date, to_date, freq='D'))
+    rollup = rollup.fillna(0).astype('int64')
+    rollup.index.name = DAY_COLUMN
+
+    return rollup[ROLLUP_COLUMNS]
+
+
+# Headline numbers of the dashboard for the days of a rollup, the same as SummarizeCalls on the calls of those days
+def SummarizeRollup(rollup):
+    totals = rollup.sum()
+    direction_counts = pd.Series({direction: totals[column] for direction, column in DIRECTION_COUNT_COLUMNS.items()})
+    return SummarizeCounts(totals[OUTCOMES], direction_counts)
+
+
+# Dashboard counters (see CountOutcomes) for the days of a rollup
+def CountRollup(rollup):
+    return CountersFromOutcomeCounts(rollup[OUTCOMES].sum())
+
+
+# Daily rollups of settled days, persisted per nurse and shared by every session of this process
+# A day is settled once the log holds every call up to 10 hours after its end, its counts can no longer change
+# unless the log itself is changed (e.g. backfilled), so the rollup of a nurse is kept with the ETag of the log it counted
+class RollupStore:
+    def __init__(self, rollup_dir):
+        self.rollup_dir = rollup_dir
+        self.nurses = {}
+        self.lock = threading.Lock()
+
+    def _Path(self, nurse_name):
+        return os.path.join(self.rollup_dir, f"{nurse_name}.arrow")
+
+    # Read the stored rollup of a nurse, returns it and the ETag of the log it was counted from
+    def _Read(self, nurse_name):
+        path = self._Path(nurse_name)
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, None
+
+        state = self.nurses.get(nurse_name)
+        if state is not None and state['modified'] == modified:
+            return state['rollup'], state['etag']
+
+        table = feather.read_table(path)
+        metadata = table.schema.metadata or {}
+        etag = metadata[ETAG_KEY].decode() if ETAG_KEY in metadata else None
+        rollup = table.to_pandas().set_index(DAY_COLUMN)
+        self.nurses[nurse_name] = {'rollup': rollup, 'etag': etag, 'modified': modified}
+        return rollup, etag
+
+    # Rollup of every settled day stored for a nurse from the version etag of its log, an empty one when there is none
+    # Rollups written by other processes (e.g. the team evaluation workers) are picked up too
+    def Load(self, nurse_name, etag):
+        with self.lock:
+            try:
+                rollup, stored_etag = self._Read(nurse_name)
+            except Exception as e:
+                print(f"An error occurred: {str(e)}")
+                print('Failed to read the rollup of', nurse_name)
+                rollup = None
+
+        if rollup is None or etag is None or stored_etag != etag:
+            # counted from another version of the log, every day is counted again
+            rollup = pd.DataFrame(columns=ROLLUP_COLUMNS, index=pd.DatetimeIndex([], name=DAY_COLUMN), dtype='int64')
+        return rollup
+
+    # Add the rollup of settled days counted from the version etag of the log
+    # Days already stored are replaced, and the days counted from another version are dropped
+    def Save(self, nurse_name, rollup, etag):
+        if rollup.empty or etag is None:
+            return
+
+        with self.lock:
+            try:
+                stored, stored_etag = self._Read(nurse_name)
+                if stored is not None and stored_etag == etag:
+                    rollup = pd.concat([stored[~stored.index.isin(rollup.index)], rollup]).sort_index()
+
+                path = self._Path(nurse_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                table = pa.Table.from_pandas(rollup.reset_index(), preserve_index=False)
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}), ETAG_KEY: etag.encode()})
+                feather.write_feather(table, temp_path, compression='uncompressed')
+                os.replace(temp_path, path)
+
+                self.nurses[nurse_name] = {'rollup': rollup, 'etag': etag, 'modified': os.stat(path).st_mtime_ns}
+            except Exception as e:
+                print(f"An error occurred: {str(e)}")
+                print('Failed to save the rollup of', nurse_name)
+
+    # Drop the rollups of one nurse, or of every nurse
+    def Invalidate(self, nurse_name=None):
+        with self.lock:
+            nurse_names = [nurse_name] if nurse_name is not None else list(self.nurses)
+            for name in nurse_names:
+                self.nurses.pop(name, None)
+                try:
+                    os.remove(self._Path(name))
+                except OSError:
+                    pass
+
+
+ROLLUP_STORE = RollupStore(ROLLUP_DIR)
+
+
+# Daily rollup of one nurse between two dates (inclusive)
+# Stored days are read from ROLLUP_STORE, only the days missing from it are loaded and classified,
+# and the ones that have settled are stored for next time. Every day is counted again once the log changes.
+# patient_index is the index of every log when the caller already has it (see GetGlobalPatientIndex)
+# Returns None when the calls could not be loaded
+def GetNurseRollup(nurse_name, from_date, to_date, patient_index=None):
+    days = pd.date_range(from_date, to_date, freq='D', name=DAY_COLUMN)
+
+    with Trace('rollup.get', nurse=nurse_name) as span:
+        etag = aws_support.GetNurseCallLogETag(nurse_name)
+        rollup = ROLLUP_STORE.Load(nurse_name, etag)
+        missing = days.difference(rollup.index)
+        span.Set(days=len(days), missing_days=len(missing))
+        if len(missing) == 0:
+            return rollup.reindex(days)
+
+        first_day, last_day = missing.min().date(), missing.max().date()
+        start, end = CallLogWindow(first_day, last_day)
+        df = aws_support.GetNurseCallLogBetween(nurse_name, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog)
+        if df is None:
+            return None
+
+        calls_df = SelectDates(df, first_day, last_day)
+        if patient_index is None:
+            patient_index = GetGlobalPatientIndex()
+        evaluation = EvaluateNurseCalls(nurse_name, calls_df, df, patient_index)
+        fresh = DailyRollup(calls_df, evaluation, first_day, last_day)
+
+        # a day is settled once the logs hold every call until 10 hours after its end, as for the evaluation store
+        # the window loaded ends 10 hours after the last day, the patient index (or without it the last call of the
+        # whole log) says until when the logs are complete
+        if patient_index is not None:
+            complete_until = patient_index.complete_until
+        else:
+            time_range = aws_support.GetNurseCallLogTimeRange(nurse_name)
+            complete_until = time_range[1] if time_range is not None else pd.NaT
+        if CROSS_NURSE_CALL_BACKS and patient_index is None:
+            # counted without the other nurses' calls, not final
+            complete_until = pd.NaT
+        if complete_until is not None and pd.notna(complete_until):
+            settled_until = complete_until - CALLBACK_WINDOW_10HR
+            settled = fresh.index + pd.Timedelta(days=1) <= settled_until
+            ROLLUP_STORE.Save(nurse_name, fresh[settled], etag)
+
+        rollup = pd.concat([rollup[~rollup.index.isin(fresh.index)], fresh])
+        return rollup.reindex(days)
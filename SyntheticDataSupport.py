@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+from CallEvaluationSupport import (
+    ANSWER_TIME_COLUMN,
+    CALL_LOG_COLUMNS,
+    DIRECTION_COLUMN,
+    DURATION_COLUMN,
+    END_TIME_COLUMN,
+    FROM_COLUMN,
+    NO_ANSWER_TIME,
+    START_TIME_COLUMN,
+    TO_COLUMN,
+)
+
+# Time format of the synthetic logs, the one the phone system exports
+SYNTHETIC_DATE_FORMAT = '%m/%d/%Y'
+SYNTHETIC_CLOCK_FORMAT = '%I:%M:%S %p'
+SYNTHETIC_TIME_FORMAT = f"{SYNTHETIC_DATE_FORMAT} {SYNTHETIC_CLOCK_FORMAT}"
+
+# Calls a nurse makes or receives on an average working day
+SYNTHETIC_CALLS_PER_DAY = 400
+
+# Share of each direction, the rest are internal calls the classifier ignores
+SYNTHETIC_INBOUND_SHARE = 0.45
+SYNTHETIC_OUTBOUND_SHARE = 0.45
+
+# Share of inbound calls nobody answers
+SYNTHETIC_MISSED_SHARE = 0.3
+
+# What follows a missed call, the rest get no call back at all
+SYNTHETIC_FOLLOW_UPS = {
+    'nurse_1hr': 0.45,
+    'patient_1hr': 0.15,
+    'nurse_10hr': 0.15,
+    'patient_10hr': 0.05,
+}
+
+
+# Format 10-digit numbers the different ways the phone system writes them
+def _FormatNumbers(numbers, rng):
+    text = pd.Series(numbers).astype(str)
+    area, prefix, line = text.str[:3], text.str[3:6], text.str[6:]
+    styles = rng.integers(0, 3, size=len(text))
+    return np.where(
+        styles == 0, '(' + area + ') ' + prefix + '-' + line,
+        np.where(styles == 1, '+1 ' + area + '-' + prefix + '-' + line, text),
+    )
+
+
+# Write times as text, formatting each distinct day and time of day once instead of every row
+def _FormatTimes(times):
+    days = times.dt.normalize()
+    day_codes, unique_days = pd.factorize(days)
+    clock_codes, unique_clocks = pd.factorize(times - days)
+
+    day_text = unique_days.strftime(SYNTHETIC_DATE_FORMAT).to_numpy(dtype=object)[day_codes]
+    clock_text = (pd.Timestamp(0) + unique_clocks).strftime(SYNTHETIC_CLOCK_FORMAT).to_numpy(dtype=object)[clock_codes]
+    return day_text + ' ' + clock_text
+
+
+# Generate a realistic call log of one nurse with the columns of the real logs, as pd.read_csv returns them
+# Inbound calls are answered or missed, and missed calls are followed by nurse or patient call backs
+# within 1 hour, between 1 and 10 hours, or not at all, in the shares given above
+# The same seed always gives the same log
+def GenerateCallLog(rows, seed=0, start='2024-01-01', calls_per_day=SYNTHETIC_CALLS_PER_DAY, patients=None):
+    rng = np.random.default_rng(seed)
+    if patients is None:
+        patients = max(10, rows // 20)
+
+    nurse_lines = 6175550000 + np.arange(3)
+    patient_numbers = 8005550000 + rng.choice(1000000, size=patients, replace=False)
+
+    # first calls, spread over working hours of enough days to hold the log
+    days = max(1, int(np.ceil(rows / calls_per_day)))
+    day = rng.integers(0, days, size=rows)
+    seconds = rng.integers(8 * 3600, 18 * 3600, size=rows)
+    start_times = pd.Timestamp(start) + pd.to_timedelta(day * 86400 + seconds, unit='s')
+
+    direction = rng.choice(
+        np.array(['INBOUND', 'OUTBOUND', 'INTERNAL']),
+        size=rows,
+        p=[SYNTHETIC_INBOUND_SHARE, SYNTHETIC_OUTBOUND_SHARE, 1 - SYNTHETIC_INBOUND_SHARE - SYNTHETIC_OUTBOUND_SHARE],
+    )
+    patient = rng.integers(0, patients, size=rows)
+    nurse_line = rng.integers(0, len(nurse_lines), size=rows)
+    missed = (direction == 'INBOUND') & (rng.random(rows) < SYNTHETIC_MISSED_SHARE)
+
+    # call backs replace the last calls of the log, so the log keeps the requested size
+    follow_up = np.full(rows, '', dtype=object)
+    missed_index = np.flatnonzero(missed)
+    kinds = list(SYNTHETIC_FOLLOW_UPS)
+    shares = list(SYNTHETIC_FOLLOW_UPS.values())
+    follow_up[missed_index] = rng.choice(kinds + ['none'], size=len(missed_index), p=shares + [1 - sum(shares)])
+    # missed calls come from the first half of the rows and their call backs overwrite the last quarter
+    has_follow_up = np.flatnonzero((follow_up != '') & (follow_up != 'none'))
+    has_follow_up = has_follow_up[has_follow_up < rows // 2][:rows // 4]
+    replaced = rows - 1 - np.arange(len(has_follow_up))
+
+    kind = follow_up[has_follow_up]
+    within_1hr = np.isin(kind, ['nurse_1hr', 'patient_1hr'])
+    delay = np.where(within_1hr, rng.integers(60, 3600, size=len(kind)), rng.integers(3600 + 60, 10 * 3600, size=len(kind)))
+    start_times = start_times.to_numpy(copy=True)
+    start_times[replaced] = start_times[has_follow_up] + pd.to_timedelta(delay, unit='s').to_numpy()
+    by_nurse = np.isin(kind, ['nurse_1hr', 'nurse_10hr'])
+    direction[replaced] = np.where(by_nurse, 'OUTBOUND', 'INBOUND')
+    patient[replaced] = patient[has_follow_up]
+    nurse_line[replaced] = nurse_line[has_follow_up]
+    missed[replaced] = False
+
+    # how long the phone rang, and how long the call lasted
+    ring = rng.integers(2, 25, size=rows)
+    duration = np.maximum(1, rng.lognormal(mean=4.5, sigma=1.0, size=rows).astype(np.int64))
+    short = rng.random(rows) < 0.15
+    duration[short] = rng.integers(1, 30, size=int(short.sum()))
+    # most missed calls last no time, a few went to a voicemail that counts as a 30 second call
+    voicemail = missed & (rng.random(rows) < 0.1)
+    duration[missed & ~voicemail] = 0
+    duration[voicemail] = rng.integers(30, 120, size=int(voicemail.sum()))
+    # patients calling back must talk for at least 30 seconds to count
+    duration[replaced[~by_nurse]] = np.maximum(duration[replaced[~by_nurse]], 30)
+
+    start_times = pd.Series(start_times)
+    answer_times = start_times + pd.to_timedelta(ring, unit='s')
+    end_times = answer_times + pd.to_timedelta(duration, unit='s')
+
+    patient_text = _FormatNumbers(patient_numbers[patient], rng)
+    nurse_text = _FormatNumbers(nurse_lines[nurse_line], rng)
+    inbound = direction == 'INBOUND'
+
+    df = pd.DataFrame({
+        FROM_COLUMN: np.where(inbound, patient_text, nurse_text),
+        TO_COLUMN: np.where(inbound, nurse_text, patient_text),
+        DIRECTION_COLUMN: direction,
+        START_TIME_COLUMN: start_times,
+        ANSWER_TIME_COLUMN: answer_times,
+        END_TIME_COLUMN: end_times,
+        DURATION_COLUMN: duration,
+    })
+    order = np.argsort(df[START_TIME_COLUMN].to_numpy(), kind='mergesort')
+    df = df.iloc[order].reset_index(drop=True)
+    missed = missed[order]
+
+    # the times are written as text, like the csv export
+    for column in (START_TIME_COLUMN, ANSWER_TIME_COLUMN, END_TIME_COLUMN):
+        df[column] = _FormatTimes(df[column])
+    df.loc[missed, ANSWER_TIME_COLUMN] = NO_ANSWER_TIME
+    hung_up = missed & (df[DURATION_COLUMN] == 0).to_numpy()
+    df.loc[hung_up, END_TIME_COLUMN] = df.loc[hung_up, START_TIME_COLUMN]
+
+    return df[CALL_LOG_COLUMNS]
+
+
+# Generate the call logs of several nurses as csv text, keyed by file name like the bucket
+def GenerateCallLogCsvs(nurse_names, rows, seed=0, start='2024-01-01'):
+    return {
+        f"{nurse_name}.csv": GenerateCallLog(rows, seed=seed + i, start=start).to_csv(index=False)
+        for i, nurse_name in enumerate(nurse_names)
+    }
@@ -0,0 +1,77 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from InstrumentationSupport import InContext, Trace
+from PatientIndexSupport import GetGlobalPatientIndex
+from RollupSupport import GetNurseRollup, SummarizeRollup
+
+# Number of nurses evaluated at the same time, one thread each
+TEAM_MAX_WORKERS = int(os.environ.get('TEAM_MAX_WORKERS', os.cpu_count() or 1))
+
+# Columns of the team table, in order
+TEAM_COLUMNS = [
+    'Rank',
+    'Nurse',
+    'Good %',
+    'Bad %',
+    'Inbound Calls',
+    'Outbound Calls',
+    'Answered',
+    'Missed',
+    'No Follow-up',
+    'Follow-up >1hr and <10hr',
+    'Follow-up <1hr',
+    'Error',
+]
+
+
+# Summarize one nurse's calls between two dates from the daily rollups, returns one row of the team table
+# Only the days missing from the rollup store are loaded and classified
+def SummarizeNurse(nurse_name, from_date, to_date, patient_index=None):
+    rollup = GetNurseRollup(nurse_name, from_date, to_date, patient_index=patient_index)
+    if rollup is None:
+        return {'Nurse': nurse_name, 'Error': 'Failed to load the data'}
+
+    summary = SummarizeRollup(rollup)
+    summary['Nurse'] = nurse_name
+    return summary
+
+
+# Evaluate every nurse in parallel, one thread per nurse at a time
+# The threads share the patient index, built once before they start, and the caches of this process (FRAME_CACHE,
+# the rollup and evaluation stores), so a rerun only reads what changed. The parsing and the searches they spend
+# their time in run in pyarrow and numpy, which release the GIL
+# Returns the team table ranked by Good %, nurses that failed are listed last with their error
+def EvaluateTeam(nurse_names, from_date, to_date, max_workers=None):
+    if max_workers is None:
+        max_workers = TEAM_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(nurse_names)))
+
+    with Trace('team.index'):
+        patient_index = GetGlobalPatientIndex()
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='team') as executor:
+        # the spans of the nurses belong to the caller's page run
+        futures = {
+            executor.submit(InContext(SummarizeNurse), nurse_name, from_date, to_date, patient_index): nurse_name
+            for nurse_name in nurse_names
+        }
+        for future in as_completed(futures):
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append({'Nurse': futures[future], 'Error': str(e)})
+
+    return RankTeam(rows)
+
+
+# Build the team table from per-nurse summary rows, ranked by Good %, nurses that failed are listed last
+def RankTeam(rows):
+    team_df = pd.DataFrame(rows, columns=TEAM_COLUMNS[1:])
+    team_df = team_df.sort_values(['Good %', 'Nurse'], ascending=[False, True], na_position='last', ignore_index=True)
+    team_df.insert(0, 'Rank', team_df['Good %'].rank(method='min', ascending=False).astype('Int64'))
+
+    return team_df
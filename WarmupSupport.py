@@ -0,0 +1,219 @@
+import os
+import json
+import queue
+import threading
+
+import AWSSupport as aws_support
+from InstrumentationSupport import Trace
+
+# Load and classify every nurse in the background once the server runs its first page, set WARMUP=0 to turn it off
+WARMUP = os.environ.get('WARMUP', '1') != '0'
+
+# Nurses classified at the same time
+WARMUP_MAX_WORKERS = int(os.environ.get('WARMUP_MAX_WORKERS', 2))
+
+# Nurses whose logs are downloaded together with the shared S3 client's threads, the next batch is read
+# while the workers classify the last one
+WARMUP_BATCH_SIZE = int(os.environ.get('WARMUP_BATCH_SIZE', 8))
+
+# Nurses viewed most recently, first, kept across restarts so the warm-up starts with them
+RECENT_NURSES_FILE = os.environ.get('RECENT_NURSES_FILE', os.path.join(aws_support.S3_CACHE_DIR, 'recent_nurses.json'))
+RECENT_NURSES_MAX = int(os.environ.get('RECENT_NURSES_MAX', 100))
+
+
+# Names of the nurses viewed most recently, most recent first
+def LoadRecentNurses():
+    try:
+        with open(RECENT_NURSES_FILE) as f:
+            recent_nurses = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [name for name in recent_nurses if isinstance(name, str)]
+
+
+_recent_nurses_lock = threading.Lock()
+
+
+# Move a nurse to the front of the recently viewed nurses
+def RecordNurseViewed(nurse_name):
+    with _recent_nurses_lock:
+        recent_nurses = LoadRecentNurses()
+        if recent_nurses[:1] == [nurse_name]:
+            return
+
+        recent_nurses = [nurse_name] + [name for name in recent_nurses if name != nurse_name]
+        try:
+            os.makedirs(os.path.dirname(RECENT_NURSES_FILE), exist_ok=True)
+            temp_path = f"{RECENT_NURSES_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(recent_nurses[:RECENT_NURSES_MAX], f)
+            os.replace(temp_path, RECENT_NURSES_FILE)
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            print('Failed to save the recently viewed nurses')
+
+
+# Nurse names in the order they are warmed up: the recently viewed ones first, then the rest in list order
+def WarmUpOrder(nurse_names, recent_nurses):
+    listed = set(nurse_names)
+    recent = [name for name in dict.fromkeys(recent_nurses) if name in listed]
+    seen = set(recent)
+    return recent + [name for name in nurse_names if name not in seen]
+
+
+# Days every nurse is warmed up for: from the first day of any log to the last day of any log
+# The time range of each log is kept for the date pickers of the dashboard. Returns (from_date, to_date) or None
+def WarmUpWindow(nurse_names):
+    def Load(nurse_name):
+        time_range = aws_support.GetNurseCallLogTimeRange(nurse_name)
+        if time_range is None:
+            raise ValueError('Failed to read the time range')
+        return time_range
+
+    time_ranges, _ = aws_support.RunForNurses(Load, nurse_names)
+    if not time_ranges:
+        return None
+    return min(first for first, _ in time_ranges.values()).date(), max(last for _, last in time_ranges.values()).date()
+
+
+# Load and classify what the dashboard shows for a nurse between two dates, with the patient index of every log
+# df is the nurse's calls of the window when they are already loaded (see WarmUp), otherwise they are loaded here
+# Fills the shared caches the dashboard reads: FRAME_CACHE, the rollups and the evaluation store
+# Returns True when every step succeeded
+def WarmUpNurse(nurse_name, from_date, to_date, patient_index=None, df=None):
+    # imported by the warm-up threads, so the page that starts them does not wait on the evaluation modules
+    from CallEvaluationSupport import CALL_LOG_COLUMNS, CALL_LOG_DTYPES, CallLogWindow, PrepareCallLog, SelectDates
+    from EvaluationStoreSupport import EvaluateNurseCalls
+    from RollupSupport import GetNurseRollup
+
+    with Trace('warmup.nurse', nurse=nurse_name) as span:
+        # the headline numbers, only the days missing from the rollup store are classified
+        rollup = GetNurseRollup(nurse_name, from_date, to_date, patient_index=patient_index)
+
+        # the detail table, its calls and their outcomes
+        if df is None:
+            start, end = CallLogWindow(from_date, to_date)
+            df = aws_support.GetNurseCallLogBetween(nurse_name, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog)
+        if df is None:
+            span.Set(loaded=False)
+            return False
+        EvaluateNurseCalls(nurse_name, SelectDates(df, from_date, to_date), df, patient_index)
+
+        span.Set(loaded=rollup is not None, rows=len(df))
+        return rollup is not None
+
+
+# Background warm-up of every nurse in the nurse list, started once per server process
+# The window (see WarmUpWindow) and the patient index are read once and shared by every nurse. The logs are then
+# downloaded a batch of nurses at a time in WarmUpOrder, and a few daemon threads classify them, so the server never
+# waits on them to stop. At most two batches of logs are held at a time
+class WarmUp:
+    def __init__(self, max_workers=WARMUP_MAX_WORKERS, batch_size=WARMUP_BATCH_SIZE):
+        self.max_workers = max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+        self.nurses = queue.Queue(maxsize=self.batch_size)
+        self.lock = threading.Lock()
+        self.started = False
+
+        self.window = None
+        self.patient_index = None
+        self.total = 0
+        self.done = 0
+        self.failed = []
+
+    # Start the warm-up, later calls do nothing
+    def Start(self):
+        with self.lock:
+            if self.started:
+                return False
+            self.started = True
+
+        threading.Thread(target=self._Run, name='warmup', daemon=True).start()
+        return True
+
+    def _Run(self):
+        with Trace('warmup.start') as span:
+            nurse_df = aws_support.GetNurseListFromServer()
+            if nurse_df is None or nurse_df.empty:
+                print('Failed to load the nurse list for the warm-up')
+                return
+
+            nurse_names = WarmUpOrder([str(name) for name in nurse_df['Name'].values], LoadRecentNurses())
+            span.Set(nurses=len(nurse_names))
+
+            # only the logs changed since the last sync are downloaded, the reads below are then served from disk
+            try:
+                aws_support.SyncCsvDataFromS3()
+            except Exception as e:
+                print(f"An error occurred: {str(e)}")
+                print('Failed to sync the call logs for the warm-up')
+
+            self.window = WarmUpWindow(nurse_names)
+            if self.window is None:
+                print('Failed to read the call logs for the warm-up')
+                return
+
+            from PatientIndexSupport import GetGlobalPatientIndex
+
+            self.patient_index = GetGlobalPatientIndex()
+
+        with self.lock:
+            self.total = len(nurse_names)
+
+        workers = min(self.max_workers, len(nurse_names))
+        for i in range(workers):
+            threading.Thread(target=self._Work, name=f"warmup-{i}", daemon=True).start()
+
+        from CallEvaluationSupport import CALL_LOG_COLUMNS, CALL_LOG_DTYPES, CallLogWindow, PrepareCallLog
+
+        start, end = CallLogWindow(*self.window)
+        try:
+            for first in range(0, len(nurse_names), self.batch_size):
+                batch = nurse_names[first:first + self.batch_size]
+                with Trace('warmup.load', nurses=len(batch)):
+                    call_logs, _ = aws_support.GetNurseCallLogsBetween(
+                        batch, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog,
+                    )
+                # a nurse whose log failed is loaded again on its own by the worker
+                for nurse_name in batch:
+                    self.nurses.put((nurse_name, call_logs.pop(nurse_name, None)))
+        finally:
+            for i in range(workers):
+                self.nurses.put(None)
+
+    def _Work(self):
+        while True:
+            item = self.nurses.get()
+            if item is None:
+                return
+
+            nurse_name, df = item
+            try:
+                loaded = WarmUpNurse(nurse_name, *self.window, patient_index=self.patient_index, df=df)
+            except Exception as e:
+                print(f"An error occurred: {str(e)}")
+                loaded = False
+
+            with self.lock:
+                self.done += 1
+                if not loaded:
+                    self.failed.append(nurse_name)
+
+    def Stats(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'nurses': self.total,
+                'done': self.done,
+                'failed': list(self.failed),
+            }
+
+
+WARMUP_TASK = WarmUp()
+
+
+# Start the background warm-up of this server process, called by every page when a session opens
+def StartWarmUp():
+    if not WARMUP:
+        return False
+    return WARMUP_TASK.Start()
@@ -1,69 +1,65 @@
+import os
+import time
 import streamlit as st
-import pandas as pd
-import re
-import numpy as np
-from datetime import datetime, timedelta
-from st_files_connection import FilesConnection
-import plotly.express as px
-
-# import StringIO
-from io import StringIO
 
 st.title("Medkick User Data Dashboard")
 
+# time the steps of this page run for the performance panel
+from InstrumentationSupport import ShowPerformancePanel, StartRecording, Trace
+# deep memory is only measured while the performance panel is shown
+spans = StartRecording(deep_memory=st.session_state.get('show_performance_panel', False))
 
-# import Get Nurse List
-from AWSSupport import GetNurseListFromServer, GetAllCsvDataFromS3
-
-def CleanDataInput(df):
 
-    return df
+# import Get Nurse List
+from AWSSupport import GetNurseListFromServer, GetNurseCallLogBetween, GetNurseCallLogTimeRange
+from CallEvaluationSupport import (
+    CALL_LOG_COLUMNS,
+    CALL_LOG_DTYPES,
+    CallLogWindow,
+    PrepareCallLog,
+    SelectDates,
+)
+from EvaluationStoreSupport import EvaluateNurseCalls
+from PatientIndexSupport import GetGlobalPatientIndex
+from RollupSupport import CountRollup, GetNurseRollup, SummarizeRollup
+from ResultsSupport import (
+    ExportResultsCsv,
+    GetResultsPage,
+    PageCount,
+    RESULT_PAGE_SIZES,
+    ResultColumns,
+    SelectResults,
+    SORT_COLUMNS,
+)
+from WarmupSupport import RecordNurseViewed, StartWarmUp
+
+# load and classify every nurse in the background, recently viewed ones first, a sidebar switch then reads the shared caches
+StartWarmUp()
 
         
-def get_nurse_data(nurse_name):
+# Get the first and last day of a nurse's log, for the date pickers
+@st.cache_data(ttl=300)
+def get_nurse_date_range(nurse_name):
+    time_range = GetNurseCallLogTimeRange(nurse_name)
+    if time_range is None:
+        return None
+    
+    first_time, last_time = time_range
+    return first_time.date(), last_time.date()
+
+def select_nurse(nurse_name):
     st.toast(f"Loading data for {nurse_name}...", icon="⏳") 
+    RecordNurseViewed(nurse_name)
     
-    all_csv = get_all_csv_data()
-        
-    # the nurse name is the key
-    nurse_key = f"{nurse_name}.csv"
+    get_nurse_date_range(nurse_name)
+
+def get_nurse_data(nurse_name, from_date, to_date):
+    # only the selected days are kept, plus the calls a missed call can be matched with
+    start, end = CallLogWindow(from_date, to_date)
     
-    # log them out
-    nurse_df = all_csv[nurse_key]
+    # the cleaned frame is shared by every session
+    nurse_df = GetNurseCallLogBetween(nurse_name, start, end, columns=CALL_LOG_COLUMNS, dtype=CALL_LOG_DTYPES, prepare=PrepareCallLog)
     return nurse_df
-    
-    # load data
-
-# get all data
-
-# cache the data
-# @st.cache_data
-def get_all_csv_data():
-    all_csv = GetAllCsvDataFromS3()
-    print('this is all data', all_csv)
-
-    # check if the all_csv is a valid dictionary
-    if isinstance(all_csv, dict):
-        for key, value in all_csv.items():
-            # Check if the key is a string and the value is a DataFrame
-            if isinstance(key, str) and isinstance(value, pd.DataFrame):
-                print(f"Valid data: {key}")
-            else:
-                print(f"Invalid data: {key}")
-
-    # loop over the all_csv and clean the data
-    for key, df in all_csv.items():
-        print('Processing:', key)
-        try:
-            # Since df is already a DataFrame, no need to read it again
-            cleaned_df = CleanDataInput(df)
-            all_csv[key] = cleaned_df
-        except Exception as e:
-            print(e)
-            # streamlit error
-            st.error(f"An error occurred: {str(e)}")
-
-    return all_csv
                 
 # load data
 with st.sidebar:
@@ -77,195 +73,58 @@ with st.sidebar:
         st.session_state['nurse_name'] = nurse_name
         
     for i in nurse_df['Name'].values:
-        nurse_name = st.button(label=i, key=i, use_container_width=True, on_click=get_nurse_data, args=[i])
+        nurse_name = st.button(label=i, key=i, use_container_width=True, on_click=select_nurse, args=[i])
             
         # if the nurse_name is clicked, then update the session state
         if nurse_name:
             st.session_state['nurse_name'] = i
             
 nurse_name = st.session_state['nurse_name']
-df = get_nurse_data(nurse_name=nurse_name)    
-    
-df = pd.DataFrame(df)
-
-# Read only the first 300 rows
-df = df.head(1000)
-
-# Convert 'Start Time (local)' column to datetime format
-try:
-    df['Start Time (local)'] = pd.to_datetime(df['Start Time (local)'], errors='coerce')
-except Exception as e:
-    st.error(f"Error converting 'Start Time (local)' to datetime: {e}")
-
-# Convert 'Start Time (local)' column to datetime format
-df['Start Time (local)'] = pd.to_datetime(df['Start Time (local)'])
-
-# Function to extract call components based on direction
-def extract_call_components(row):
-    if row['Direction'] == 'INBOUND':
-        from_component = re.sub(r'\D', '', row['From'])
-        to_component = re.sub(r'\D', '', row['To'])
-        
-    elif row['Direction'] == 'OUTBOUND':
-        from_component = re.sub(r'\D', '', row['To'])
-        to_component = re.sub(r'\D', '', row['From'])
-    else:
-        from_component = None
-        to_component = None
-
-    return from_component, to_component
-
-# Function to check if a nurse met the criteria for an inbound call
-def evaluate_performance(row):
-    try:
-        from_component, to_component = extract_call_components(row)
-        if row['Direction'] == 'INBOUND':
-            answer_time_str = row['Answer Time (local)']
-
-            # Check if answer time is '--:--:--', treat as no answer
-            if answer_time_str == '--:--:--':
-                duration = 0
-                from_number = re.sub(r'\D', '', row['From'])  # Extract only numeric part
-                to_number = re.sub(r'\D', '', row['To'])      # Extract only numeric part
-
-                # Check if the nurse answered the patient's call for at least 30 seconds
-                if row['Duration'] >= 30:
-                    return f'Met criteria. Did not answer. Nurse called back at {row["Start Time (local)"]} to {from_number}. Answered for {row["Duration"]} seconds.'
+date_range = get_nurse_date_range(nurse_name)
+if date_range is None:
+    st.error(f"Failed to load the data for {nurse_name}")
+    st.stop()
 
-                # Look for an outbound call initiated by the nurse to the patient
-                call_back_row_nurse = df[(df['Direction'] == 'OUTBOUND') & 
-                                   (df['To'].apply(lambda x: re.sub(r'\D', '', x)[-10:]) == from_number[-10:]) & 
-                                   (df['From'].apply(lambda x: re.sub(r'\D', '', x)) == to_number) & 
-                                   (row['Start Time (local)'] - pd.Timedelta(seconds=10) <= df['Start Time (local)']) & 
-                                   (df['Start Time (local)'] <= row['Start Time (local)'] + pd.Timedelta(hours=1)) & 
-                                   (df['Duration'] >= 1)].head(1)
-                
-                # Look for an inbound call initiated by the patient to the nurse
-                call_back_row_patient = df[(df['Direction'] == 'INBOUND') & 
-                                   (df['To'].apply(lambda x: re.sub(r'\D', '', x)[-10:]) == to_number) & 
-                                   (df['From'].apply(lambda x: re.sub(r'\D', '', x)) == from_number[-10:]) & 
-                                   (row['Start Time (local)'] - pd.Timedelta(seconds=10) <= df['Start Time (local)']) & 
-                                   (df['Start Time (local)'] <= row['Start Time (local)'] + pd.Timedelta(hours=1)) & 
-                                   (df['Duration'] >= 30)].head(1)
-                
-                # Look for call backs > 1hr and < 10hr
-                call_back_nurse_1hr_10hr = df[(df['Direction'] == 'OUTBOUND') & 
-                                              (df['From'].apply(lambda x: re.sub(r'\D', '', x)) == to_number) &
-                                              (df['To'].apply(lambda x: re.sub(r'\D', '', x)[-10:]) == from_number[-10:]) &
-                                              (row['Start Time (local)'] + pd.Timedelta(hours=1) <= df['Start Time (local)']) &
-                                              (df['Start Time (local)'] <= row['Start Time (local)'] + pd.Timedelta(hours=10))]
-
-                call_back_patient_1hr_10hr = df[(df['Direction'] == 'INBOUND') &
-                                                (df['To'].apply(lambda x: re.sub(r'\D', '', x)[-10:]) == to_number) &
-                                                (df['From'].apply(lambda x: re.sub(r'\D', '', x)) == from_number[-10:]) &
-                                                (row['Start Time (local)'] + pd.Timedelta(hours=1) <= df['Start Time (local)']) &
-                                                (df['Start Time (local)'] <= row['Start Time (local)'] + pd.Timedelta(hours=10))]
-
-
-                if not call_back_row_nurse.empty:
-                    # Ensure that the nurse called back and it's an outbound call
-                    if call_back_row_nurse['Direction'].values[0] == 'OUTBOUND':
-                        call_back_time = pd.to_datetime(call_back_row_nurse['Start Time (local)'].values[0]).tz_localize(None)
-                        duration_call_back = call_back_row_nurse['Duration'].values[0]
-                        return f'Met criteria. Did not answer. Nurse called back in 1hr. '
-                    else:
-                        return f'Did not answer. Nurse did not call back in 1hr.'
-                elif not call_back_row_patient.empty:
-                    # Ensure that the patient called back and it's an inbound call
-                    if call_back_row_patient['Direction'].values[0] == 'INBOUND':
-                        call_back_time = pd.to_datetime(call_back_row_patient['Start Time (local)'].values[0]).tz_localize(None)
-                        duration_call_back = call_back_row_patient['Duration'].values[0]
-                        return f'Met criteria. Did not answer. Patient called back in 1hr.'
-                    else:
-                        return f'Did not answer. Nurse did not call back in 1hr.'
-                elif not call_back_nurse_1hr_10hr.empty:
-                    # Ensure that the nurse called back and it's an outbound call
-                    if call_back_nurse_1hr_10hr['Direction'].values[0] == 'OUTBOUND':
-                        call_back_time = pd.to_datetime(call_back_nurse_1hr_10hr['Start Time (local)'].values[0]).tz_localize(None)
-                        duration_call_back = call_back_nurse_1hr_10hr['Duration'].values[0]
-                        return f'Did not Met criteria. Did not answer. Nurse called back in 10hr>&>1hr. '
-                    else:
-                        return f'Did not answer. Nurse did not call back in <10hr.'
-                elif not call_back_patient_1hr_10hr.empty:
-                    # Ensure that the patient called back and it's an inbound call
-                    if call_back_patient_1hr_10hr['Direction'].values[0] == 'INBOUND':
-                        call_back_time = pd.to_datetime(call_back_patient_1hr_10hr['Start Time (local)'].values[0]).tz_localize(None)
-                        duration_call_back = call_back_patient_1hr_10hr['Duration'].values[0]
-                        return f'Did not Met criteria. Did not answer. Patient called back in 10hr>&>1hr.'
-                    else:
-                        return f'Did not answer. Nurse did not call back in <10hr.'
-                else:
-                    return f'Did not answer. Nurse did not call back in 10hr.'
-            
-            answer_time = pd.to_datetime(answer_time_str).tz_localize(None)
-            end_time = pd.to_datetime(row['End Time (local)']).tz_localize(None)
-            duration = row['Duration']
-
-            # Check if the call was answered for at least 30 seconds
-            if duration >= 30:
-                return f'Met criteria. Answered for {duration} seconds.'
-
-            else:
-                return f"Did not meet criteria. Received call at {answer_time} from {row['From']}."
-
-        elif row['Direction'] == 'OUTBOUND':
-            # You can add additional conditions for outbound calls if needed
-            return 'Outbound call'
-
-        else:
-            return 'Not an inbound or outbound call'
-
-    except Exception as e:
-        return f"Error: {e}"
+first_date, last_date = date_range
 
 # Streamlit App
 st.title('Nurse Phone Call Performance')
 
-# Convert 'Start Time (local)' column to datetime format
-df['Start Time (local)'] = pd.to_datetime(df['Start Time (local)'])
-
 # Sidebar for selecting performance criteria and date range
 performance_criteria = st.sidebar.selectbox('Select Performance Criteria', ['All', 'Answered', 'Missed','No Follow-up','Follow-up >1hr and <10hr','Follow-up <1hr'])
 
 # Allow selection of date range
-selected_from_date = st.sidebar.date_input('Select From Date', min_value=df['Start Time (local)'].min().date(), max_value=df['Start Time (local)'].max().date(), value=df['Start Time (local)'].min().date())
-selected_to_date = st.sidebar.date_input('Select To Date', min_value=df['Start Time (local)'].min().date(), max_value=df['Start Time (local)'].max().date(), value=df['Start Time (local)'].max().date())
+selected_from_date = st.sidebar.date_input('Select From Date', min_value=first_date, max_value=last_date, value=first_date)
+selected_to_date = st.sidebar.date_input('Select To Date', min_value=first_date, max_value=last_date, value=last_date)
 
 # Check if at least one date is selected
 if not selected_from_date or not selected_to_date:
     st.warning("Please select both 'From' and 'To' dates.")
 else:
-    # Filter DataFrame based on selected date range
-    filtered_df = df[(df['Start Time (local)'].dt.date >= selected_from_date) & (df['Start Time (local)'].dt.date <= selected_to_date)]
-
-    # Apply the function to the filtered DataFrame
-    filtered_df['Performance'] = filtered_df.apply(evaluate_performance, axis=1)
+    # The headline numbers and the chart are sums over the daily rollups of the selected days
+    rollup = GetNurseRollup(nurse_name, selected_from_date, selected_to_date)
+    if rollup is None:
+        st.error(f"Failed to load the data for {nurse_name}")
+        st.stop()
 
     # Count the number of calls that meet and do not meet the criteria
-    met_criteria_count = len(filtered_df[filtered_df['Performance'].str.startswith('Met')])
-    Answer_Call_count = len(filtered_df[filtered_df['Performance'].str.startswith('Met criteria. Answered')])
-    Missed_Call_count = len(filtered_df[filtered_df['Performance'].str.startswith(('Met criteria. Did not answer.', 'Did not'))])
-    Nurse_Call_Back_count = len(filtered_df[filtered_df['Performance'].str.startswith('Met criteria. Did not answer. Nurse called back')])
-    Patient_Call_Back_count = len(filtered_df[filtered_df['Performance'].str.startswith('Met criteria. Did not answer. Patient called back')])
-    did_not_meet_criteria_count = len(filtered_df[filtered_df['Performance'].str.startswith('Did not')])
+    outcome_counts = CountRollup(rollup)
+    met_criteria_count = outcome_counts['met_criteria']
+    Answer_Call_count = outcome_counts['answered']
+    Missed_Call_count = outcome_counts['missed']
+    Nurse_Call_Back_count = outcome_counts['nurse_call_back_1hr']
+    Patient_Call_Back_count = outcome_counts['patient_call_back_1hr']
+    did_not_meet_criteria_count = outcome_counts['did_not_meet_criteria']
     # Count the call-backs > 1hr and < 10hr
-    call_back_nurse_1hr_10hr_count = len(filtered_df[filtered_df['Performance'].str.startswith('Did not Met criteria. Did not answer. Nurse called back')])
-    call_back_patient_1hr_10hr_count = len(filtered_df[filtered_df['Performance'].str.startswith('Did not Met criteria. Did not answer. Patient called back')])
+    call_back_nurse_1hr_10hr_count = outcome_counts['nurse_call_back_10hr']
+    call_back_patient_1hr_10hr_count = outcome_counts['patient_call_back_10hr']
 
-    # Count the number of inbound and outbound calls
-    inbound_call_count = len(filtered_df[filtered_df['Direction'] == 'INBOUND'])
-    outbound_call_count = len(filtered_df[filtered_df['Direction'] == 'OUTBOUND'])
-
-    # Calculate the percentage of Good and Bad criteria
-    total_criteria_count = met_criteria_count + did_not_meet_criteria_count
-
-    # Avoid division by zero error
-    if total_criteria_count > 0:
-        good_percentage = (met_criteria_count / total_criteria_count) * 100
-        bad_percentage = (did_not_meet_criteria_count / total_criteria_count) * 100
-    else:
-        good_percentage = 0
-        bad_percentage = 0
+    # Headline numbers, the same ones the team dashboard and the batch reports use
+    summary = SummarizeRollup(rollup)
+    inbound_call_count = summary['Inbound Calls']
+    outbound_call_count = summary['Outbound Calls']
+    good_percentage = summary['Good %']
+    bad_percentage = summary['Bad %']
 
     # Display the percentages
     st.markdown(f"<p style='color:green;font-size:24px;'>Good: <strong>{good_percentage:.2f}%</strong></p>", unsafe_allow_html=True)
@@ -286,46 +145,80 @@ else:
     # Display a bar chart
     st.subheader('Number of Calls Meeting Criteria')
 
-    # Create a Plotly Express bar chart
-    fig = px.bar(
-        x=['Answered', 'Missed','Called Back in 1hr by Nurse','Called Back in 1hr by Patient','Did not call back in 1hr'],
-        y=[Answer_Call_count, Missed_Call_count, Nurse_Call_Back_count, Patient_Call_Back_count, did_not_meet_criteria_count],
-        text=[Answer_Call_count, Missed_Call_count, Nurse_Call_Back_count, Patient_Call_Back_count, did_not_meet_criteria_count],  # Display count values on top of the bars
-        labels={'y': 'Count', 'x': 'Criteria'},
-        color=['Answered', 'Missed','Called Back in 1hr by Nurse','Called Back in 1hr by Patient','Did not call back in 1hr'],
-        color_discrete_map={'Answered': '#5cb7a2', 'Missed': '#74e5cb', 'Called Back in 1hr by Nurse': 'yellow', 'Called Back in 1hr by Patient': 'orange', 'Did not call back in 1hr': 'red'}
-    )
+    # Create a Plotly Express bar chart, plotly is only loaded once a nurse's chart is drawn
+    with Trace('render.chart'):
+        import plotly.express as px
+
+        fig = px.bar(
+            x=['Answered', 'Missed','Called Back in 1hr by Nurse','Called Back in 1hr by Patient','Did not call back in 1hr'],
+            y=[Answer_Call_count, Missed_Call_count, Nurse_Call_Back_count, Patient_Call_Back_count, did_not_meet_criteria_count],
+            text=[Answer_Call_count, Missed_Call_count, Nurse_Call_Back_count, Patient_Call_Back_count, did_not_meet_criteria_count],  # Display count values on top of the bars
+            labels={'y': 'Count', 'x': 'Criteria'},
+            color=['Answered', 'Missed','Called Back in 1hr by Nurse','Called Back in 1hr by Patient','Did not call back in 1hr'],
+            color_discrete_map={'Answered': '#5cb7a2', 'Missed': '#74e5cb', 'Called Back in 1hr by Nurse': 'yellow', 'Called Back in 1hr by Patient': 'orange', 'Did not call back in 1hr': 'red'}
+        )
 
-    # Update layout to display text on top of the bars
-    fig.update_traces(textposition='outside')
+        # Update layout to display text on top of the bars
+        fig.update_traces(textposition='outside')
 
-    # Display the Plotly Express chart using Streamlit
-    st.plotly_chart(fig)
+        # Display the Plotly Express chart using Streamlit
+        st.plotly_chart(fig)
 
     # Display the evaluated performance based on selected criteria and dates
     st.subheader('Performance Evaluation Results')
-    if performance_criteria == 'All':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[display_columns])
-    elif performance_criteria == 'Answered':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[filtered_df['Performance'].str.startswith('Met criteria. Answered')][display_columns])
-    elif performance_criteria == 'Missed':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[filtered_df['Performance'].str.startswith('Met criteria. Did not answer.') | filtered_df['Performance'].str.startswith('Did not')])
-    elif performance_criteria == 'No Follow-up':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[filtered_df['Performance'].str.startswith('Did not')][display_columns])
-    elif performance_criteria == 'Follow-up >1hr and <10hr':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[filtered_df['Performance'].str.startswith('Did not Met criteria. Did not answer. Nurse called back') | filtered_df['Performance'].str.startswith('Did not Met criteria. Did not answer. Patient called back')])
-    elif performance_criteria == 'Follow-up <1hr':
-        # Display only specific columns
-        display_columns = ['From', 'To', 'Start Time (local)', 'Duration', 'Direction', 'Performance']
-        st.write(filtered_df[filtered_df['Performance'].str.startswith('Met criteria')][display_columns])
-    
+
+    # only the detail table needs the calls themselves
+    df = get_nurse_data(nurse_name, selected_from_date, selected_to_date)
+    if df is None:
+        st.error(f"Failed to load the data for {nurse_name}")
+        st.stop()
+
+    # Filter DataFrame based on selected date range
+    filtered_df = SelectDates(df, selected_from_date, selected_to_date)
+
+    # Classify the filtered calls, looking for call backs in everything loaded and in every other nurse's calls with the patient
+    # settled calls keep the outcome stored by an earlier run, only the recent ones are classified again
+    patient_index = GetGlobalPatientIndex()
+    evaluation = EvaluateNurseCalls(nurse_name, filtered_df, df, patient_index)
+
+    # Sort, filter and slice on the server, only the rows of the current page are sent to the browser
+    columns = ResultColumns(performance_criteria)
+    search_col, sort_col, order_col = st.columns([2, 2, 1])
+    search = search_col.text_input('Search phone number', key='results_search')
+    sort_column = sort_col.selectbox('Sort by', SORT_COLUMNS, key='results_sort')
+    ascending = order_col.radio('Order', ['Ascending', 'Descending'], key='results_order') == 'Ascending'
+
+    positions = SelectResults(filtered_df, evaluation, performance_criteria, search=search, sort_column=sort_column, ascending=ascending)
+
+    size_col, page_col, count_col = st.columns([1, 1, 2])
+    page_size = size_col.selectbox('Rows per page', RESULT_PAGE_SIZES, index=1, key='results_page_size')
+    page_count = PageCount(positions, page_size)
+    page = page_col.number_input('Page', min_value=1, max_value=page_count, value=1, step=1, key='results_page')
+    page = min(page, page_count)
+    first_row = (page - 1) * page_size
+    count_col.write(f"Showing {min(first_row + 1, len(positions))}-{min(first_row + page_size, len(positions))} of {len(positions)} calls, page {page} of {page_count}")
+
+    page_df = GetResultsPage(filtered_df, evaluation, positions, page, page_size, columns=columns)
+    st.dataframe(page_df, hide_index=True, use_container_width=True)
+
+    # the export is only built when asked for, not on every rerun
+    # it is streamed to a file with the other exports, the session only keeps its path
+    export_key = (nurse_name, selected_from_date, selected_to_date, performance_criteria, search, sort_column, ascending)
+    export_file_name = f"{nurse_name}_{selected_from_date}_{selected_to_date}.csv"
+    if st.button('Prepare download of all results'):
+        from ExportSupport import EXPORT_DIR, RemoveOldExports
+
+        RemoveOldExports()
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        export_path = os.path.join(EXPORT_DIR, f"{time.time_ns()}-{export_file_name}")
+        ExportResultsCsv(export_path, filtered_df, evaluation, positions, columns=columns)
+        st.session_state['results_export'] = (export_key, export_path)
+    export = st.session_state.get('results_export')
+    if export is not None and export[0] == export_key:
+        if os.path.exists(export[1]):
+            with open(export[1], 'rb') as f:
+                st.download_button('Download all results (CSV)', data=f, file_name=export_file_name, mime='text/csv')
+        else:
+            st.warning("The download has expired, please prepare it again")
+
+ShowPerformancePanel(spans)
@@ -1,6 +1,5 @@
 
 import streamlit as st
-import pandas as pd
 
 # support files
 import AWSSupport as aws_support
@@ -24,12 +23,18 @@ with st.expander("☄️Instructions to remove nurses"):
 fetch_data = st.button("Fetch Data Again", key='fetch data')
 
 if fetch_data:
-    # rerun     
+    # read the list from the server again and rerun
+    st.session_state.pop('shown_nurse_list', None)
+    aws_support.NURSE_ROSTER.Invalidate()
     st.rerun()
 
 # get the list of nurses from the data_dict
-nurse_list_df = GetNurseList()
+# the list shown is kept until it is fetched again, the edits are applied to it and only they are sent to the server
+if st.session_state.get('shown_nurse_list') is None:
+    st.session_state['shown_nurse_list'] = GetNurseList()
+nurse_list_df = st.session_state['shown_nurse_list']
 if nurse_list_df is None:
+    st.session_state.pop('shown_nurse_list', None)
     st.error('Failed to get the list of nurses from the server')
     st.stop()
     
@@ -43,9 +48,10 @@ if submit_data:
     # if the len is the same
     if len(updated_nurses_df) != len(nurse_list_df):
         
-        status = aws_support.RemoveNurseFromServer(updated_nurses_df)
+        status = aws_support.RemoveNurseFromServer(updated_nurses_df, nurse_list_df)
         if status == 'Success':
             st.success('Data submitted successfully')
+            st.session_state.pop('shown_nurse_list', None)
         else: 
             st.error('Data failed to submit')
         
@@ -0,0 +1,79 @@
+import streamlit as st
+from datetime import datetime, timedelta
+
+# support files
+import AWSSupport as aws_support
+from WarmupSupport import StartWarmUp
+
+st.title("Medkick Team Dashboard")
+
+# time the steps of this page run for the performance panel
+from InstrumentationSupport import ShowPerformancePanel, StartRecording, Trace
+# deep memory is only measured while the performance panel is shown
+spans = StartRecording(deep_memory=st.session_state.get('show_performance_panel', False))
+
+# load and classify every nurse in the background, a session may open on this page first
+StartWarmUp()
+
+
+# Evaluate every nurse between two dates, the table is shared by every session for 5 minutes
+@st.cache_data(ttl=300, show_spinner=False)
+def get_team_data(nurse_names, from_date, to_date):
+    # the evaluation modules are only loaded once the team is evaluated
+    from TeamEvaluationSupport import EvaluateTeam
+
+    return EvaluateTeam(list(nurse_names), from_date, to_date)
+
+
+# load the nurse list
+nurse_df = aws_support.GetNurseListFromServer()
+if nurse_df is None or nurse_df.empty:
+    st.error("Failed to load the nurse list")
+    st.stop()
+
+nurse_names = tuple(nurse_df['Name'].values)
+st.write('There are currently ', len(nurse_names), ' nurses in the database')
+
+# Allow selection of date range
+today = datetime.now().date()
+selected_from_date = st.sidebar.date_input('Select From Date', value=today - timedelta(days=7))
+selected_to_date = st.sidebar.date_input('Select To Date', value=today)
+
+if not selected_from_date or not selected_to_date:
+    st.warning("Please select both 'From' and 'To' dates.")
+    st.stop()
+
+if selected_from_date > selected_to_date:
+    st.warning("'From' date must be before 'To' date.")
+    st.stop()
+
+if st.sidebar.button('Evaluate Team', use_container_width=True):
+    st.session_state['team_dates'] = (selected_from_date, selected_to_date)
+
+if 'team_dates' not in st.session_state:
+    st.info("Select a date range and press 'Evaluate Team'.")
+    st.stop()
+
+from_date, to_date = st.session_state['team_dates']
+with st.spinner(f"Evaluating {len(nurse_names)} nurses..."), Trace('team.evaluate', nurses=len(nurse_names)):
+    # the nurses are evaluated on threads, their spans are recorded under this one
+    team_df = get_team_data(nurse_names, from_date, to_date)
+
+st.subheader(f'Nurse Ranking {from_date} to {to_date}')
+
+failed_df = team_df[team_df['Error'].notna()]
+for _, row in failed_df.iterrows():
+    st.error(f"{row['Nurse']}: {row['Error']}")
+
+ranked_df = team_df[team_df['Error'].isna()].drop(columns=['Error'])
+st.dataframe(
+    ranked_df,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        'Good %': st.column_config.ProgressColumn('Good %', format='%.2f%%', min_value=0, max_value=100),
+        'Bad %': st.column_config.NumberColumn('Bad %', format='%.2f%%'),
+    },
+)
+
+ShowPerformancePanel(spans)
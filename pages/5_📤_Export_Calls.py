@@ -0,0 +1,66 @@
+import os
+import streamlit as st
+from datetime import datetime, timedelta
+
+# support files
+import AWSSupport as aws_support
+from ExportSupport import EXPORT_FORMATS, StartExport
+from WarmupSupport import StartWarmUp
+
+st.title("Export Evaluated Calls")
+
+# time the steps of this page run for the performance panel
+from InstrumentationSupport import ShowPerformancePanel, StartRecording
+# deep memory is only measured while the performance panel is shown
+spans = StartRecording(deep_memory=st.session_state.get('show_performance_panel', False))
+
+# load and classify every nurse in the background, a session may open on this page first
+StartWarmUp()
+
+ALL_NURSES = 'All nurses'
+
+# load the nurse list
+nurse_df = aws_support.GetNurseListFromServer()
+if nurse_df is None or nurse_df.empty:
+    st.error("Failed to load the nurse list")
+    st.stop()
+
+nurse_names = list(nurse_df['Name'].values)
+
+selected_nurse = st.selectbox('Nurses', [ALL_NURSES] + nurse_names)
+
+# Allow selection of date range
+today = datetime.now().date()
+from_col, to_col, format_col = st.columns(3)
+selected_from_date = from_col.date_input('From Date', value=today - timedelta(days=30))
+selected_to_date = to_col.date_input('To Date', value=today)
+export_format = format_col.selectbox('Format', list(EXPORT_FORMATS))
+
+if selected_from_date > selected_to_date:
+    st.warning("'From' date must be before 'To' date.")
+    st.stop()
+
+# the export runs in the background and is written to disk a few days of calls at a time
+if st.button('Start export'):
+    export_nurses = nurse_names if selected_nurse == ALL_NURSES else [selected_nurse]
+    st.session_state['export_job'] = StartExport(export_nurses, selected_from_date, selected_to_date, export_format)
+
+job = st.session_state.get('export_job')
+if job is not None:
+    status = job.Status()
+    if not status['done']:
+        parts = f"{status['parts_done']} of {status['parts']} steps" if status['parts'] else 'starting'
+        st.info(f"Exporting {job.file_name}: {status['rows']} calls written ({parts})")
+        st.button('Refresh')
+    elif status['error'] is not None:
+        st.error(f"The export failed: {status['error']}")
+    elif not os.path.exists(job.path):
+        st.warning("The export has expired, please start it again")
+    else:
+        for nurse_name, error in status['errors'].items():
+            st.error(f"{nurse_name}: {error}")
+        st.success(f"{status['rows']} calls exported")
+        with open(job.path, 'rb') as f:
+            st.download_button(f"Download {job.file_name}", data=f, file_name=job.file_name, mime=job.mime)
+
+ShowPerformancePanel(spans)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules read their settings when they are imported, keep the local copies and the perf log out of the way
+os.environ.setdefault('S3_CACHE_DIR', tempfile.mkdtemp(prefix='medkick-tests-'))
+os.environ.setdefault('PERF_LOG', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
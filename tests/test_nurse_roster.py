@@ -0,0 +1,79 @@
+import io
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+import AWSSupport as aws_support
+from AWSSupport import NurseRoster
+
+
+# S3 stand-in for one bucket that enforces the conditions of a write like S3 does
+# other_writes are applied just before the next put_object of the roster checks its condition, one per put
+class _ConditionalS3:
+    def __init__(self, objects=None, other_writes=()):
+        self.objects = {}
+        self.versions = 0
+        self.other_writes = list(other_writes)
+        self.puts = []
+        for key, body in (objects or {}).items():
+            self._Write(key, body)
+
+    def _Write(self, key, body):
+        self.versions += 1
+        etag = f'"{self.versions}"'
+        self.objects[key] = (body.encode() if isinstance(body, str) else body, etag)
+        return etag
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        return {'Body': io.BytesIO(body), 'ETag': etag, 'ContentLength': len(body)}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        if self.other_writes:
+            self._Write(Key, self.other_writes.pop(0))
+        self.puts.append({'IfMatch': IfMatch, 'IfNoneMatch': IfNoneMatch})
+        current = self.objects.get(Key)
+        if (IfMatch is not None and (current is None or current[1] != IfMatch)) or (IfNoneMatch == '*' and current is not None):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        return {'ETag': self._Write(Key, Body)}
+
+
+def _Roster(monkeypatch, s3):
+    monkeypatch.setattr(aws_support, 'GetS3Client', lambda: s3)
+    monkeypatch.setattr(aws_support.time, 'sleep', lambda seconds: None)
+    return NurseRoster(file_name='NursesList.csv', ttl_seconds=3600)
+
+
+def _Names(s3):
+    return sorted(pd.read_csv(io.BytesIO(s3.objects['NursesList.csv'][0]))['Name'])
+
+
+def test_change_retries_on_a_stale_version_and_keeps_both_changes(monkeypatch):
+    s3 = _ConditionalS3(
+        objects={'NursesList.csv': 'Name,Link\nAlice,a\n'},
+        other_writes=['Name,Link\nAlice,a\nBob,b\n'],
+    )
+    roster = _Roster(monkeypatch, s3)
+    roster.Read()
+
+    changed_df = roster.Change(added_df=pd.DataFrame({'Name': ['Carol'], 'Link': ['c']}))
+
+    assert len(s3.puts) == 2
+    assert s3.puts[0]['IfMatch'] != s3.puts[1]['IfMatch']
+    assert sorted(changed_df['Name']) == ['Alice', 'Bob', 'Carol']
+    assert _Names(s3) == ['Alice', 'Bob', 'Carol']
+    assert sorted(roster.Read()['Name']) == ['Alice', 'Bob', 'Carol']
+
+
+def test_change_retries_when_another_writer_creates_the_list(monkeypatch):
+    s3 = _ConditionalS3(other_writes=['Name,Link\nBob,b\n'])
+    roster = _Roster(monkeypatch, s3)
+
+    roster.Change(added_df=pd.DataFrame({'Name': ['Carol'], 'Link': ['c']}))
+
+    assert s3.puts[0]['IfNoneMatch'] == '*'
+    assert _Names(s3) == ['Bob', 'Carol']
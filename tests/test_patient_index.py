@@ -0,0 +1,64 @@
+import pandas as pd
+
+from CallEvaluationSupport import PrepareCallLog, START_TIME_COLUMN
+from EvaluationStoreSupport import EvaluationStore
+from InstrumentationSupport import StartRecording
+from PatientIndexSupport import BuildGlobalPatientIndex
+from SyntheticDataSupport import GenerateCallLog
+
+WRITTEN = pd.Timestamp('2024-03-01 06:00', tz='UTC')
+
+
+def _CallLogs():
+    return {
+        'Active A': PrepareCallLog(GenerateCallLog(2000, seed=1, start='2024-02-20')),
+        'Active B': PrepareCallLog(GenerateCallLog(2000, seed=2, start='2024-02-20')),
+        # left the team, its log is never written again
+        'Idle': PrepareCallLog(GenerateCallLog(200, seed=3, start='2023-12-31')),
+    }
+
+
+def _Written(idle_written):
+    return {'Active A': WRITTEN, 'Active B': WRITTEN, 'Idle': idle_written}
+
+
+def _ActiveLastCall(call_logs):
+    return min(call_logs[nurse_name][START_TIME_COLUMN].max() for nurse_name in ('Active A', 'Active B'))
+
+
+def test_idle_log_does_not_hold_back_settling():
+    call_logs = _CallLogs()
+    patient_index = BuildGlobalPatientIndex(call_logs, _Written(pd.Timestamp('2024-01-02', tz='UTC')))
+
+    assert patient_index.complete_until >= _ActiveLastCall(call_logs)
+
+
+def test_log_written_without_new_calls_does_not_hold_back_settling():
+    # an idle nurse whose log is still exported with every other log
+    call_logs = _CallLogs()
+    patient_index = BuildGlobalPatientIndex(call_logs, _Written(WRITTEN))
+
+    assert patient_index.complete_until >= _ActiveLastCall(call_logs)
+
+
+def test_every_log_holds_back_settling_without_write_times():
+    call_logs = _CallLogs()
+    patient_index = BuildGlobalPatientIndex(call_logs)
+
+    assert patient_index.complete_until == call_logs['Idle'][START_TIME_COLUMN].max()
+
+
+def test_evaluation_store_reuses_outcomes_with_an_idle_log(tmp_path):
+    call_logs = _CallLogs()
+    patient_index = BuildGlobalPatientIndex(call_logs, _Written(pd.Timestamp('2024-01-02', tz='UTC')))
+    store = EvaluationStore(str(tmp_path))
+    calls_df = call_logs['Active A']
+
+    spans = StartRecording()
+    first = store.Evaluate('Active A', calls_df, calls_df, patient_index)
+    second = store.Evaluate('Active A', calls_df, calls_df, patient_index)
+
+    runs = [span.fields for span in spans if span.name == 'classify.incremental']
+    assert runs[0]['reused'] == 0
+    assert runs[1]['reused'] > 0.9 * len(calls_df)
+    pd.testing.assert_frame_equal(first, second)